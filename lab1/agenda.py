@@ -0,0 +1,223 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Conflict resolution for the production system.  You don't need this file
+# for Lab 1; forward_chain() uses it when apply_only_one=True.
+#
+# With apply_only_one=True, each cycle makes just one change to the data:
+# the first rule that can change anything fires for its first bindings that
+# can, and then the rules are tried again from the top.  Rather than
+# re-matching every rule after every change, an Agenda keeps the "conflict
+# set" of rule instantiations that would still change something, ordered by
+# a conflict-resolution strategy, and updates it from a Rete network as the
+# data changes.  A cycle then costs time in proportion to the change it
+# makes.
+#
+# The strategies are functions of (agenda, rule_index, branch, token) that
+# return a sort key; the instantiation with the smallest key fires first:
+#
+# * rule_order (the default): the first rule in the list, and the first of
+#   its bindings in the order that IF.apply finds them.  This is exactly
+#   what forward_chain() does.
+# * recency: the instantiation that matches the most recently added
+#   assertion, then rule order.
+# * specificity: the rule with the most conditions, then rule order.
+
+import heapq
+from production import RuleExpression, Matcher, chain, populate
+from rete import ReteNetwork, nots_may_be_patterns
+from utils import JournaledSet
+
+def rule_order(agenda, rule_index, branch, token):
+    return (rule_index, branch, token.assertions())
+
+def recency(agenda, rule_index, branch, token):
+    assertions = token.assertions()
+    newest = max([agenda.timestamp(a) for a in assertions] or [0])
+    return (-newest, rule_index, branch, assertions)
+
+def specificity(agenda, rule_index, branch, token):
+    return (-agenda.condition_count(rule_index), rule_index, branch,
+            token.assertions())
+
+STRATEGIES = {'order': rule_order,
+              'recency': recency,
+              'specificity': specificity}
+
+def count_conditions(condition):
+    "Return the number of strings (negated or not) in an antecedent."
+    if isinstance(condition, basestring):
+        return 1
+    return sum([count_conditions(c) for c in condition])
+
+class Agenda(object):
+    """
+    The instantiations of a list of rules that would change some data if
+    they fired, ordered by a strategy.  An instantiation is a token at
+    the end of a chain in the agenda's Rete network.
+    """
+    def __init__(self, rules, memory, strategy=rule_order):
+        self.rules = list(rules)
+        self.memory = memory
+        self.strategy = STRATEGIES.get(strategy, strategy)
+        self._rule_index = {}
+        self._conditions = []
+        self._heap = []
+        self._count = 0 # For breaking ties in the heap, and for timestamps
+        self._timestamps = {}
+        self._effects = {} # token -> (assertions it adds, ones it deletes)
+        self._queued = set() # Tokens in the heap
+        self._by_assertion = {} # assertion -> tokens that add or delete it
+
+        for i, rule in enumerate(self.rules):
+            self._rule_index.setdefault(rule, i)
+            self._conditions.append(count_conditions(rule.antecedent()))
+        for assertion in memory:
+            self._timestamps[assertion] = 0
+
+        self.network = ReteNetwork((), self)
+        for rule in self.rules:
+            self.network.add_rule(rule)
+        for assertion in memory:
+            self.network.add(assertion)
+
+    def timestamp(self, assertion):
+        return self._timestamps.get(assertion, 0)
+
+    def condition_count(self, rule_index):
+        return self._conditions[rule_index]
+
+    #### Keeping the conflict set up to date
+
+    def token_added(self, rule, token):
+        adds = [populate(a, token.bindings) for a in rule.consequent()]
+        deletes = []
+        for d in rule.delete_clause():
+            try:
+                deletes.append(populate(d, token.bindings))
+            except KeyError:
+                pass # Like IF.fire, ignore a DELETE it can't fill in
+        self._effects[token] = (adds, deletes)
+        for assertion in adds + deletes:
+            self._by_assertion.setdefault(assertion, set()).add(token)
+        self._consider(token)
+
+    def token_removed(self, rule, token):
+        adds, deletes = self._effects.pop(token)
+        for assertion in adds + deletes:
+            tokens = self._by_assertion.get(assertion)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._by_assertion[assertion]
+        # Its heap entry is dropped when it comes to the top.
+
+    def _would_change(self, token):
+        adds, deletes = self._effects[token]
+        for a in adds:
+            if a not in self.memory:
+                return True
+        for d in deletes:
+            if d in self.memory:
+                return True
+        return False
+
+    def _consider(self, token):
+        if token not in self._queued and self._would_change(token):
+            rule = token.node.production
+            branch = self.network.productions[rule].index(token.node)
+            key = self.strategy(self, self._rule_index[rule], branch, token)
+            self._count += 1
+            heapq.heappush(self._heap, (key, self._count, token))
+            self._queued.add(token)
+
+    def update(self, added, removed):
+        "Tell the agenda which assertions were just added and removed."
+        for assertion in removed:
+            self.network.remove(assertion)
+        for assertion in added:
+            self._count += 1
+            self._timestamps[assertion] = self._count
+            self.network.add(assertion)
+        for assertion in added + removed:
+            for token in list(self._by_assertion.get(assertion, ())):
+                self._consider(token)
+
+    #### Firing
+
+    def pop(self, skip_rule=None):
+        """
+        Remove and return the first instantiation that would still change
+        something, or None if there isn't one.  Instantiations of the rule
+        at index 'skip_rule' are passed over, but stay on the agenda.
+        """
+        skipped = []
+        result = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            token = entry[2]
+            if token not in self._effects or not self._would_change(token):
+                self._queued.discard(token)
+            elif self._rule_index[token.node.production] == skip_rule:
+                skipped.append(entry)
+            else:
+                self._queued.discard(token)
+                result = token
+                break
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return result
+
+    def run(self, verbose=False, skip_first_rule=False):
+        """
+        Fire instantiations one change at a time until none would change
+        anything.  If 'skip_first_rule' is True, the first rule is passed
+        over in the first cycle.
+        """
+        skip_rule = None
+        if skip_first_rule: skip_rule = 0
+        while True:
+            token = self.pop(skip_rule)
+            if token is None:
+                return
+            skip_rule = None
+            rule = token.node.production
+            rule.fire([token.bindings], self.memory, None, True, verbose)
+            added, removed = self.memory.changes()
+            self.update(added, removed)
+            if token in self._effects: # The change may have undone it
+                self._consider(token)
+
+
+def forward_chain_agenda(rules, data, verbose=False, strategy='order'):
+    """
+    forward_chain(rules, data, apply_only_one=True), one change at a time
+    from an Agenda.  With the default 'order' strategy the result is the
+    same as forward_chain()'s; the others resolve conflicts differently.
+    """
+    if not rules or not data:
+        return data # forward_chain() doesn't run the rules at all
+
+    network = ReteNetwork(rules)
+    if (nots_may_be_patterns(rules, data) or
+        [rule for rule in rules if not network.handles(rule)]):
+        if STRATEGIES.get(strategy, strategy) != rule_order:
+            raise ValueError, ("The %s strategy needs rules that can be "
+                               "compiled into a Rete network" % strategy)
+        return chain(rules, data, Matcher, True, verbose)
+
+    memory = JournaledSet(data)
+    skip_first_rule = False
+    if STRATEGIES.get(strategy, strategy) == rule_order:
+        # The very first rule sees the data in the order it was given, and
+        # counts any duplicates in it, just like IF.apply would.  If that
+        # makes it stop without changing anything, forward_chain() goes on
+        # to the second rule.
+        bindings = RuleExpression().test_term_matches(rules[0].antecedent(),
+                                                      list(data))
+        rules[0].fire(bindings, memory, len(data), True, verbose)
+        added, removed = memory.changes()
+        skip_first_rule = not (added or removed)
+
+    agenda = Agenda(rules, memory, strategy)
+    agenda.run(verbose, skip_first_rule)
+    return tuple(sorted(memory))
@@ -0,0 +1,437 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Backward chaining with a table of goals.  You don't need this file for
+# Lab 1.
+#
+# Expanding a hypothesis into a goal tree the straightforward way expands
+# a sub-hypothesis again for every rule that mentions it, which takes
+# exponential time on some rule sets, and never finishes on recursive
+# ones.  A GoalTable expands each distinct goal once, and shares the
+# result: identical subtrees are the same object, so the goal tree is
+# really a DAG, with one node per distinct goal or AND of goals.
+#
+# A goal that turns up again while it is still being expanded is left as
+# a leaf, to be tested directly against the data, instead of being
+# expanded forever.  Variables of a rule's antecedent that its THEN clause
+# doesn't bind stay variables in the goals, which are tabled as they are,
+# variables and all; so with a rule such as
+#
+#   IF( AND('(?x) beats (?y)', '(?y) beats (?z)'), THEN('(?x) beats (?z)') )
+#
+# 'a beats c' leads to the goals 'a beats (?y)' and '(?y) beats c', and
+# those soon lead back to goals that are being expanded.
+#
+# Every node is already simplified, so simplify() leaves the tree as it
+# is (except for cutting the cycles, it is simplify() of the tree that
+# backchain_to_goal_tree builds by recursion).
+#
+# A GoalEvaluator then answers a goal tree against some data, without
+# running the rules forward: it looks up the leaves, and yields each set of
+# bindings that satisfies the tree as soon as it finds it.
+#
+# >>> tree = tabled_backchain(zookeeper_rules, 'opus is a penguin')
+# >>> for bindings in GoalEvaluator(data).bindings(tree): print bindings
+
+from production import AND, OR, NOT, WorkingMemory, populate, \
+     _simplify_and, _simplify_or, _reduce_singletons
+from utils import compile_pattern
+
+class GoalTable(object):
+    """
+    The goal trees for the hypotheses that a list of rules could prove.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._goals = {} # goal -> (tree, goals it was cut short at)
+        self._nodes = {} # (class, keys of children) -> the shared node
+        self._expanding = set()
+
+        # Index the THEN clauses by one of their constant words, so that
+        # each goal is only matched against the ones that could fit it.
+        self._consequents = [] # (rule, its antecedent, compiled pattern)
+        self._by_word = {} # (words, position, word) -> indexes of the above
+        self._anywhere = [] # Indexes of the ones with no constant words
+        for rule in self.rules:
+            for consequent in rule.consequent():
+                pattern = compile_pattern(consequent)
+                i = len(self._consequents)
+                self._consequents.append((rule, rule.antecedent(), pattern))
+                if pattern.arity and pattern.constants:
+                    position, word = pattern.constants[-1]
+                    self._by_word.setdefault((pattern.arity, position, word),
+                                             []).append(i)
+                else:
+                    self._anywhere.append(i)
+
+    def goal_tree(self, hypothesis):
+        """
+        Return the AND/OR tree of the goals that would prove 'hypothesis'.
+        The leaves are strings, possibly with unbound variables.
+        """
+        return self._expand(hypothesis)[0]
+
+    def __len__(self):
+        "The number of distinct goals expanded so far."
+        return len(self._goals)
+
+    def _expand(self, goal):
+        """
+        Return the tree for 'goal', and the set of goals being expanded
+        that the tree was cut short at because they form a cycle.
+
+        The subgoals are expanded depth first, in the order that a
+        recursive expansion would take them, but with an explicit stack,
+        so that a long chain of rules doesn't hit the recursion limit.
+        """
+        result = self._known(goal)
+        if result is not None:
+            return result
+        stack = [self._start(goal)]
+        while True:
+            expansion = stack[-1]
+            if len(expansion.trees) < len(expansion.subgoals):
+                subgoal = expansion.subgoals[len(expansion.trees)]
+                result = self._known(subgoal)
+                if result is None:
+                    stack.append(self._start(subgoal))
+                    continue
+            else:
+                result = self._finish(expansion)
+                stack.pop()
+                if not stack:
+                    return result
+                expansion = stack[-1]
+            tree, cut = result
+            expansion.trees.append(tree)
+            expansion.cut.update(cut)
+
+    def _known(self, goal):
+        """
+        Return the tree for 'goal' and the goals it was cut short at, if
+        they are known without expanding it, or None.
+        """
+        if goal in self._expanding:
+            return goal, frozenset([goal])
+        known = self._goals.get(goal)
+        # A tree that was cut short at some goal is only right while that
+        # goal is still being expanded.
+        if known is not None and known[1] <= self._expanding:
+            return known
+        return None
+
+    def _start(self, goal):
+        "Start expanding 'goal': find the subgoals of each rule for it."
+        self._expanding.add(goal)
+        expansion = _Expansion(goal)
+        for i in self._candidates(goal):
+            rule, antecedent, pattern = self._consequents[i]
+            bindings = pattern.match(goal)
+            if bindings is None:
+                continue
+            bindings = _leave_unbound(antecedent, bindings, goal)
+            if isinstance(antecedent, AND):
+                expansion.add(AND, [populate(c, bindings)
+                                    for c in antecedent])
+            elif isinstance(antecedent, str):
+                expansion.add(None, [populate(antecedent, bindings)])
+            else:
+                for c in antecedent:
+                    expansion.add(None, [populate(c, bindings)])
+        return expansion
+
+    def _finish(self, expansion):
+        "Build the tree for a goal, once its subgoals have been expanded."
+        goal = expansion.goal
+        branches = [goal]
+        start = 0
+        for cls, count in expansion.groups:
+            trees = expansion.trees[start:start + count]
+            start += count
+            if cls is None:
+                branches.extend(trees)
+            else:
+                branches.append(self._node(cls, trees))
+        self._expanding.discard(goal)
+        expansion.cut.discard(goal)
+
+        result = (self._node(OR, branches), frozenset(expansion.cut))
+        self._goals[goal] = result
+        return result
+
+    def _candidates(self, goal):
+        "The indexes of the THEN clauses that might match 'goal', in order."
+        words = goal.split(' ')
+        result = list(self._anywhere)
+        for position, word in enumerate(words):
+            result.extend(self._by_word.get((len(words), position, word), ()))
+        result.sort()
+        return result
+
+    def _node(self, cls, branches):
+        """
+        Return the shared, simplified node for cls(*branches), given that
+        the branches are simplified already.
+        """
+        branches = _unique(branches)
+        if cls == AND:
+            node = _simplify_and(branches)
+        else:
+            node = _simplify_or(branches)
+        # simplify() only removes duplicates before it flattens, so do it
+        # again to leave nothing for it to do.
+        node = _reduce_singletons(node.__class__(*_unique(node)))
+        if isinstance(node, str):
+            return node
+        key = (node.__class__, tuple([_key(branch) for branch in node]))
+        return self._nodes.setdefault(key, node)
+
+class _Expansion(object):
+    """
+    A goal being expanded: the subgoals of the rules that could prove it,
+    in order, and the trees of the ones expanded so far.  Each group is
+    a class (AND, or None for a branch of its own) and how many of the
+    subgoals it takes.
+    """
+    __slots__ = ('goal', 'groups', 'subgoals', 'trees', 'cut')
+
+    def __init__(self, goal):
+        self.goal = goal
+        self.groups = []
+        self.subgoals = []
+        self.trees = []
+        self.cut = set()
+
+    def add(self, cls, subgoals):
+        self.groups.append((cls, len(subgoals)))
+        self.subgoals.extend(subgoals)
+
+def _leave_unbound(antecedent, bindings, goal):
+    """
+    Return 'bindings', plus a '(?name)' value for each variable of the
+    antecedent that they don't bind, so that populate() leaves it as a
+    variable.  It keeps its name, unless the goal has a variable called
+    that already: then a number is added to it, so the two aren't confused.
+    """
+    goal_names = set(compile_pattern(goal).variables)
+    names = _variables_in(antecedent)
+    taken = goal_names | names
+    result = dict(bindings)
+    for name in sorted(names):
+        if name in result:
+            continue
+        new_name = name
+        i = 1
+        while name in goal_names and new_name in taken:
+            new_name = '%s%d' % (name, i)
+            i += 1
+        taken.add(new_name)
+        result[name] = '(?%s)' % new_name
+    return result
+
+def _variables_in(condition):
+    if isinstance(condition, basestring):
+        return set(compile_pattern(condition).variables)
+    result = set()
+    for c in condition:
+        result |= _variables_in(c)
+    return result
+
+def _key(node):
+    # Strings are compared by value, and shared nodes by identity.
+    if isinstance(node, str):
+        return node
+    return id(node)
+
+def _unique(branches):
+    seen = set()
+    result = []
+    for branch in branches:
+        key = _key(branch)
+        if key not in seen:
+            seen.add(key)
+            result.append(branch)
+    return result
+
+
+class GoalEvaluator(object):
+    """
+    Finds the bindings that satisfy AND/OR goal trees against a set of
+    assertions.  A leaf is satisfied by each assertion it matches; an AND
+    passes the bindings from each of its branches on to the next, and
+    stops as soon as one of them can't be satisfied; an OR tries its
+    branches in order.  A NOT is satisfied (without binding anything) when
+    its branch can't be.
+
+    The answers to each node, for each binding of the variables it
+    shares with the rest of the tree, are cached, so a goal that comes up
+    again is not solved again.  They are only worked out as they are
+    needed, though, so asking whether a tree holds at all stops at the
+    first answer.
+    """
+    def __init__(self, data):
+        if not hasattr(data, 'candidates'):
+            data = WorkingMemory(data)
+        self.data = data
+        self._answers = {} # (node key, bound variables) -> _Answers
+        self._variables = {} # node key -> its variable names, in order
+        self._nodes = [] # Keeps the nodes alive while their ids are keys
+
+    def bindings(self, tree, context=None):
+        """
+        Yield each distinct dictionary of bindings, extending 'context',
+        for which 'tree' is satisfied.
+        """
+        if context is None: context = {}
+        for answer in self._solve(tree, context):
+            result = dict(context)
+            result.update(answer)
+            yield result
+
+    def holds(self, tree, context=None):
+        "Is 'tree' satisfied for some bindings?"
+        for bindings in self.bindings(tree, context):
+            return True
+        return False
+
+    def variables(self, node):
+        key = _key(node)
+        result = self._variables.get(key)
+        if result is None:
+            if isinstance(node, str):
+                result = compile_pattern(node).variables
+            else:
+                self._nodes.append(node)
+                result = []
+                for branch in node:
+                    for name in self.variables(branch):
+                        if name not in result:
+                            result.append(name)
+                result = tuple(result)
+            self._variables[key] = result
+        return result
+
+    def _solve(self, node, context):
+        """
+        Return an iterator over the bindings of the variables in 'node'
+        that satisfy it, given the bindings in 'context'.
+        """
+        bound = tuple([(name, context[name]) for name in self.variables(node)
+                       if name in context])
+        key = (_key(node), bound)
+        answers = self._answers.get(key)
+        if answers is None:
+            answers = self._answers[key] = \
+                _Answers(self._generate(node, dict(bound)))
+        return iter(answers)
+
+    def _generate(self, node, bound):
+        if isinstance(node, str):
+            return self._match(node, bound)
+        elif isinstance(node, AND):
+            return self._and(node, bound)
+        elif isinstance(node, OR):
+            return self._or(node, bound)
+        elif isinstance(node, NOT):
+            return self._not(node, bound)
+        raise TypeError, "Can't evaluate the goal %r" % (node,)
+
+    def _match(self, leaf, bound):
+        pattern = compile_pattern(leaf)
+        for assertion in self.data.candidates(pattern, bound):
+            bindings = pattern.match(assertion)
+            if bindings is None:
+                continue
+            for name, value in bound.iteritems():
+                if bindings.get(name, value) != value:
+                    break
+            else:
+                yield bindings
+
+    def _and(self, branches, bound):
+        if not branches:
+            yield {}
+            return
+        # One iterator per branch solved so far, and the bindings that
+        # each one was started with.
+        iterators = [self._solve(branches[0], bound)]
+        contexts = [bound]
+        while iterators:
+            try:
+                answer = iterators[-1].next()
+            except StopIteration:
+                iterators.pop()
+                contexts.pop()
+                continue
+            context = dict(contexts[-1])
+            context.update(answer)
+            if len(iterators) == len(branches):
+                yield context
+            else:
+                iterators.append(self._solve(branches[len(iterators)],
+                                             context))
+                contexts.append(context)
+
+    def _or(self, branches, bound):
+        for branch in branches:
+            for answer in self._solve(branch, bound):
+                yield answer
+
+    def _not(self, branches, bound):
+        for branch in branches:
+            for answer in self._solve(branch, bound):
+                return
+        yield {}
+
+class _Answers(object):
+    """
+    The distinct answers from a generator, kept as they are produced, so
+    that any number of iterators can share them.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.results = []
+        self._seen = set()
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i < len(self.results):
+                yield self.results[i]
+                i += 1
+            elif self.source is None:
+                return
+            else:
+                try:
+                    answer = self.source.next()
+                except StopIteration:
+                    self.source = None
+                    continue
+                key = frozenset(answer.iteritems())
+                if key not in self._seen:
+                    self._seen.add(key)
+                    self.results.append(answer)
+
+def tabled_backchain(rules, hypothesis):
+    """
+    Like backchain_to_goal_tree(rules, hypothesis), but each distinct goal
+    is expanded only once, and a goal that depends on itself is left as a
+    leaf where it recurs.
+    """
+    return GoalTable(rules).goal_tree(hypothesis)
+
+def backchain_query(rules, hypothesis, data):
+    """
+    Yield each dictionary of bindings of the variables in 'hypothesis' for
+    which it follows from 'data' by the rules, by backward chaining.
+    (Goals that depend on themselves are only looked up in the data.)
+    """
+    names = compile_pattern(hypothesis).variables
+    seen = set()
+    for bindings in GoalEvaluator(data).bindings(tabled_backchain(rules,
+                                                                  hypothesis)):
+        answer = dict([(name, bindings[name]) for name in names
+                       if name in bindings])
+        key = frozenset(answer.iteritems())
+        if key not in seen:
+            seen.add(key)
+            yield answer
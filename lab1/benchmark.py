@@ -0,0 +1,279 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Benchmarks for the rule engines.  You don't need this file for Lab 1.
+#
+# The lab's data sets are far too small to time anything with, so this
+# generates bigger ones: genealogies of any number of people for the family
+# rules, long chains for the transitive 'beats' rule, and zoos of any number
+# of animals for the zookeeper rules, plus deep rule sets to backchain
+# through.  Each benchmark runs in a process of its own, so that its peak
+# memory use can be measured too.  From the command line:
+#
+#   python benchmark.py --engines none,rete,relational --output results.json
+#
+# writes the times and memory use to results.json, so that runs can be
+# compared over time.  By default, the forward_chain benchmarks run with the
+# default engine and with engine='parallel', which splits its work between
+# one process per CPU (see parallel.py); the peak memory of those processes
+# is given separately, as children_peak_memory_kb.  The engine 'sqlite'
+# chains with the default engine in a SQLiteMemory (see sqlmemory.py).
+
+import gc
+import json
+import multiprocessing
+import platform
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    resource = None # Not on Windows; peak memory isn't measured there
+
+from production import IF, AND, THEN, forward_chain
+from sqlmemory import SQLiteMemory
+from data import zookeeper_rules
+from lab1 import transitive_rule, family_rules, backchain_to_goal_tree
+
+#### Rules and data
+
+# The rules the lab itself uses, so the benchmarks keep up with them.
+BEATS_RULES = [transitive_rule]
+FAMILY_RULES = family_rules
+
+# What the zookeeper rules need to know to identify each animal.
+ZOO_ANIMALS = {
+    'cheetah': ['has hair', 'eats meat', 'has tawny color',
+                'has dark spots'],
+    'tiger': ['gives milk', 'has pointed teeth', 'has claws',
+              'has forward-pointing eyes', 'has tawny color',
+              'has black stripes'],
+    'giraffe': ['has hair', 'has hoofs', 'has long legs', 'has long neck',
+                'has tawny color', 'has dark spots'],
+    'zebra': ['gives milk', 'chews cud', 'has white color',
+              'has black stripes'],
+    'ostrich': ['has feathers', 'does not fly', 'has long legs',
+                'has long neck', 'has black and white color'],
+    'penguin': ['flies', 'lays eggs', 'does not fly', 'swims',
+                'has black and white color'],
+    'albatross': ['has feathers', 'is a good flyer'],
+    }
+
+def beats_chain(length):
+    "Return assertions 'n0 beats n1', ..., with 'length' links."
+    return ['n%d beats n%d' % (i, i + 1) for i in range(length)]
+
+def genealogy(people, branching=2):
+    """
+    Return the assertions for a family tree of 'people' people, where
+    everyone but the first has one parent, and each parent has 'branching'
+    children: p1 and p2 are the children of p0, p3 and p4 of p1, and so on.
+    """
+    names = ['p%d' % i for i in range(people)]
+    data = ['person %s' % name for name in names]
+    for i in range(1, people):
+        data.append('parent %s %s' % (names[(i - 1) // branching], names[i]))
+    return data
+
+def zoo(animals):
+    """
+    Return the assertions describing 'animals' animals a0, a1, ..., which
+    are each of the ZOO_ANIMALS in turn.
+    """
+    species = sorted(ZOO_ANIMALS)
+    data = []
+    for i in range(animals):
+        for feature in ZOO_ANIMALS[species[i % len(species)]]:
+            data.append('a%d %s' % (i, feature))
+    return data
+
+def layered_rules(depth, width=3):
+    """
+    Return rules to backchain through, 'depth' levels deep and 'width'
+    wide: each '(?x) is level-d-j' follows from two of the statements on
+    level d+1, so that every goal below the top is reached many ways.
+    """
+    rules = []
+    for d in range(depth):
+        for j in range(width):
+            rules.append(IF( AND( '(?x) is level-%d-%d' % (d + 1, j),
+                                  '(?x) is level-%d-%d' % (d + 1,
+                                                           (j + 1) % width) ),
+                             THEN( '(?x) is level-%d-%d' % (d, j) )))
+    return rules
+
+#### The benchmarks
+
+# name -> (what it runs, the function that sets it up for some size)
+BENCHMARKS = {
+    'beats': ('forward_chain',
+              lambda size: (BEATS_RULES, beats_chain(size))),
+    'genealogy': ('forward_chain',
+                  lambda size: (FAMILY_RULES, genealogy(size))),
+    'genealogy-wide': ('forward_chain',
+                       lambda size: (FAMILY_RULES, genealogy(size, 6))),
+    'zoo': ('forward_chain',
+            lambda size: (zookeeper_rules, zoo(size))),
+    'zoo-backchain': ('backchain_to_goal_tree',
+                      lambda size: (zookeeper_rules,
+                                    ['a%d is a %s' % (i, species)
+                                     for i in range(size)
+                                     for species in sorted(ZOO_ANIMALS)])),
+    'layered-backchain': ('backchain_to_goal_tree',
+                          lambda size: (layered_rules(size),
+                                        ['a is level-0-0'])),
+    }
+
+# name -> the sizes to run it at, normally and with --quick
+SIZES = {
+    'beats': ([25, 50, 100], [25]),
+    'genealogy': ([100, 300, 1000], [100]),
+    'genealogy-wide': ([100, 300, 1000], [100]),
+    'zoo': ([100, 1000, 5000], [100]),
+    'zoo-backchain': ([10, 100], [10]),
+    'layered-backchain': ([10, 50, 200], [10]),
+    }
+
+def run_benchmark(name, size, engine=None):
+    """
+    Run one benchmark in this process, and return a dictionary of what
+    happened: the seconds it took, how big the result was (assertions
+    for forward_chain, goal tree nodes for backchaining), and (where
+    that can be measured) the peak memory use of the process, and how
+    much that grew while it ran, in kilobytes.
+    """
+    function, setup = BENCHMARKS[name]
+    rules, data = setup(size)
+    gc.collect()
+    before = _peak_memory()
+    started = time.time()
+    if function == 'forward_chain' and engine == 'sqlite':
+        result = len(forward_chain(rules, data, memory=SQLiteMemory()))
+    elif function == 'forward_chain':
+        result = len(forward_chain(rules, data, engine=engine))
+    else:
+        result = 0
+        for hypothesis in data:
+            result += _count_nodes(backchain_to_goal_tree(rules, hypothesis))
+    seconds = time.time() - started
+    peak = growth = _peak_memory()
+    if peak is not None:
+        growth = peak - before
+    children = _peak_memory(children=True)
+    return {'benchmark': name,
+            'function': function,
+            'size': size,
+            'engine': engine,
+            'inputs': len(data),
+            'result_size': result,
+            'seconds': seconds,
+            'peak_memory_kb': peak,
+            'memory_growth_kb': growth,
+            'children_peak_memory_kb': children}
+
+def _count_nodes(tree):
+    "Count the distinct nodes of a goal tree, whose subtrees may be shared."
+    seen = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if not isinstance(node, basestring):
+            stack.extend(node)
+    return len(seen)
+
+def _peak_memory(children=False):
+    if resource is None:
+        return None
+    if children:
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024 # Bytes there, not kilobytes
+    return peak
+
+def _run_in_child(connection, name, size, engine):
+    try:
+        connection.send(run_benchmark(name, size, engine))
+    except Exception, e:
+        connection.send({'benchmark': name, 'size': size, 'engine': engine,
+                         'error': '%s: %s' % (e.__class__.__name__, e)})
+    connection.close()
+
+def run_isolated(name, size, engine=None):
+    """
+    run_benchmark() in a new process, so that the memory used by one
+    benchmark doesn't count against the next.
+    """
+    connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_run_in_child,
+                                      args=(child_connection, name, size,
+                                            engine))
+    process.start()
+    result = connection.recv()
+    process.join()
+    return result
+
+def run_all(names=None, engines=(None,), quick=False, repeat=1,
+            verbose=False):
+    """
+    Run the benchmarks called 'names' (by default, all of them) at each of
+    their sizes, with each engine for forward_chain, and return the list of
+    results.  With repeat > 1, each is run that many times, and the fastest
+    run kept.
+    """
+    results = []
+    for name in names or sorted(BENCHMARKS):
+        function = BENCHMARKS[name][0]
+        for size in SIZES[name][bool(quick)]:
+            for engine in (function == 'forward_chain' and engines
+                           or (None,)):
+                runs = [run_isolated(name, size, engine)
+                        for i in range(repeat)]
+                best = min(runs, key=lambda run: run.get('seconds', 0))
+                best['runs'] = [run.get('seconds') for run in runs]
+                results.append(best)
+                if verbose:
+                    print _describe(best)
+    return results
+
+def _describe(result):
+    if 'error' in result:
+        return '%(benchmark)s %(size)s %(engine)s: %(error)s' % result
+    return ('%(benchmark)s %(size)s %(engine)s: %(seconds).3fs, '
+            '%(result_size)d out, peak %(peak_memory_kb)s KB' % result)
+
+def main(argv):
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options] [benchmark ...]")
+    parser.add_option('-e', '--engines', default='none,parallel',
+                      help="comma-separated forward_chain engines "
+                      "('none' for the default)")
+    parser.add_option('-q', '--quick', action='store_true',
+                      help="only run the smallest sizes")
+    parser.add_option('-r', '--repeat', type='int', default=1,
+                      help="keep the fastest of this many runs")
+    parser.add_option('-o', '--output', help="write the results as JSON")
+    options, names = parser.parse_args(argv)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %s (try %s)"
+                         % (name, ', '.join(sorted(BENCHMARKS))))
+    engines = [engine != 'none' and engine or None
+               for engine in options.engines.split(',')]
+
+    results = run_all(names, engines, options.quick, options.repeat,
+                      verbose=True)
+    if options.output:
+        report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'python': platform.python_version(),
+                  'platform': platform.platform(),
+                  'results': results}
+        output = open(options.output, 'w')
+        json.dump(report, output, indent=2, sort_keys=True)
+        output.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
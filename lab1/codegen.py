@@ -0,0 +1,386 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Compiling rules into Python functions.  You don't need this file for
+# Lab 1; forward_chain() uses it to match rules whenever it can.
+#
+# Interpreting a rule's AND/OR tree builds and checks bindings one
+# condition at a time, through several layers of generators.  Instead, an
+# antecedent made of strings, NOTs of strings, ANDs of those, and ORs of
+# any of the above is turned into the source of a generator function, with
+# one loop per condition over a bucket of the WorkingMemory, and the words
+# and variables compared inline.  AND('parent (?x) (?y)', 'parent (?y)
+# (?z)') becomes:
+#
+# def match(bucket, matches_any):
+#     for a0 in bucket([(3, 0, 'parent')]):
+#         w0 = a0.split(' ')
+#         if w0[0] != 'parent': continue
+#         v0 = w0[1]
+#         v1 = w0[2]
+#         if not v0 or not v1: continue
+#         for a1 in bucket([(3, 0, 'parent'), (3, 1, v1)]):
+#             w1 = a1.split(' ')
+#             if w1[0] != 'parent' or w1[1] != v1: continue
+#             v2 = w1[2]
+#             if not v2: continue
+#             yield {'x': v0, 'y': v1, 'z': v2}
+#
+# The bindings come out in the same order as from the interpreter.  The
+# functions are cached for each rule, and each order of its conditions.
+# When profiling (see rulestats.py), a second version of the function also
+# counts the partial bindings that get past each condition.  The rounds of
+# semi-naive matching (see semi_naive_matches()) are compiled the same way,
+# with each condition's loop over a bucket of the new assertions, or over
+# a bucket of all of them that skips the new ones.
+
+import weakref
+from production import AND, OR, NOT, plan_conjunction
+from utils import AIStringToPyTemplate, AIStringVars, compile_pattern
+
+class CantCompile(Exception):
+    "A flag that a condition can't be compiled into Python."
+    pass
+
+# rule -> {(orders, counted), or ('semi-naive', rounds): the compiled
+# function, or None if there isn't one}
+_compiled = weakref.WeakKeyDictionary()
+
+def compiled_bindings(rule, memory, plans=None, counts=None):
+    """
+    Return an iterator over the bindings for which 'rule' matches the
+    WorkingMemory 'memory', in the order RuleExpression().test_term_matches
+    would find them, or None if the rule can't be compiled.  They are
+    generated as they are used, from the memory as it is then.
+
+    If 'plans' is a list, the conditions of each AND are reordered by
+    plan_conjunction() instead, as planned_matches() would do, and the
+    orders chosen are appended to it.
+
+    If 'counts' is a dictionary, the number of partial bindings that get
+    past each condition is added to its value for that condition, once
+    all of the bindings have been generated.
+    """
+    if memory.odd_spaces:
+        return None # Its assertions don't split into words cleanly
+    branches = antecedent_branches(rule.antecedent())
+    if branches is None:
+        return None
+    orders = None
+    if plans is not None:
+        orders = []
+        for branch in branches:
+            order = None
+            if isinstance(branch, AND):
+                order = plan_conjunction(list(branch), memory)
+            if order != None:
+                plans.append([branch[i] for i in order])
+                order = tuple(order)
+            orders.append(order)
+        orders = tuple(orders)
+    match = compile_rule(rule, orders, counts is not None)
+    if match is None:
+        return None
+    return match(memory, counts)
+
+def compiled_semi_naive_bindings(rule, memory, delta, plans=None):
+    """
+    Like compiled_bindings(), but return an iterator over the bindings
+    that semi_naive_matches(rule.antecedent(), memory, delta, plans) would
+    find: those that use at least one assertion from the WorkingMemory
+    'delta'.  Each of its rounds is compiled, with the new assertions
+    looked up in the buckets of 'delta' and the old ones skipped as the
+    buckets of 'memory' are read, instead of filtering whole buckets.
+    """
+    if memory.odd_spaces or delta.odd_spaces:
+        return None
+    branches = antecedent_branches(rule.antecedent())
+    if branches is None:
+        return None
+    rounds = [] # (sources, order) for each round of each branch
+    for branch in branches:
+        conditions = _conditions(branch)
+        positions = [i for i, c in enumerate(conditions)
+                     if isinstance(c, basestring)]
+        for k, position in enumerate(positions):
+            sources = [None] * len(conditions)
+            for i in positions[:k]:
+                sources[i] = 'old'
+            sources[position] = 'new'
+            order = None
+            if plans is not None:
+                # The old assertions are estimated as all of them.
+                data_sources = [None] * len(conditions)
+                data_sources[position] = delta
+                order = plan_conjunction(conditions, memory, data_sources)
+            if order != None:
+                plans.append([conditions[i] for i in order])
+                order = tuple(order)
+            rounds.append((tuple(sources), order))
+
+    functions = _compiled.setdefault(rule, {})
+    key = ('semi-naive', tuple(rounds))
+    if key not in functions:
+        functions[key] = None
+        try:
+            functions[key] = _compile_rounds(branches, rounds)
+        except CantCompile:
+            pass
+    if functions[key] is None:
+        return None
+    return functions[key](memory, delta)
+
+def _compile_rounds(branches, rounds):
+    functions = []
+    rounds = iter(rounds)
+    for branch in branches:
+        conditions = _conditions(branch)
+        for i in range(len([c for c in conditions
+                            if isinstance(c, basestring)])):
+            sources, order = rounds.next()
+            if order is not None:
+                conditions_in_order = [conditions[j] for j in order]
+                sources = [sources[j] for j in order]
+            else:
+                conditions_in_order = conditions
+            functions.append(compile_conditions(conditions_in_order, False,
+                                                sources))
+
+    def match(memory, delta):
+        bucket = memory.bucket
+        matches_any = memory.matches_any
+        for function in functions:
+            for bindings in function(bucket, matches_any, delta):
+                yield bindings
+    return match
+
+def compile_rule(rule, orders=None, counted=False, symbols=None):
+    """
+    Return a function that generates the bindings for which 'rule' matches
+    a WorkingMemory, or None if it can't be compiled.  'orders' gives the
+    order in which to match the conditions of each branch of an OR (or of
+    the whole antecedent), as a tuple with a tuple of indexes or None for
+    each branch; by default they are matched as written.
+
+    The function takes the WorkingMemory, and a dictionary to count partial
+    bindings in (see compiled_bindings()), which is only used if 'counted'.
+
+    If 'symbols' is a SymbolTable (see interned.py), the function matches
+    an InternedMemory instead, and binds the variables to symbols.  Those
+    functions aren't cached here, since they only work with that table.
+    """
+    if symbols is not None:
+        branches = antecedent_branches(rule.antecedent())
+        if branches is None:
+            return None
+        try:
+            return _compile_branches(branches, orders, counted, symbols)
+        except CantCompile:
+            return None
+    functions = _compiled.setdefault(rule, {})
+    key = (orders, counted)
+    if key not in functions:
+        functions[key] = None
+        branches = antecedent_branches(rule.antecedent())
+        if branches is not None:
+            try:
+                functions[key] = _compile_branches(branches, orders, counted)
+            except CantCompile:
+                pass
+    return functions[key]
+
+def antecedent_branches(condition):
+    """
+    Return the list of branches of an antecedent (just the antecedent,
+    unless it is an OR), or None if some branch isn't a string, a NOT of a
+    string, or an AND of those.
+    """
+    if isinstance(condition, OR):
+        branches = []
+        for c in condition:
+            c_branches = antecedent_branches(c)
+            if c_branches is None:
+                return None
+            branches.extend(c_branches)
+        return branches
+    elif isinstance(condition, AND):
+        for c in condition:
+            if not (isinstance(c, basestring) or _is_simple_not(c)):
+                return None
+        return [condition]
+    elif isinstance(condition, basestring) or _is_simple_not(condition):
+        return [condition]
+    return None
+
+def _conditions(branch):
+    "Return the list of conditions in a branch (see antecedent_branches())."
+    if isinstance(branch, AND):
+        return list(branch)
+    return [branch]
+
+def _is_simple_not(condition):
+    return (isinstance(condition, NOT) and len(condition) == 1
+            and isinstance(condition[0], basestring))
+
+def _compile_branches(branches, orders, counted=False, symbols=None):
+    functions = []
+    for i, branch in enumerate(branches):
+        conditions = _conditions(branch)
+        if orders is not None and orders[i] is not None:
+            conditions = [conditions[j] for j in orders[i]]
+        functions.append((compile_conditions(conditions, counted, None,
+                                             symbols),
+                          conditions))
+
+    def match(memory, counts=None):
+        bucket = memory.bucket
+        matches_any = memory.matches_any
+        for function, conditions in functions:
+            if not counted:
+                for bindings in function(bucket, matches_any):
+                    yield bindings
+                continue
+            passed = [0] * len(conditions)
+            for bindings in function(bucket, matches_any, passed):
+                yield bindings
+            if counts is not None:
+                for condition, count in zip(conditions, passed):
+                    counts[condition] = counts.get(condition, 0) + count
+    return match
+
+def compile_conditions(conditions, counted=False, sources=None, symbols=None):
+    """
+    Return a generator function match(bucket, matches_any) for the AND of
+    'conditions' (strings and NOTs of strings), where bucket and
+    matches_any are those methods of a WorkingMemory.  Raise CantCompile
+    if some condition can't be compiled.
+
+    If 'counted', it is match(bucket, matches_any, passed) instead, and
+    adds to passed[k] each time some bindings get past conditions[k].
+
+    If 'sources' is given, it is a list parallel to 'conditions', and the
+    function is match(bucket, matches_any, new), where 'new' is a
+    WorkingMemory of the assertions that are new (see
+    semi_naive_matches()): a condition whose source is 'new' is matched
+    against only those, one whose source is 'old' against all but those,
+    and one whose source is None against all of the assertions.
+
+    If 'symbols' is a SymbolTable, bucket and matches_any are those of an
+    InternedMemory: the assertions are tuples of symbols, and a NOT is
+    looked up as a tuple once its variables are bound.  The empty word is
+    symbol 0, so a variable still only matches a true value.
+    """
+    if counted and sources is not None:
+        raise CantCompile, "Semi-naive rounds aren't counted"
+    if counted:
+        source = ['def match(bucket, matches_any, passed):']
+    elif sources is not None:
+        source = ['def match(bucket, matches_any, new):',
+                  '    new_bucket = new.bucket']
+    else:
+        source = ['def match(bucket, matches_any):']
+    names = {} # variable -> the name of the Python variable it is bound to
+    indent = '    '
+    depth = 0 # The number of loops
+    for k, condition in enumerate(conditions):
+        if isinstance(condition, NOT):
+            pattern = condition[0]
+            if '%' in pattern:
+                raise CantCompile, pattern # populate() may do odd things
+            variables = AIStringVars(pattern)
+            # Like NOT.test_matches, fill the pattern in if all of its
+            # variables are bound, and match it as it is otherwise.
+            if symbols is not None:
+                test = _symbol_not_test(pattern, names, symbols)
+            elif variables <= set(names):
+                test = 'matches_any(%r %% {%s})' % (
+                    AIStringToPyTemplate(pattern),
+                    ', '.join(['%r: %s' % (v, names[v])
+                               for v in sorted(variables)]))
+            else:
+                test = 'matches_any(%r)' % pattern
+            if depth:
+                source.append('%sif %s: continue' % (indent, test))
+            else:
+                source.append('%sif %s: return' % (indent, test))
+            if counted:
+                source.append('%spassed[%d] += 1' % (indent, k))
+            continue
+
+        pattern = compile_pattern(condition)
+        variables = [name for i, name in pattern.variable_words]
+        if (pattern.arity == None or len(set(variables)) != len(variables)
+            or len(pattern.constants) + len(variables) != pattern.arity):
+            raise CantCompile, condition
+
+        constants = pattern.constants
+        if symbols is not None:
+            constants = [(i, symbols.intern(word)) for i, word in constants]
+        keys = ['(%d, %d, %r)' % (pattern.arity, i, word)
+                for i, word in constants]
+        keys.extend(['(%d, %d, %s)' % (pattern.arity, i, names[name])
+                     for i, name in pattern.variable_words if name in names])
+        keys = keys or ['(%d,)' % pattern.arity]
+        condition_source = sources and sources[k]
+        if condition_source == 'new':
+            bucket = 'new_bucket'
+        else:
+            bucket = 'bucket'
+        source.append('%sfor a%d in %s([%s]):' % (indent, k, bucket,
+                                                  ', '.join(keys)))
+        depth += 1
+        indent += '    '
+        if condition_source == 'old':
+            source.append('%sif a%d in new: continue' % (indent, k))
+        if symbols is not None:
+            source.append('%sw%d = a%d' % (indent, k, k))
+        else:
+            source.append('%sw%d = a%d.split(\' \')' % (indent, k, k))
+
+        tests = ['w%d[%d] != %r' % (k, i, word) for i, word in constants]
+        tests.extend(['w%d[%d] != %s' % (k, i, names[name])
+                      for i, name in pattern.variable_words if name in names])
+        if tests:
+            source.append('%sif %s: continue' % (indent, ' or '.join(tests)))
+
+        new = []
+        for i, name in pattern.variable_words:
+            if name not in names:
+                names[name] = 'v%d' % len(names)
+                new.append(names[name])
+                source.append('%s%s = w%d[%d]' % (indent, names[name], k, i))
+        if new:
+            # A variable only matches a nonempty word.
+            source.append('%sif %s: continue' % (
+                indent, ' or '.join(['not ' + n for n in new])))
+        if counted:
+            source.append('%spassed[%d] += 1' % (indent, k))
+
+    source.append('%syield {%s}' % (indent, ', '.join(
+        ['%r: %s' % (name, names[name]) for name in sorted(names)])))
+
+    namespace = {}
+    exec '\n'.join(source) + '\n' in namespace
+    match = namespace['match']
+    match.source = '\n'.join(source)
+    return match
+
+def _symbol_not_test(pattern, names, symbols):
+    """
+    Return the Python test for NOT(pattern) against an InternedMemory,
+    given the Python variables that the variables bound so far are in.
+    """
+    compiled = compile_pattern(pattern)
+    variables = [name for i, name in compiled.variable_words]
+    if (compiled.arity == None
+        or len(compiled.constants) + len(variables) != compiled.arity):
+        raise CantCompile, pattern
+    if not set(variables) <= set(names):
+        if len(set(variables)) != len(variables):
+            raise CantCompile, pattern # InternedMemory can't match it
+        return 'matches_any(%r)' % pattern
+    words = [None] * compiled.arity
+    for i, word in compiled.constants:
+        words[i] = repr(symbols.intern(word))
+    for i, name in compiled.variable_words:
+        words[i] = names[name]
+    return 'matches_any((%s,))' % ', '.join(words)
@@ -0,0 +1,409 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Chaining rules over assertions that have been parsed into symbols.  You
+# don't need this file for Lab 1; forward_chain(engine='interned') uses it.
+#
+# Each word of an assertion is interned as a small integer (a symbol), so
+# 'parent marge bart' is stored as a tuple such as (1, 2, 3).  The rules
+# are compiled against the same symbols (see codegen.py), so matching a
+# condition compares integers instead of splitting strings, variables are
+# bound to symbols, and the consequents are filled in as tuples.  The
+# tuples are the only copy of the assertions that is kept while chaining:
+# they are turned back into strings only to print them (when verbose) and
+# to return the result, which is exactly that of forward_chain().
+#
+# If some rule can't be compiled (a condition with a variable inside a
+# word, or the same variable twice, or regular-expression metacharacters,
+# or a nested AND or OR), or some word has metacharacters or odd
+# whitespace in it, the rules are simply chained as usual instead.
+
+from production import (AND, Matcher, PendingChanges, RuleExpression, chain,
+                        plan_conjunction)
+from codegen import compile_rule, antecedent_branches
+from utils import AIMetaRegex, AIOddSpaceRegex, compile_pattern
+
+class CantIntern(Exception):
+    "A flag that a condition can't be compiled into symbols."
+    pass
+
+class SymbolTable(object):
+    """
+    Numbers words from 0 up, in the order they are first seen.  The empty
+    word (between two spaces in a row) is always 0.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.unbindable = set() # Symbols no variable can match
+        self.metacharacters = set() # Symbols with regex metacharacters
+        self.intern('')
+
+    def intern(self, word):
+        symbol = self.ids.get(word)
+        if symbol is None:
+            symbol = self.ids[word] = len(self.names)
+            self.names.append(word)
+            if not word:
+                self.unbindable.add(symbol)
+            if AIMetaRegex.search(word):
+                self.metacharacters.add(symbol)
+        return symbol
+
+    def parse(self, assertion):
+        "Return the tuple of symbols for the words of 'assertion'."
+        return tuple([self.intern(word) for word in assertion.split(' ')])
+
+    def render(self, fact):
+        return ' '.join([self.names[symbol] for symbol in fact])
+
+class SymbolPattern(object):
+    """
+    A condition such as 'parent (?x) (?y)' compiled against a SymbolTable:
+    its number of words, its constant words as (position, symbol), and its
+    variables as (position, name).
+
+    Its render(bindings) fills the variables in, like AIPattern.render: it
+    returns the tuple of symbols, or raises KeyError if some of them aren't
+    bound.  It is compiled into a lambda, since rules fire so often.
+    """
+    __slots__ = ('string', 'arity', 'constants', 'variables', 'render')
+
+    def __init__(self, condition, symbols, template=False):
+        """
+        Raise CantIntern if 'condition' has a variable inside a word, or
+        metacharacters, or (unless it is a 'template' that is only filled
+        in) the same variable twice.
+        """
+        pattern = compile_pattern(condition)
+        names = [name for i, name in pattern.variable_words]
+        if (pattern.arity == None
+            or (len(set(names)) != len(names) and not template)
+            or len(pattern.constants) + len(names) != pattern.arity):
+            raise CantIntern, condition
+        self.string = condition
+        self.arity = pattern.arity
+        self.constants = tuple([(i, symbols.intern(word))
+                                for i, word in pattern.constants])
+        self.variables = pattern.variable_words
+        words = [None] * self.arity
+        for i, symbol in self.constants:
+            words[i] = repr(symbol)
+        for i, name in self.variables:
+            words[i] = 'b[%r]' % name
+        self.render = eval('lambda b: (%s,)' % ', '.join(words))
+
+    def match(self, fact, bindings, unbindable):
+        """
+        Return 'bindings' extended so that this pattern matches the tuple
+        'fact', or None if it can't be.
+        """
+        for i, symbol in self.constants:
+            if fact[i] != symbol:
+                return None
+        result = dict(bindings)
+        for i, name in self.variables:
+            symbol = fact[i]
+            if symbol in unbindable:
+                return None
+            bound = result.setdefault(name, symbol)
+            if bound != symbol:
+                return None
+        return result
+
+    def instantiate(self, bindings):
+        """
+        Return the tuple of symbols for this pattern with its variables
+        filled in, or None if some of them aren't bound.
+        """
+        fact = [None] * self.arity
+        for i, symbol in self.constants:
+            fact[i] = symbol
+        for i, name in self.variables:
+            if name not in bindings:
+                return None
+            fact[i] = bindings[name]
+        return tuple(fact)
+
+class InternedMemory(object):
+    """
+    A set of assertions as tuples of symbols, indexed like a WorkingMemory
+    by their number of words and by the symbol in each position.
+    """
+    def __init__(self, symbols, facts = ()):
+        self.symbols = symbols
+        self.facts = set()
+        self._buckets = {} # (words,) or (words, position, symbol) -> set
+        self._sorted = {} # bucket key -> the bucket, sorted as strings
+        self._distinct = {} # (words, position) -> number of distinct symbols
+        self._patterns = {} # condition -> SymbolPattern, for matches_any()
+        for fact in facts:
+            self.add(fact)
+
+    def _keys(self, fact):
+        count = len(fact)
+        return [(count,)] + [(count, i, s) for i, s in enumerate(fact)]
+
+    def add(self, fact):
+        if fact in self.facts:
+            return
+        self.facts.add(fact)
+        for key in self._keys(fact):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = set()
+                if len(key) == 3:
+                    self._distinct[key[:2]] = \
+                        self._distinct.get(key[:2], 0) + 1
+            bucket.add(fact)
+            self._sorted.pop(key, None)
+
+    def remove(self, fact):
+        self.facts.remove(fact)
+        for key in self._keys(fact):
+            bucket = self._buckets[key]
+            bucket.discard(fact)
+            if not bucket:
+                del self._buckets[key]
+                if len(key) == 3:
+                    self._distinct[key[:2]] -= 1
+            self._sorted.pop(key, None)
+
+    def discard(self, fact):
+        if fact in self.facts:
+            self.remove(fact)
+
+    def __contains__(self, fact):
+        return fact in self.facts
+
+    def __len__(self):
+        return len(self.facts)
+
+    def __iter__(self):
+        return iter(self.facts)
+
+    def _smallest(self, keys):
+        "Return the key of the smallest of these buckets, or False."
+        key = None
+        for k in keys:
+            if k not in self._buckets:
+                return False
+            if key == None or len(self._buckets[k]) < len(self._buckets[key]):
+                key = k
+        return key
+
+    def bucket(self, keys):
+        """
+        Return the facts in the smallest of the buckets with these keys, in
+        no particular order.  The set itself is returned, so the memory
+        must not change while it is being read.
+        """
+        key = self._smallest(keys)
+        if key == False:
+            return ()
+        return self._buckets[key]
+
+    def sorted_bucket(self, keys):
+        "Like bucket(), but in the order of the facts' strings."
+        key = self._smallest(keys)
+        if key == False:
+            return []
+        result = self._sorted.get(key)
+        if result == None:
+            result = self._sorted[key] = sorted(self._buckets[key],
+                                                key=self.symbols.render)
+        return result
+
+    def matches_any(self, condition):
+        """
+        Does any fact match 'condition': a tuple of symbols, or a pattern
+        string that SymbolPattern can compile?
+        """
+        if isinstance(condition, tuple):
+            return condition in self.facts
+        pattern = self._patterns.get(condition)
+        if pattern is None:
+            pattern = self._patterns[condition] = \
+                SymbolPattern(condition, self.symbols)
+        keys = [(pattern.arity, i, s) for i, s in pattern.constants]
+        unbindable = self.symbols.unbindable
+        for fact in self.bucket(keys or [(pattern.arity,)]):
+            if pattern.match(fact, {}, unbindable) is not None:
+                return True
+        return False
+
+    def estimate(self, condition, bound=()):
+        "Like WorkingMemory.estimate(), for plan_conjunction()."
+        pattern = compile_pattern(condition)
+        if pattern.arity == None:
+            return float(len(self))
+        sizes = []
+        for i, word in pattern.constants:
+            symbol = self.symbols.ids.get(word)
+            sizes.append(len(self._buckets.get((pattern.arity, i, symbol),
+                                               ())))
+        if sizes:
+            size = float(min(sizes))
+        else:
+            size = float(len(self._buckets.get((pattern.arity,), ())))
+        for i, name in pattern.variable_words:
+            if name in bound:
+                size /= max(1, self._distinct.get((pattern.arity, i), 1))
+        return size
+
+class _InStringOrder(object):
+    "An InternedMemory, with its buckets sorted as strings."
+    def __init__(self, memory):
+        self.bucket = memory.sorted_bucket
+        self.matches_any = memory.matches_any
+
+class InternedMatcher(Matcher):
+    """
+    A Matcher for an InternedMemory, which finds the bindings of each rule
+    (to symbols) with a function that codegen.py compiles against its
+    SymbolTable.  Raises CantIntern if some rule can't be compiled.
+    """
+    def __init__(self, rules, memory, apply_only_one=False, explain=False):
+        Matcher.__init__(self, rules, memory, apply_only_one, explain)
+        self.symbols = memory.symbols
+        self.clauses = {} # rule -> (THEN, DELETE) as lists of SymbolPatterns
+        self._functions = {} # (rule, orders) -> compiled function
+        for rule in rules:
+            if antecedent_branches(rule.antecedent()) is None:
+                raise CantIntern, rule.antecedent()
+            for clause in (list(rule.consequent() or ())
+                           + list(rule.delete_clause() or ())):
+                if '%' in clause:
+                    raise CantIntern, clause # populate() may do odd things
+            self.clauses[rule] = (
+                [SymbolPattern(a, self.symbols, True)
+                 for a in rule.consequent() or ()],
+                [SymbolPattern(d, self.symbols, True)
+                 for d in rule.delete_clause() or ()])
+            if self._function(rule, None) is None:
+                raise CantIntern, rule.antecedent()
+
+    def _function(self, rule, orders):
+        key = (rule, orders)
+        if key not in self._functions:
+            self._functions[key] = compile_rule(rule, orders, False,
+                                                self.symbols)
+        return self._functions[key]
+
+    def bindings(self, rule):
+        """
+        Return an iterator over the bindings (to symbols) for which 'rule'
+        matches, in the order that IF.apply would find them, unless
+        may_reorder(rule).
+        """
+        if not self.may_reorder(rule):
+            return self._function(rule, None)(_InStringOrder(self.memory))
+        plans = []
+        orders = []
+        for branch in antecedent_branches(rule.antecedent()):
+            order = None
+            if isinstance(branch, AND):
+                order = plan_conjunction(list(branch), self.memory)
+            if order != None:
+                plans.append([branch[i] for i in order])
+                order = tuple(order)
+            orders.append(order)
+        function = self._function(rule, tuple(orders))
+        if function is None:
+            function = self._function(rule, None)
+        self.explain_plans(rule, plans)
+        return function(self.memory)
+
+    def fire(self, rule, bindings, new_data, old_data_count=None,
+             apply_only_one=False, verbose=False):
+        """
+        IF.fire, for bindings to symbols and a set of facts 'new_data'.
+        """
+        actions, deletes = self.clauses[rule]
+        if old_data_count == None: old_data_count = len(new_data)
+        for k in bindings:
+            for a in actions:
+                fact = a.render(k)
+                new_data.add(fact)
+                if len(new_data) != old_data_count:
+                    old_data_count = len(new_data)
+                    if verbose:
+                        print "Rule:", rule
+                        print "Added assertion:", self.symbols.render(fact)
+                    if apply_only_one:
+                        return True
+            for d in deletes:
+                try:
+                    fact = d.render(k)
+                    new_data.remove(fact)
+                    if len(new_data) != old_data_count:
+                        old_data_count = len(new_data)
+                        if verbose:
+                            print "Rule:", rule
+                            print "Deleted assertion:", \
+                                self.symbols.render(fact)
+                        if apply_only_one:
+                            return True
+                except KeyError:
+                    pass
+        return False
+
+def interned_chain(rules, data, apply_only_one=False, verbose=False,
+                   explain=False):
+    """
+    forward_chain(rules, data) with the assertions kept only as tuples of
+    symbols.  Falls back to chaining the usual way when some rule or
+    assertion can't be interned.
+    """
+    if not rules or not data:
+        return data
+    data = list(data)
+    symbols = SymbolTable()
+    facts = [symbols.parse(assertion) for assertion in data]
+    memory = InternedMemory(symbols, facts)
+    facts = None
+    try:
+        for assertion in data:
+            if AIOddSpaceRegex.search(assertion):
+                raise CantIntern, assertion
+        matcher = InternedMatcher(rules, memory, apply_only_one, explain)
+        if symbols.metacharacters:
+            # A NOT filled in with such a word is a regular expression.
+            raise CantIntern, symbols.names[min(symbols.metacharacters)]
+    except CantIntern:
+        return chain(rules, data, Matcher, apply_only_one, verbose, explain)
+
+    # Like chain(), the very first rule sees the data in the order it was
+    # given, and counts any duplicates in it.  After that the strings are
+    # let go, so that only the tuples are kept.
+    first_data = data
+    changed = True
+    while changed:
+        changed = False
+        for rule in rules:
+            if first_data != None:
+                bindings = _interned(symbols,
+                                     RuleExpression().test_term_matches(
+                                         rule.antecedent(), first_data))
+                data_count = len(first_data)
+            else:
+                bindings = matcher.bindings(rule)
+                data_count = None
+            pending = PendingChanges(memory)
+            matcher.fire(rule, bindings, pending, data_count, apply_only_one,
+                         verbose)
+            data = first_data = bindings = None
+            for fact in pending.order:
+                if pending.present[fact] != (fact in memory):
+                    changed = True
+                    break
+            pending.apply()
+            if changed:
+                break
+
+    return tuple(sorted([symbols.render(fact) for fact in memory]))
+
+def _interned(symbols, bindings):
+    "Generate these bindings (to words), bound to symbols instead."
+    for b in bindings:
+        yield dict([(name, symbols.intern(word))
+                    for name, word in b.iteritems()])
@@ -79,7 +79,7 @@ black_family_cousins = [
 #### Part 4: Backward Chaining #########################################
 
 # Import additional methods for backchaining
-from production import PASS, FAIL, match, populate, simplify, variables
+from backchain import tabled_backchain
 
 def backchain_to_goal_tree(rules, hypothesis):
     """
@@ -93,23 +93,11 @@ def backchain_to_goal_tree(rules, hypothesis):
     need to be tested. The leaves of this tree should be strings
     (possibly with unbound variables), *not* AND or OR objects.
     Make sure to use simplify(...) to flatten trees where appropriate.
+
+    Each distinct goal is expanded only once, and shared between the
+    rules that need it; see backchain.py.
     """
-    result = OR(hypothesis)
-    for rule in rules:
-        for cons in rule.consequent():
-            dic = match(cons, hypothesis)
-            if dic != None:
-                if isinstance(rule.antecedent(), AND):
-                    temp = AND()
-                    for preq in rule.antecedent():
-                        temp.append(backchain_to_goal_tree(rules, populate(preq, dic)))
-                    result.append(temp)
-                elif isinstance(rule.antecedent(), str):
-                    result.append(backchain_to_goal_tree(rules, populate(rule.antecedent(), dic)))
-                else:
-                    for preq in rule.antecedent():
-                        result.append(backchain_to_goal_tree(rules, populate(preq, dic)))
-    return simplify(result)
+    return tabled_backchain(rules, hypothesis)
 
 # Uncomment this to run your backward chainer:
 #print backchain_to_goal_tree(zookeeper_rules, 'opus is a penguin')
@@ -0,0 +1,292 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Stratified, parallel forward chaining.  You don't need this file for
+# Lab 1; it is used by
+#
+# >>> forward_chain(rules, data, engine='parallel')
+#
+# A rule depends on another when one of its conditions could match one of
+# the other's consequents.  The rules are split into strata, so that each
+# rule depends positively only on rules in its own stratum or lower ones,
+# and through a NOT only on lower ones.  Each stratum is then run to a
+# fixpoint in rounds: in every round, all of its rules are matched against
+# the same data, by a pool of worker processes that each own some of the
+# rules and a copy of the data, and everything they would add is merged in
+# rule order before the next round.
+#
+# For rules without DELETE clauses, and with apply_only_one=False, this
+# gives the same result as forward_chain() as long as every rule that
+# could produce something a NOT looks for (and every rule those depend on)
+# comes before the rule with the NOT.  Otherwise the rules are simply
+# chained as usual.
+#
+# With one CPU, the rules are matched in this process, so the rounds only
+# save the repeated matching of old data.  Run benchmark.py to compare this
+# engine with the default one.
+
+import multiprocessing
+from production import NOT, SemiNaiveMatcher, Matcher, WorkingMemory, chain
+from rete import nots_may_be_patterns
+from utils import compile_pattern
+
+def patterns_may_match(a, b):
+    """
+    Could some assertion match both of the patterns 'a' and 'b'?  This
+    only compares their constant words, so it may say yes when the answer
+    is no, but never the other way around.
+    """
+    a = compile_pattern(a)
+    b = compile_pattern(b)
+    if a.arity == None or b.arity == None:
+        return True
+    if a.arity != b.arity:
+        return False
+    b_constants = dict(b.constants)
+    for i, word in a.constants:
+        if b_constants.get(i, word) != word:
+            return False
+    return True
+
+def condition_patterns(condition, negated=False):
+    """
+    Return a list of (pattern, negated) pairs for the strings in an
+    antecedent; 'negated' is True for those inside a NOT.
+    """
+    if isinstance(condition, basestring):
+        return [(condition, negated)]
+    result = []
+    for c in condition:
+        result.extend(condition_patterns(c, negated or isinstance(condition,
+                                                                 NOT)))
+    return result
+
+def rule_dependencies(rules):
+    """
+    Return a list, parallel to 'rules', of dictionaries mapping the index
+    of each rule that rule depends on to True if it depends on it through
+    a NOT (and False otherwise).  A rule whose DELETE clause could remove
+    something that a condition matches counts as a NOT dependency too.
+    """
+    result = []
+    for rule in rules:
+        depends = {}
+        for pattern, negated in condition_patterns(rule.antecedent()):
+            for j, other in enumerate(rules):
+                for consequent in other.consequent() or ():
+                    if patterns_may_match(pattern, consequent):
+                        depends[j] = depends.get(j, False) or negated
+                        break
+                for deleted in other.delete_clause() or ():
+                    if patterns_may_match(pattern, deleted):
+                        depends[j] = True
+                        break
+        result.append(depends)
+    return result
+
+def stratify(rules):
+    """
+    Return the rules' strata, as a list of lists of rule indexes, lowest
+    first: each rule depends only on rules in its own stratum or lower
+    ones, and through a NOT only on lower ones.  Return None if there is
+    no such split, because some rule depends on itself through a NOT (or
+    a DELETE).
+    """
+    dependencies = rule_dependencies(rules)
+    components = _strongly_connected(dependencies)
+    component_of = {}
+    for c, members in enumerate(components):
+        for i in members:
+            component_of[i] = c
+
+    # Components come out of _strongly_connected() with the ones they
+    # depend on first, so each one's stratum can be found in turn.
+    level = []
+    for c, members in enumerate(components):
+        stratum = 0
+        for i in members:
+            for j, negated in dependencies[i].iteritems():
+                if component_of[j] == c:
+                    if negated:
+                        return None
+                else:
+                    stratum = max(stratum, level[component_of[j]] + negated)
+        level.append(stratum)
+
+    strata = [[] for i in range(max(level or [-1]) + 1)]
+    for i in range(len(rules)):
+        strata[level[component_of[i]]].append(i)
+    return strata
+
+def _strongly_connected(dependencies):
+    """
+    Tarjan's algorithm, without recursion.  Return the strongly connected
+    components of the dependency graph, each a sorted list of indexes, in
+    an order where each comes after the ones it depends on.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in range(len(dependencies)):
+        if root in index:
+            continue
+        work = [(root, iter(sorted(dependencies[root])))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(dependencies[child]))))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+    return components
+
+def follows_rule_order(rules, dependencies=None):
+    """
+    Does every rule that could produce something a NOT looks for, and
+    every rule that one depends on in turn, come before the rule with the
+    NOT?  Then forward_chain() only tries that rule once what the NOT
+    looks for can't change any more, just as in a stratified evaluation.
+    """
+    if dependencies is None:
+        dependencies = rule_dependencies(rules)
+    for i, depends in enumerate(dependencies):
+        frontier = [j for j, negated in depends.iteritems() if negated]
+        seen = set(frontier)
+        while frontier:
+            j = frontier.pop()
+            if j >= i:
+                return False
+            for k in dependencies[j]:
+                if k not in seen:
+                    seen.add(k)
+                    frontier.append(k)
+    return True
+
+
+class _RuleMatcher(object):
+    """
+    Some of the rules and a copy of the data, for one worker.  Each round,
+    it is told what was added since the last one, and returns the new
+    consequents of its rules in a stratum.
+    """
+    def __init__(self, rules, indexes, data):
+        self.rules = rules
+        self.indexes = set(indexes)
+        self.memory = WorkingMemory(data)
+        self.matcher = SemiNaiveMatcher(rules, self.memory)
+        self.memory.changes()
+
+    def round(self, added, stratum):
+        for assertion in added:
+            self.memory.add(assertion)
+        self.matcher.update(*self.memory.changes())
+        results = []
+        for i in stratum:
+            if i not in self.indexes:
+                continue
+            rule = self.rules[i]
+            patterns = [compile_pattern(a) for a in rule.consequent() or ()]
+            consequents = []
+            for bindings in self.matcher.bindings(rule):
+                for pattern in patterns:
+                    consequents.append(pattern.render(bindings))
+            results.append((i, consequents))
+        return results
+
+def _worker(connection, rules, indexes, data):
+    matcher = _RuleMatcher(rules, indexes, data)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        connection.send(matcher.round(*message))
+    connection.close()
+
+def parallel_chain(rules, data, verbose=False, processes=None):
+    """
+    forward_chain(rules, data) with the rules matched by 'processes' worker
+    processes (by default, one per CPU), one stratum at a time.  Falls
+    back to chaining the usual way when that wouldn't give the same result.
+    """
+    if not rules or not data:
+        return data
+    rules = list(rules)
+    dependencies = rule_dependencies(rules)
+    strata = stratify(rules)
+    if (strata is None or [rule for rule in rules if rule.delete_clause()]
+        or not follows_rule_order(rules, dependencies)
+        or nots_may_be_patterns(rules, data)):
+        return chain(rules, data, Matcher, False, verbose)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(rules)))
+    shares = [range(w, len(rules), processes) for w in range(processes)]
+    data = list(data)
+
+    if processes == 1:
+        local = _RuleMatcher(rules, shares[0], data)
+        workers = None
+    else:
+        workers = []
+        for share in shares:
+            connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, args=(child_connection, rules, share, data))
+            process.daemon = True
+            process.start()
+            workers.append((process, connection))
+
+    memory = set(data)
+    added = []
+    try:
+        for stratum in strata:
+            while True:
+                if workers is None:
+                    results = local.round(added, stratum)
+                else:
+                    for process, connection in workers:
+                        connection.send((added, stratum))
+                    results = []
+                    for process, connection in workers:
+                        results.extend(connection.recv())
+                results.sort()
+                added = []
+                for i, consequents in results:
+                    for assertion in consequents:
+                        if assertion not in memory:
+                            memory.add(assertion)
+                            added.append(assertion)
+                            if verbose:
+                                print "Rule:", rules[i]
+                                print "Added assertion:", assertion
+                if not added:
+                    break
+    finally:
+        if workers is not None:
+            for process, connection in workers:
+                connection.send(None)
+                process.join()
+    return tuple(sorted(memory))
@@ -14,7 +14,8 @@
 #   "conditions") and a "consequent" (also called an "action" in some places).
 # * The variable "data" generally represents a set of "assertions".
 
-import re
+import itertools
+import time
 from utils import *
 try:
     set()
@@ -29,7 +30,9 @@ except NameError:
         new_lst.sort()
         return new_lst
 
-def forward_chain(rules, data, apply_only_one=False, verbose=False):
+def forward_chain(rules, data, apply_only_one=False, verbose=False,
+                  engine=None, explain=False, strategy=None, memory=None,
+                  profile=None):
     """
     Apply a list of IF-expressions (rules) through a set of data (assertions)
     in order.  Return the modified data set that results from the rules.
@@ -38,17 +41,662 @@ def forward_chain(rules, data, apply_only_one=False, verbose=False):
     False, a rule that fires will do so for _all_ possible bindings of its
     variables at the same time, making the code considerably more efficient. In
     the end, only DELETE rules will act differently.
-    """
-    old_data = ()
 
-    while set(old_data) != set(data):
-        old_data = list(data)
-        for condition in rules:
-            data = condition.apply(data, apply_only_one, verbose)
-            if set(data) != set(old_data):
+    Set engine='rete' to match the rules incrementally with a Rete network
+    (see rete.py) instead of re-matching every rule against all of the data
+    on every pass.  The result is the same either way.
+
+    Set engine='semi-naive' to only look for bindings that use at least one
+    assertion added since a rule was last tried, the way Datalog engines
+    do.  This gives the same result for rules without DELETE clauses;
+    rules with them, and all rules when apply_only_one=True, are still
+    matched against all of the data.
+
+    Set engine='interned' to keep the assertions only as tuples of symbols
+    while chaining, and match the rules against those (see interned.py).
+    The data and the result are strings either way.  With a memory or a
+    profile, the rules are chained as usual instead, since those hold
+    strings.
+
+    Set engine='relational' to keep the assertions in tables, and find
+    the bindings of each rule with hash joins over whole relations (see
+    relational.py).  This pays off when there are very many assertions.
+
+    Set engine='parallel' to split the rules into strata by what they
+    depend on, and match the rules in each stratum in parallel, with one
+    worker process per CPU (see parallel.py).  Rules for which that could
+    change the result are chained as usual, and so are all of the rules
+    when apply_only_one=True or a memory or profile is given.
+
+    When the order of the bindings can't change the result (the rule has
+    no DELETE clause and apply_only_one is False), the conditions of an
+    AND are matched most selective first; see plan_conjunction().  Set
+    explain=True to print the order chosen for each rule.
+
+    When apply_only_one=True and no engine is given, the rules that could
+    fire are kept on an agenda (see agenda.py), so each change costs about
+    as much as the change itself.  Set strategy='recency' or
+    'specificity' to resolve conflicts other than by rule order; the
+    engines only fire in rule order.
+
+    Set memory to chain in some other working memory than a new
+    WorkingMemory, such as a SQLiteMemory on disk (see sqlmemory.py).
+    'data' is added to it first, and its checkpoint() is called after each
+    change, so that a run that stops part way can be resumed by chaining
+    in the same memory again.  A memory with committed checkpoints is
+    resumed as it is: 'data' is not added to it again, since that would
+    bring back assertions that were deleted.  The result is still returned
+    as a tuple.
+    Only some engines keep less in Python this way; see sqlmemory.py.
+
+    Set profile to a ChainStats (see rulestats.py) to count what each rule
+    does, and how long it takes.
+    """
+    if strategy != None and not apply_only_one:
+        raise ValueError, "A conflict-resolution strategy needs apply_only_one"
+    if ((engine != None or memory != None or profile != None)
+        and strategy not in (None, 'order')):
+        raise ValueError, ("Only rule order can be used with an engine, "
+                           "or with a given memory or profile")
+    if (apply_only_one and engine == None and memory == None
+        and profile == None):
+        from agenda import forward_chain_agenda
+        return forward_chain_agenda(rules, data, verbose, strategy or 'order')
+
+    if engine == None:
+        matcher_class = Matcher
+    elif engine == 'semi-naive':
+        matcher_class = SemiNaiveMatcher
+    elif engine == 'rete':
+        from rete import ReteMatcher
+        matcher_class = ReteMatcher
+    elif engine == 'interned':
+        if memory == None and profile == None:
+            from interned import interned_chain
+            return interned_chain(rules, data, apply_only_one, verbose,
+                                  explain)
+        matcher_class = Matcher
+    elif engine == 'relational':
+        from relational import RelationalMatcher
+        matcher_class = RelationalMatcher
+    elif engine == 'parallel':
+        if not apply_only_one and memory == None and profile == None:
+            from parallel import parallel_chain
+            return parallel_chain(rules, data, verbose)
+        matcher_class = Matcher
+    else:
+        raise ValueError, "Unknown forward_chain engine: %s" % engine
+
+    return chain(rules, data, matcher_class, apply_only_one, verbose, explain,
+                 memory, profile)
+
+def chain(rules, data, matcher_class, apply_only_one=False, verbose=False,
+          explain=False, memory=None, profile=None):
+    """
+    The main loop of forward_chain(), with the rules matched by an instance
+    of matcher_class (see Matcher), in 'memory' if it is given, and each
+    attempt recorded in the ChainStats 'profile' if it is given.
+
+    Try the rules in order, and fire the first one that changes the data;
+    then start again from the first rule, until none of them does.  The
+    bindings are generated while the rule fires, so its changes are held
+    back (see PendingChanges) until they have all been found.
+    """
+    if memory == None:
+        if not rules or not data:
+            return data # There is nothing to do
+        memory = WorkingMemory(data)
+        resuming = False
+    else:
+        resuming = len(memory) > 0
+        if not resuming and (not rules or not data):
+            return data
+        if not memory.checkpoints:
+            for assertion in data:
+                memory.add(assertion)
+        memory.changes()
+    matcher = matcher_class(rules, memory, apply_only_one, explain)
+    matcher.profile = profile
+
+    # The very first rule sees the data in the order it was given, and
+    # counts any duplicates in it, just like IF.apply would.  (Unless
+    # there was data in the memory already.)  It is only copied if it
+    # isn't a list or tuple already.
+    first_data = data_count = None
+    if not resuming:
+        first_data = data
+        if not isinstance(first_data, (list, tuple)):
+            first_data = list(data)
+        data_count = len(first_data)
+
+    changed = True
+    while changed:
+        changed = False
+        for rule in rules:
+            if profile != None:
+                started = time.time()
+            if first_data != None:
+                bindings = RuleExpression().test_term_matches(
+                    rule.antecedent(), first_data)
+            else:
+                bindings = matcher.bindings(rule)
+            if profile != None:
+                bindings = list(bindings)
+            pending = PendingChanges(memory)
+            rule.fire(bindings, pending, data_count, apply_only_one, verbose)
+            pending.apply()
+            first_data = data_count = None
+
+            added, removed = memory.changes()
+            if profile != None:
+                profile.record(rule, len(bindings), added, removed,
+                               time.time() - started)
+            if added or removed:
+                matcher.update(added, removed)
+                memory.checkpoint()
+                changed = True
                 break
 
-    return data
+    return tuple(sorted(memory))
+
+class PendingChanges(object):
+    """
+    The assertions that a rule adds to and removes from a working memory
+    as it fires, held back until apply().  Until then the memory stays as
+    it was, so the rule's bindings can still be generated from it; this
+    looks like the memory with the changes made, to IF.fire.
+    """
+    def __init__(self, memory):
+        self.memory = memory
+        self.present = {} # assertion -> whether it is there after the changes
+        self.order = [] # The changed assertions, in the order they changed
+        self.size = len(memory)
+
+    def __contains__(self, assertion):
+        present = self.present.get(assertion)
+        if present is None:
+            return assertion in self.memory
+        return present
+
+    def __len__(self):
+        return self.size
+
+    # add() and remove() are called for every binding a rule fires on, so
+    # they look the assertion up directly.
+
+    def add(self, assertion):
+        present = self.present.get(assertion)
+        if present is None:
+            if assertion in self.memory:
+                return
+            self.order.append(assertion)
+        elif present:
+            return
+        self.present[assertion] = True
+        self.size += 1
+
+    def remove(self, assertion):
+        present = self.present.get(assertion)
+        if present is None:
+            if assertion not in self.memory:
+                raise KeyError, assertion
+            self.order.append(assertion)
+        elif not present:
+            raise KeyError, assertion
+        self.present[assertion] = False
+        self.size -= 1
+
+    def apply(self):
+        "Make the changes to the memory."
+        for assertion in self.order:
+            if self.present[assertion]:
+                self.memory.add(assertion)
+            else:
+                self.memory.discard(assertion)
+        self.present = {}
+        self.order = []
+
+class WorkingMemory(JournaledSet):
+    """
+    A set of assertions, indexed by their number of words and by the word
+    in each position.  Matching a condition such as 'parent (?x) (?y)'
+    against it only looks at the three-word assertions that start with
+    'parent'.
+
+    Like a JournaledSet, it remembers what has changed since the last
+    call to changes().
+
+    chain() can use anything else with the same methods (see sqlmemory.py).
+    It calls checkpoint() after each rule that changes the data, which
+    does nothing here, and resumes a run in a memory whose 'checkpoints'
+    (how many of them have been committed) isn't 0.
+    """
+    def __init__(self, assertions = ()):
+        JournaledSet.__init__(self, assertions)
+        self._buckets = {} # (words,) or (words, position, word) -> set
+        self._sorted = {} # bucket key (or None for all) -> sorted list
+        self._distinct = {} # (words, position) -> number of distinct words
+        self.odd_spaces = 0 # How many assertions have AIOddSpaceRegex in them
+        self.checkpoints = 0 # Nothing is ever committed
+        for assertion in self:
+            self._index(assertion)
+
+    def _keys(self, assertion):
+        words = assertion.split(' ')
+        count = len(words)
+        return [(count,)] + [(count, i, w) for i, w in enumerate(words)]
+
+    def _index(self, assertion):
+        if AIOddSpaceRegex.search(assertion): self.odd_spaces += 1
+        for key in self._keys(assertion):
+            if key not in self._buckets:
+                self._buckets[key] = set()
+                if len(key) == 3:
+                    position = key[:2]
+                    self._distinct[position] = \
+                        self._distinct.get(position, 0) + 1
+            self._buckets[key].add(assertion)
+            self._sorted.pop(key, None)
+        self._sorted.pop(None, None)
+
+    def _unindex(self, assertion):
+        if AIOddSpaceRegex.search(assertion): self.odd_spaces -= 1
+        for key in self._keys(assertion):
+            bucket = self._buckets[key]
+            bucket.discard(assertion)
+            if not bucket:
+                del self._buckets[key]
+                if len(key) == 3:
+                    self._distinct[key[:2]] -= 1
+            self._sorted.pop(key, None)
+        self._sorted.pop(None, None)
+
+    def add(self, assertion):
+        is_new = assertion not in self
+        JournaledSet.add(self, assertion)
+        if is_new: self._index(assertion)
+
+    def remove(self, assertion):
+        JournaledSet.remove(self, assertion)
+        self._unindex(assertion)
+
+    def discard(self, assertion):
+        if assertion in self:
+            self.remove(assertion)
+
+    def checkpoint(self):
+        pass
+
+    def _bucket_key(self, pattern, bindings=None):
+        """
+        Return the key of the smallest bucket that holds every assertion
+        that could match 'pattern': None for all of them, or False if
+        there can't be any.
+        """
+        if pattern.arity == None:
+            return None
+        keys = [(pattern.arity, i, w) for i, w in pattern.constants]
+        if bindings:
+            keys.extend([(pattern.arity, i, bindings[name])
+                         for i, name in pattern.variable_words
+                         if name in bindings])
+        return self._smallest(keys or [(pattern.arity,)])
+
+    def _smallest(self, keys):
+        "Return the key of the smallest of these buckets, or False."
+        key = None
+        for k in keys:
+            if k not in self._buckets:
+                return False
+            if key == None or len(self._buckets[k]) < len(self._buckets[key]):
+                key = k
+        return key
+
+    def candidates(self, condition, bindings=None):
+        """
+        Return, in sorted order, the assertions that could match
+        'condition': those with the same number of words, and the
+        same word wherever 'condition' has a constant one, or a
+        variable that is already bound in 'bindings'.
+        """
+        key = self._bucket_key(compile_pattern(condition), bindings)
+        if key == False:
+            return []
+        return self._sorted_bucket(key)
+
+    def bucket(self, keys):
+        """
+        Return, in sorted order, the assertions in the smallest of the
+        buckets with these keys (see _keys()): a superset of the ones
+        that are in all of them.
+        """
+        key = self._smallest(keys)
+        if key == False:
+            return []
+        return self._sorted_bucket(key)
+
+    def _sorted_bucket(self, key):
+        result = self._sorted.get(key)
+        if result == None:
+            if key == None:
+                result = sorted(self)
+            else:
+                result = sorted(self._buckets[key])
+            self._sorted[key] = result
+        return result
+
+    def matches_any(self, condition):
+        """
+        Does any assertion match 'condition'?  A condition without
+        variables is simply looked up; otherwise only the smallest
+        bucket of candidates is searched, stopping at the first match.
+        """
+        pattern = compile_pattern(condition)
+        if pattern.literal:
+            return pattern.string in self
+        key = self._bucket_key(pattern)
+        if key == False:
+            return False
+        elif key == None:
+            bucket = self
+        else:
+            bucket = self._buckets[key]
+        for assertion in bucket:
+            if pattern.match(assertion) != None:
+                return True
+        return False
+
+    def estimate(self, condition, bound=()):
+        """
+        Estimate how many assertions will match 'condition' once the
+        variables named in 'bound' have values, assuming that the words
+        in different positions are independent.
+        """
+        pattern = compile_pattern(condition)
+        if pattern.arity == None:
+            return float(len(self))
+        sizes = [len(self._buckets.get((pattern.arity, i, w), ()))
+                 for i, w in pattern.constants]
+        if sizes:
+            size = float(min(sizes))
+        else:
+            size = float(len(self._buckets.get((pattern.arity,), ())))
+        for i, name in pattern.variable_words:
+            if name in bound:
+                size /= max(1, self._distinct.get((pattern.arity, i), 1))
+        return size
+
+class Matcher(object):
+    """
+    Finds the bindings for which each rule matches the working memory,
+    for chain().  This one simply matches the rule against all of it;
+    subclasses can keep state between calls, which update() tells them
+    about each change to the working memory.
+    """
+    def __init__(self, rules, memory, apply_only_one=False, explain=False):
+        self.rules = rules
+        self.memory = memory
+        self.apply_only_one = apply_only_one
+        self.explain = explain
+        self.profile = None # A ChainStats to count partial bindings in
+        self._plans = {} # rule -> the last join orders printed for it
+
+    def may_reorder(self, rule):
+        "Can this rule's bindings be found in any order?"
+        return not self.apply_only_one and not rule.delete_clause()
+
+    def bindings(self, rule):
+        """
+        Return an iterator over the bindings for which 'rule' matches: in
+        the order that IF.apply would find them, unless may_reorder(rule).
+        They are generated from the memory as they are used, so it must
+        not change until they all have been.
+
+        Rules are compiled into Python functions when they can be (see
+        codegen.py), and interpreted otherwise.
+        """
+        from codegen import compiled_bindings
+        counts = None
+        if self.profile != None:
+            counts = self.profile.rule(rule).partial
+        if not self.may_reorder(rule):
+            bindings = compiled_bindings(rule, self.memory, None, counts)
+            if bindings is None:
+                bindings = RuleExpression().test_term_matches(
+                    rule.antecedent(), self.memory)
+            return bindings
+        plans = []
+        bindings = compiled_bindings(rule, self.memory, plans, counts)
+        if bindings is None:
+            plans = []
+            bindings = planned_matches(rule.antecedent(), self.memory, plans)
+        self.explain_plans(rule, plans)
+        return bindings
+
+    def explain_plans(self, rule, plans):
+        "If explaining, print the join orders for 'rule' when they change."
+        if self.explain and plans and self._plans.get(rule) != plans:
+            self._plans[rule] = plans
+            print "Rule:", rule
+            for plan in plans:
+                print "Join order:", ', '.join([repr(c) for c in plan])
+
+    def update(self, added, removed):
+        pass
+
+class SemiNaiveMatcher(Matcher):
+    """
+    A Matcher that only looks for new bindings.  See semi_naive_matches().
+
+    Each rule remembers how much of the log of added assertions it had
+    seen when it was last matched.  Its old bindings have fired already,
+    and can't add anything new unless some assertion has been deleted
+    since, so only its new bindings need to be found.  The new assertions
+    are indexed in a WorkingMemory of their own, and the rounds are
+    compiled when they can be (see codegen.py).
+    """
+    def __init__(self, rules, memory, apply_only_one=False, explain=False):
+        Matcher.__init__(self, rules, memory, apply_only_one, explain)
+        self.added_log = [] # Assertions, in the order they were added
+        self.removals = 0
+        self.seen = {} # rule -> (len(added_log), removals) when last matched
+
+    def bindings(self, rule):
+        mark = self.seen.get(rule)
+        self.seen[rule] = (len(self.added_log), self.removals)
+        if (self.apply_only_one or mark == None or mark[1] != self.removals
+            or rule.delete_clause()
+            or not can_match_semi_naive(rule.antecedent())):
+            return Matcher.bindings(self, rule)
+        from codegen import compiled_semi_naive_bindings
+        delta = self.added_log[mark[0]:]
+        if not delta:
+            return []
+        delta = WorkingMemory(delta)
+        plans = []
+        bindings = compiled_semi_naive_bindings(rule, self.memory, delta,
+                                                plans)
+        if bindings is None:
+            plans = []
+            bindings = semi_naive_matches(rule.antecedent(), self.memory,
+                                          delta, plans)
+        self.explain_plans(rule, plans)
+        return bindings
+
+    def update(self, added, removed):
+        self.added_log.extend(added)
+        self.removals += len(removed)
+
+class _OldAssertions(object):
+    "The assertions in a WorkingMemory, except for some new ones."
+    def __init__(self, memory, new):
+        self.memory = memory
+        self.new = new
+
+    def candidates(self, condition, bindings=None):
+        return self._old(self.memory.candidates(condition, bindings))
+
+    def estimate(self, condition, bound=()):
+        return self.memory.estimate(condition, bound)
+
+    def __iter__(self):
+        return self._old(self.memory)
+
+    def _old(self, assertions):
+        new = self.new
+        for a in assertions:
+            if a not in new:
+                yield a
+
+def can_match_semi_naive(condition):
+    """
+    Can semi_naive_matches() handle this antecedent?  It must be a
+    string, an AND of strings and NOTs, or an OR of those.
+    """
+    if isinstance(condition, basestring):
+        return True
+    elif isinstance(condition, OR):
+        return all([can_match_semi_naive(c) for c in condition])
+    elif isinstance(condition, AND):
+        return all([isinstance(c, (basestring, NOT)) for c in condition])
+    return False
+
+def semi_naive_matches(condition, data, delta, plans=None):
+    """
+    Return an iterator over the bindings of 'condition' against 'data'
+    that use at least one assertion from 'delta', the assertions in
+    'data' that are new since the condition was last matched.
+
+    For an AND, the k-th positive condition is matched against only the
+    new assertions, the ones before it against only the old assertions,
+    and the ones after it against all of them, for each k in turn; so
+    each new binding is found exactly once.  NOTs are always checked
+    against all of the data.
+
+    If 'plans' is a list, the conditions of each AND are reordered by
+    plan_conjunction(), and the orders chosen are appended to it before
+    any bindings are generated.
+    """
+    if not delta:
+        return iter(())
+    if not isinstance(delta, WorkingMemory):
+        delta = WorkingMemory(delta)
+    if isinstance(condition, basestring):
+        return RuleExpression().basecase_bindings(condition, delta, {})
+    elif isinstance(condition, OR):
+        return itertools.chain(*[semi_naive_matches(branch, data, delta,
+                                                    plans)
+                                 for branch in condition])
+    else:
+        conditions = list(condition)
+        positions = [i for i, c in enumerate(conditions)
+                     if isinstance(c, basestring)]
+        old_data = _OldAssertions(data, delta)
+        rounds = []
+        for k, position in enumerate(positions):
+            sources = [None] * len(conditions)
+            for i in positions[:k]:
+                sources[i] = old_data
+            sources[position] = delta
+            order = None
+            if plans != None:
+                order = plan_conjunction(conditions, data, sources)
+            if order != None:
+                plans.append([conditions[i] for i in order])
+                ordered = [conditions[i] for i in order]
+                ordered_sources = [sources[i] for i in order]
+            else:
+                ordered, ordered_sources = conditions, sources
+            rounds.append(condition._test_matches_iter(data, ordered, None,
+                                                       ordered_sources))
+        return itertools.chain(*rounds)
+
+def plan_conjunction(conditions, data, sources=None):
+    """
+    Choose an order in which to match the conditions of an AND against
+    'data' (a WorkingMemory), most selective first.  Return a list of
+    indexes into 'conditions', or None if they can't be reordered.
+    'sources' is as for AND._test_matches_iter.
+
+    Positive conditions are picked greedily, by the number of assertions
+    that data.estimate() expects each to match given the variables bound
+    so far.  A NOT is matched as soon as all of its variables are bound;
+    a NOT whose variables weren't all bound where it was written (so that
+    it matched the bare pattern) is matched first.  Either way it means
+    the same as before, so the bindings are the same, up to order.
+
+    Only strings and NOTs of strings can be reordered, because nested
+    ANDs and ORs ignore the bindings from before them.
+    """
+    for c in conditions:
+        if not (isinstance(c, basestring) or
+                (isinstance(c, NOT) and len(c) == 1
+                 and isinstance(c[0], basestring))):
+            return None
+    if sources == None:
+        sources = [None] * len(conditions)
+    sources = [source or data for source in sources]
+    for source in sources:
+        if not hasattr(source, 'estimate'):
+            return None
+
+    order = []
+    positives = []
+    nots = []
+    bound = set()
+    for i, c in enumerate(conditions):
+        if isinstance(c, NOT):
+            if AIStringVars(c[0]) <= bound: nots.append(i)
+            else: order.append(i)
+        else:
+            positives.append(i)
+            bound |= AIStringVars(c)
+
+    bound = set()
+    while True:
+        for i in nots[:]:
+            if AIStringVars(conditions[i][0]) <= bound:
+                order.append(i)
+                nots.remove(i)
+        if not positives:
+            break
+        best = min([(sources[i].estimate(conditions[i], bound), i)
+                    for i in positives])[1]
+        order.append(best)
+        positives.remove(best)
+        bound |= AIStringVars(conditions[best])
+    return order
+
+def planned_matches(condition, data, plans=None):
+    """
+    Like RuleExpression().test_term_matches(condition, data), but with the
+    conditions of each AND reordered by plan_conjunction(), so the bindings
+    may come out in a different order.  If 'plans' is a list, the orders
+    chosen are appended to it before any bindings are generated.
+    """
+    if isinstance(condition, OR):
+        return itertools.chain(*[planned_matches(branch, data, plans)
+                                 for branch in condition])
+    elif isinstance(condition, AND):
+        conditions = list(condition)
+        order = plan_conjunction(conditions, data)
+        if order != None:
+            conditions = [conditions[i] for i in order]
+            if plans != None: plans.append(conditions)
+        return condition._test_matches_iter(data, conditions)
+    return RuleExpression().test_term_matches(condition, data)
+
+def explain_plan(condition, data):
+    """
+    Return the conditions of an AND in the order that plan_conjunction()
+    would match them against 'data' (any collection of assertions).
+    """
+    if not isinstance(data, WorkingMemory):
+        data = WorkingMemory(data)
+    order = plan_conjunction(list(condition), data)
+    if order == None:
+        return list(condition)
+    return [condition[i] for i in order]
 
 def instantiate(template, values_dict):
     """
@@ -65,7 +713,7 @@ def instantiate(template, values_dict):
         return template.__class__(*[populate(x, values_dict)
                                     for x in template])
     elif isinstance(template, basestring):
-        return AIStringToPyTemplate(template) % values_dict
+        return compile_pattern(template).render(values_dict)
     else: raise ValueError, "Don't know how to populate a %s" % \
       type(template)
 
@@ -82,28 +730,21 @@ def match(template, AIStr):
     to be substituted into template in order to make it equal to
     AIStr, or None if no such set exists.
     """
-    try:
-        return re.match( AIStringToRegex(template),
-                         AIStr ).groupdict()
-    except AttributeError: # The re.match() expression probably
-                           # just returned None
-        return None
+    return compile_pattern(template).match(AIStr)
 
 def is_variable(str):
     """Is 'str' a variable, of the form '(?x)'?"""
-    return isinstance(str, basestring) and str[0] == '(' and \
-      str[-1] == ')' and re.search( AIStringToRegex(str) )
+    return isinstance(str, basestring) and compile_pattern(str).is_variable()
 
 def variables(exp):
     """
     Return a dictionary containing the names of all variables in
     'exp' as keys, or None if there are no such variables.
     """
-    try:
-        return re.search( AIStringToRegex(exp).groupdict() )
-    except AttributeError: # The re.match() expression probably
-                           # just returned None
+    names = compile_pattern(exp).variables
+    if not names:
         return None
+    return dict.fromkeys(names)
 
 class IF(object):
     """
@@ -138,6 +779,10 @@ class IF(object):
         self._action = action
         self._delete_clause = delete_clause
 
+        # Compile the consequents and delete clauses once, up front
+        self._action_patterns = [compile_pattern(a) for a in action or ()]
+        self._delete_patterns = [compile_pattern(d) for d in delete_clause]
+
     def apply(self, data, apply_only_one=False, verbose=False):
         """
         Return a new set of data updated by the conditions and
@@ -153,30 +798,43 @@ class IF(object):
                                                       new_data)
 
         new_data = set(new_data)
+        self.fire(bindings, new_data, old_data_count, apply_only_one, verbose)
+        return tuple(sorted(new_data)) # Uniquify and sort the output list
+
+    def fire(self, bindings, new_data, old_data_count=None,
+             apply_only_one=False, verbose=False):
+        """
+        Fire this rule once for each set of bindings, in order, adding
+        its consequents to and deleting its delete clauses from the set
+        'new_data' in place.
+
+        If 'apply_only_one' is True, stop after the first change to
+        'new_data' and return True; otherwise return False.
+        """
+        if old_data_count == None: old_data_count = len(new_data)
         for k in bindings:
-            for a in self._action:
-                new_data.add( populate(a, k) )
+            for a in self._action_patterns:
+                new_data.add( a.render(k) )
                 if len(new_data) != old_data_count:
                     old_data_count = len(new_data) #update old_data_count
                     if verbose:
                         print "Rule:", self
-                        print "Added assertion:", populate(a, k)
+                        print "Added assertion:", a.render(k)
                     if apply_only_one:
-                        return tuple(sorted(new_data))
-            for d in self._delete_clause:
+                        return True
+            for d in self._delete_patterns:
                 try:
-                    new_data.remove( populate(d, k) )
+                    new_data.remove( d.render(k) )
                     if len(new_data) != old_data_count:
                         old_data_count = len(new_data) #update old_data_count
                         if verbose:
                             print "Rule:", self
-                            print "Deleted assertion:", populate(d, k)
+                            print "Deleted assertion:", d.render(k)
                         if apply_only_one:
-                            return tuple(sorted(new_data))
+                            return True
                 except KeyError:
                     pass
-
-        return tuple(sorted(new_data)) # Uniquify and sort the output list
+        return False
 
     def __str__(self):
         return "IF(%s, %s)" % (str(self._conditional),
@@ -188,6 +846,9 @@ class IF(object):
     def consequent(self):
         return self._action
 
+    def delete_clause(self):
+        return self._delete_clause
+
     __repr__ = __str__
 
 class RuleExpression(list):
@@ -222,8 +883,8 @@ class RuleExpression(list):
         Given an condition (which might be just a string), check
         it against the data (assertions).
         """
-        data = list(data)
-        if context_so_far == None: context_so_far = {}
+        if not hasattr(data, 'candidates'): data = list(data)
+        if context_so_far is None: context_so_far = EMPTY_BINDINGS
 
         # Deal with nesting first
         # If we're a nested term, we already have a test function; use it
@@ -235,15 +896,16 @@ class RuleExpression(list):
             return self.basecase_bindings(condition, data, context_so_far)
 
     def basecase_bindings(self, condition, data, context_so_far):
+        pattern = compile_pattern(condition)
+        context_so_far = Bindings.of(context_so_far)
+        if hasattr(data, 'candidates'):
+            data = data.candidates(pattern, context_so_far)
         for assertion in data:
-            bindings = match(condition, assertion)
+            bindings = pattern.match(assertion)
             if bindings is None: continue
-            try:
-                context = NoClobberDict(context_so_far)
-                context.update(bindings)
+            context = context_so_far.extend(bindings)
+            if context is not None:
                 yield context
-            except ClobberedDictKey:
-                pass
 
     def get_condition_vars(self):
         if hasattr(self, '_condition_vars'):
@@ -266,7 +928,7 @@ class RuleExpression(list):
         return type(self) == type(other) and list.__eq__(self, other)
 
     def __hash__(self):
-        return hash((self.__class__.__name__, list(self)))
+        return hash((self.__class__.__name__, tuple(self)))
 
 class AND(RuleExpression):
     """A conjunction of patterns, all of which must match."""
@@ -274,19 +936,24 @@ class AND(RuleExpression):
         pass
 
     def test_matches(self, data, context_so_far=None):
-        if context_so_far == None: context_so_far = {}
+        if context_so_far is None: context_so_far = {}
         return self._test_matches_iter(data, list(self))
 
-    def _test_matches_iter(self, data, conditions=None, cumulative_dict=None):
+    def _test_matches_iter(self, data, conditions=None, cumulative_dict=None,
+                           sources=None):
         """
         Recursively generate all possible matches.
+
+        If 'sources' is given, it is a list parallel to 'conditions'
+        giving the assertions to match each condition against (None
+        means 'data').
         """
         # Set default values for variables.  We can't set these
         # in the function header because values defined there are
         # class-local, and we need these to be reinitialized on
         # each function call.
-        if cumulative_dict == None:
-            cumulative_dict = NoClobberDict()
+        if cumulative_dict is None:
+            cumulative_dict = EMPTY_BINDINGS
 
         # If we have no more conditions to analyze, pass the
         # dictionary that we've accumulated back up the
@@ -297,17 +964,20 @@ class AND(RuleExpression):
 
         # Recursive Case
         condition = conditions[0]
-        for bindings in self.test_term_matches(condition, data,
+        condition_data = data
+        if sources:
+            if sources[0] is not None: condition_data = sources[0]
+            sources = sources[1:]
+        for bindings in self.test_term_matches(condition, condition_data,
                                                cumulative_dict):
-            bindings = NoClobberDict(bindings)
-
-            try:
-                bindings.update(cumulative_dict)
-                for bindings2 in self._test_matches_iter(data, conditions[1:],
-                                                         bindings):
-                    yield bindings2
-            except ClobberedDictKey:
-                pass
+            # A string's bindings extend cumulative_dict already; a nested
+            # expression's have to be combined with it.
+            if not isinstance(condition, basestring):
+                bindings = Bindings.of(cumulative_dict).extend(bindings)
+                if bindings is None: continue
+            for bindings2 in self._test_matches_iter(data, conditions[1:],
+                                                     bindings, sources):
+                yield bindings2
 
 
 class OR(RuleExpression):
@@ -321,7 +991,7 @@ class NOT(RuleExpression):
     """A RuleExpression for negation. A NOT clause must only have
     one part."""
     def test_matches(self, data, context_so_far=None):
-        if context_so_far == None: context_so_far = {}
+        if context_so_far is None: context_so_far = {}
         assert len(self) == 1 # We're unary; we can only process one condition
 
         try:
@@ -329,14 +999,19 @@ class NOT(RuleExpression):
         except KeyError:
             new_key = self[0]
 
-        matched = False
-        for x in self.test_term_matches(new_key, data):
-            matched = True
+        if (isinstance(new_key, basestring)
+            and hasattr(data, 'matches_any')):
+            matched = data.matches_any(new_key)
+        else:
+            matched = False
+            for x in self.test_term_matches(new_key, data):
+                matched = True
+                break
 
         if matched:
             return
         else:
-            yield NoClobberDict()
+            yield EMPTY_BINDINGS
 
 
 class THEN(list):
@@ -387,12 +1062,107 @@ def simplify(node):
     chaining.
     """
     if not isinstance(node, RuleExpression): return node
-    branches = uniq([simplify(x) for x in node])
-    if isinstance(node, AND):
-        return _reduce_singletons(_simplify_and(branches))
-    elif isinstance(node, OR):
-        return _reduce_singletons(_simplify_or(branches))
-    else: return node
+    return _Simplifier().simplify(node)
+
+class _Simplifier(object):
+    """
+    Simplifies AND/OR trees bottom-up, without recursion, the way
+    simplify() is described: each node's branches are simplified, their
+    duplicates removed (as uniq() would), and then the node is flattened.
+
+    The simplified nodes are hash-consed: each distinct one is kept once,
+    found by its class and its branches' keys, so identical subtrees come
+    out as the same object, and its key is just its id.  So two subtrees
+    are compared by their keys instead of by stringifying them, and a
+    node's key is hashed without looking inside its branches.  A node that
+    is shared in the input is only simplified once.
+
+    To find a node, its branches' keys are hashed as a polynomial, which
+    is worked out when the node is first shared.  A flattened branch's
+    hash then stands for all of the branches it brings along, so a deep
+    AND of ANDs is not hashed again at every level; only nodes with the
+    same hash are compared branch by branch.
+    """
+    _MODULUS = 2 ** 61 - 1
+    _BASE = 1000003
+
+    def __init__(self):
+        self._done = {} # id(input node) -> (simplified node, its key)
+        self._nodes = {} # (class, hash, length) -> the shared ANDs and ORs
+        self._shared = {} # id(shared node) -> (its hash, _BASE ** length)
+
+    def simplify(self, root):
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if id(node) in self._done:
+                stack.pop()
+                continue
+            if not isinstance(node, (AND, OR)):
+                # Strings, NOTs and the like are left as they are, and
+                # told apart by their strings, as uniq() does.
+                self._done[id(node)] = (node, str(node))
+                stack.pop()
+                continue
+            pending = [branch for branch in node
+                       if id(branch) not in self._done]
+            if pending:
+                stack.extend(reversed(pending))
+                continue
+            stack.pop()
+            seen = set()
+            branches = []
+            keys = []
+            for branch in node:
+                simplified, key = self._done[id(branch)]
+                if key not in seen:
+                    seen.add(key)
+                    branches.append(simplified)
+                    keys.append(key)
+            if isinstance(node, AND):
+                result = _reduce_singletons(_simplify_and(branches))
+            else:
+                result = _reduce_singletons(_simplify_or(branches))
+            result = self._share(result, branches, keys)
+            self._done[id(node)] = (result, self._key(result))
+        return self._done[id(root)][0]
+
+    def _key(self, node):
+        if isinstance(node, (AND, OR)):
+            return id(node)
+        return str(node)
+
+    def _share(self, node, branches, keys):
+        """
+        Return the shared node equal to 'node', whose branches are shared.
+        Unless it is shared already, 'node' was made by flattening
+        'branches', whose keys are 'keys'.
+        """
+        if not isinstance(node, (AND, OR)) or id(node) in self._shared:
+            return node
+        if not node:
+            branches = keys = () # PASS or FAIL, found before flattening
+        digest, scale = 0, 1
+        for branch, key in zip(branches, keys):
+            if isinstance(branch, node.__class__):
+                branch_digest, branch_scale = self._shared[key]
+            else:
+                branch_digest, branch_scale = hash(key), self._BASE
+            digest = (digest * branch_scale + branch_digest) % self._MODULUS
+            scale = scale * branch_scale % self._MODULUS
+        found = self._nodes.setdefault((node.__class__, digest, len(node)), [])
+        for shared in found:
+            if self._same_branches(shared, node):
+                return shared
+        found.append(node)
+        self._shared[id(node)] = (digest, scale)
+        return node
+
+    def _same_branches(self, a, b):
+        for x, y in zip(a, b):
+            if x is not y and self._key(x) != self._key(y):
+                return False
+        return True
 
 def _reduce_singletons(node):
     if not isinstance(node, RuleExpression): return node
@@ -0,0 +1,288 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Matching rules a whole relation at a time.  You don't need this file for
+# Lab 1; it is used by
+#
+# >>> forward_chain(rules, data, engine='relational')
+#
+# The assertions are kept in tables of symbols (see interned.py), one per
+# number of words, stored by column.  A condition such as 'parent (?x)
+# (?y)' selects a relation from a table: a list of rows of values for its
+# variables, here (x, y).  The relations for the conditions of an AND are
+# then combined with hash joins on their shared variables, smallest
+# first, and each NOT removes the rows that it matches (an anti-join).
+# So a rule's bindings are found in a few passes over whole lists, instead
+# of by extending one set of bindings at a time.
+#
+# The bindings come out in no particular order, so this is only used when
+# the order can't change the result: rules without DELETE clauses, with
+# apply_only_one=False.  Other rules, and antecedents with shapes that
+# can't be turned into joins (an OR nested in an AND, a NOT of anything but
+# a string, a variable inside a word), are matched the usual way.
+
+from production import AND, OR, NOT, Matcher
+from interned import SymbolTable, SymbolPattern, CantIntern
+from utils import AIOddSpaceRegex, AIStringVars
+
+class Table(object):
+    """
+    The assertions with some number of words, as one list of symbols per
+    word position.  Deleted rows are left as gaps until there are many
+    of them.
+    """
+    def __init__(self, arity):
+        self.arity = arity
+        self.columns = [[] for i in range(arity)]
+        self.live = [] # Is each row still there?
+        self.rows = {} # tuple of symbols -> its row
+        self.index = {} # (position, symbol) -> rows that have it there
+        self.dead = 0
+
+    def add(self, fact):
+        if fact in self.rows:
+            return
+        row = len(self.live)
+        self.rows[fact] = row
+        self.live.append(True)
+        for i, symbol in enumerate(fact):
+            self.columns[i].append(symbol)
+            self.index.setdefault((i, symbol), []).append(row)
+
+    def remove(self, fact):
+        row = self.rows.pop(fact, None)
+        if row is None:
+            return
+        self.live[row] = False
+        self.dead += 1
+        if self.dead > len(self.rows):
+            self._compact()
+
+    def _compact(self):
+        facts = self.rows.keys()
+        self.__init__(self.arity)
+        for fact in facts:
+            self.add(fact)
+
+    def select(self, pattern, unbindable):
+        """
+        Return the rows of values of the SymbolPattern's variables for the
+        assertions that match it, as a list of tuples.
+        """
+        rows = None
+        for key in pattern.constants:
+            candidates = self.index.get(key)
+            if candidates is None:
+                return []
+            if rows is None or len(candidates) < len(rows):
+                rows = candidates
+        if rows is None:
+            rows = xrange(len(self.live))
+        live = self.live
+        tests = [(self.columns[i], symbol) for i, symbol in pattern.constants]
+        columns = [self.columns[i] for i, name in pattern.variables]
+        result = []
+        for row in rows:
+            if not live[row]:
+                continue
+            for column, symbol in tests:
+                if column[row] != symbol:
+                    break
+            else:
+                values = tuple([column[row] for column in columns])
+                for value in values:
+                    if value in unbindable:
+                        break
+                else:
+                    result.append(values)
+        return result
+
+class Relation(object):
+    "Rows of values for some variables, in order."
+    def __init__(self, variables, rows):
+        self.variables = tuple(variables)
+        self.rows = rows
+
+def hash_join(left, right):
+    """
+    Return the Relation with a row for each pair of rows of 'left' and
+    'right' that agree on their shared variables.
+    """
+    shared = [v for v in left.variables if v in right.variables]
+    right_only = [i for i, v in enumerate(right.variables)
+                  if v not in left.variables]
+    left_keys = [left.variables.index(v) for v in shared]
+    right_keys = [right.variables.index(v) for v in shared]
+
+    table = {}
+    for row in right.rows:
+        key = tuple([row[i] for i in right_keys])
+        table.setdefault(key, []).append(tuple([row[i] for i in right_only]))
+    rows = []
+    for row in left.rows:
+        matches = table.get(tuple([row[i] for i in left_keys]))
+        if matches:
+            for extra in matches:
+                rows.append(row + extra)
+    return Relation(left.variables +
+                    tuple([right.variables[i] for i in right_only]), rows)
+
+def anti_join(left, right):
+    """
+    Return the rows of 'left' that agree with no row of 'right' on the
+    variables of 'right' (which must all be in 'left', unless it has no
+    rows).
+    """
+    if not left.rows:
+        return left
+    keys = [left.variables.index(v) for v in right.variables]
+    blocked = set(right.rows)
+    return Relation(left.variables,
+                    [row for row in left.rows
+                     if tuple([row[i] for i in keys]) not in blocked])
+
+class CantJoin(Exception):
+    "A flag that a condition can't be evaluated with joins."
+    pass
+
+class RelationalMatcher(Matcher):
+    """
+    A Matcher that keeps the assertions in Tables, and finds the bindings
+    of the rules whose order doesn't matter with joins.
+    """
+    def __init__(self, rules, memory, apply_only_one=False, explain=False):
+        Matcher.__init__(self, rules, memory, apply_only_one, explain)
+        self.symbols = SymbolTable()
+        self.tables = {} # number of words -> Table
+        self.odd_spaces = 0
+        self._patterns = {} # condition -> SymbolPattern, or None
+        for assertion in memory:
+            self._add(assertion)
+
+    def update(self, added, removed):
+        for assertion in removed:
+            if AIOddSpaceRegex.search(assertion): self.odd_spaces -= 1
+            fact = self.symbols.parse(assertion)
+            if len(fact) in self.tables:
+                self.tables[len(fact)].remove(fact)
+        for assertion in added:
+            self._add(assertion)
+
+    def _add(self, assertion):
+        if AIOddSpaceRegex.search(assertion): self.odd_spaces += 1
+        fact = self.symbols.parse(assertion)
+        if len(fact) not in self.tables:
+            self.tables[len(fact)] = Table(len(fact))
+        self.tables[len(fact)].add(fact)
+
+    def bindings(self, rule):
+        if not self.may_reorder(rule) or self.odd_spaces:
+            return Matcher.bindings(self, rule)
+        try:
+            relations = self.relations(rule.antecedent())
+        except CantJoin:
+            return Matcher.bindings(self, rule)
+        names = self.symbols.names
+        result = []
+        for relation in relations:
+            variables = relation.variables
+            for row in relation.rows:
+                result.append(dict([(v, names[symbol])
+                                    for v, symbol in zip(variables, row)]))
+        return result
+
+    def relations(self, condition):
+        """
+        Return a list of Relations whose rows together are the bindings of
+        'condition' (one for each branch of an OR).  Raise CantJoin if
+        that can't be done with joins.
+        """
+        if isinstance(condition, OR):
+            result = []
+            for branch in condition:
+                result.extend(self.relations(branch))
+            return result
+        return [self.conjunction(condition)]
+
+    def _pattern(self, condition):
+        if condition not in self._patterns:
+            try:
+                self._patterns[condition] = SymbolPattern(condition,
+                                                          self.symbols)
+            except CantIntern:
+                self._patterns[condition] = None
+        if self._patterns[condition] is None:
+            raise CantJoin, condition
+        return self._patterns[condition]
+
+    def select(self, condition):
+        pattern = self._pattern(condition)
+        table = self.tables.get(pattern.arity)
+        rows = []
+        if table is not None:
+            rows = table.select(pattern, self.symbols.unbindable)
+        return Relation([name for i, name in pattern.variables], rows)
+
+    def conjunction(self, condition):
+        """
+        Return the Relation of bindings of a string, a NOT, or an AND of
+        strings, NOTs and ANDs, as RuleExpression().test_term_matches would
+        find them with no bindings to start with.
+        """
+        if isinstance(condition, (basestring, NOT)):
+            conditions = [condition]
+        elif isinstance(condition, AND):
+            conditions = list(condition)
+        else:
+            raise CantJoin, condition
+
+        relations = []
+        nots = [] # (the NOT's pattern, or None if it is matched as it is)
+        bound = set()
+        for c in conditions:
+            if isinstance(c, NOT):
+                if len(c) != 1 or not isinstance(c[0], basestring):
+                    raise CantJoin, c
+                # Like NOT.test_matches, fill the pattern in if all of its
+                # variables are bound so far, and match it as it is if not.
+                if AIStringVars(c[0]) <= bound:
+                    if self.symbols.metacharacters and AIStringVars(c[0]):
+                        # Filled in, the pattern might be a regular
+                        # expression.
+                        raise CantJoin, c
+                    nots.append(c[0])
+                elif self.select(c[0]).rows:
+                    return Relation((), [])
+            elif isinstance(c, basestring):
+                relations.append(self.select(c))
+                bound |= AIStringVars(c)
+            elif isinstance(c, AND):
+                # A nested AND ignores the bindings from before it.
+                relations.append(self.conjunction(c))
+                bound |= set(relations[-1].variables)
+            else:
+                raise CantJoin, c
+
+        result = self._join_all(relations)
+        for pattern in nots:
+            result = anti_join(result, self.select(pattern))
+        return result
+
+    def _join_all(self, relations):
+        """
+        Join the relations, starting with the smallest, and then always
+        with the smallest of those that share a variable with the result
+        so far (or of all of them, if none does).
+        """
+        if not relations:
+            return Relation((), [()])
+        relations = sorted(relations, key=lambda r: len(r.rows))
+        result = relations.pop(0)
+        while relations:
+            if not result.rows:
+                return result
+            connected = [r for r in relations
+                         if set(r.variables) & set(result.variables)]
+            nearest = (connected or relations)[0]
+            relations.remove(nearest)
+            result = hash_join(result, nearest)
+        return result
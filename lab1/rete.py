@@ -0,0 +1,597 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# An incremental matcher for the production system, based on the Rete
+# algorithm.  You don't need this file for Lab 1; it is used by
+#
+# >>> forward_chain(rules, data, engine='rete')
+#
+# which returns the same result as the default engine.  Instead of matching
+# every rule against all of the data on every pass, the rules are compiled
+# into a network that remembers, between cycles, which assertions match each
+# condition (the "alpha memories") and which combinations of assertions match
+# each prefix of an AND (the "beta memories").  Adding or deleting an
+# assertion then only propagates through the joins that it touches.
+#
+# Antecedents are compiled when they are made of strings, NOTs of strings,
+# ANDs of those, and ORs of any of the above.  Rules with other antecedents
+# (an OR nested inside an AND, say), or with a pattern that uses the same
+# variable twice, are matched the usual way.
+
+import heapq
+from production import AND, OR, NOT, Matcher
+from utils import AIStringVars, AIRegex, AIMetaRegex, compile_pattern
+
+class Token(object):
+    """
+    A partial match: one assertion matched by a condition, linked to the
+    token for the conditions before it, and the bindings accumulated so far.
+    Tokens passed on by a NOT node have no assertion.  'key' is the tuple
+    of all the assertions matched so far, which tokens are sorted by.
+    """
+    __slots__ = ('parent', 'assertion', 'bindings', 'node', 'children',
+                 'blockers', 'key')
+
+    def __init__(self, parent, assertion, bindings, node):
+        self.parent = parent
+        self.assertion = assertion
+        self.bindings = bindings
+        self.node = node
+        self.children = None # The tokens made from this one, if any
+        self.blockers = 0
+        if parent is None:
+            self.key = ()
+        else:
+            if parent.children is None:
+                parent.children = set()
+            parent.children.add(self)
+            self.key = parent.key
+        if assertion is not None:
+            self.key += (assertion,)
+
+    def assertions(self):
+        "Return the assertions matched by this token, in condition order."
+        return list(self.key)
+
+
+class AlphaMemory(object):
+    """
+    The assertions that match one condition pattern, together with the
+    bindings that each of them produces.  Join nodes look assertions up by
+    the values of the variables they join on, so those are indexed.
+    """
+    def __init__(self, pattern):
+        self.pattern = compile_pattern(pattern)
+        self.items = {}
+        self.indexes = {}
+        self.successors = []
+
+    def add_index(self, keys):
+        if keys and keys not in self.indexes:
+            index = {}
+            for assertion, bindings in self.items.iteritems():
+                values = tuple([bindings[k] for k in keys])
+                index.setdefault(values, {})[assertion] = bindings
+            self.indexes[keys] = index
+
+    def lookup(self, keys, values):
+        "Return the {assertion: bindings} that agree with 'values' on 'keys'."
+        if not keys:
+            return self.items
+        return self.indexes[keys].get(values, {})
+
+    def add(self, assertion, bindings):
+        self.items[assertion] = bindings
+        for keys, index in self.indexes.iteritems():
+            values = tuple([bindings[k] for k in keys])
+            index.setdefault(values, {})[assertion] = bindings
+
+    def remove(self, assertion):
+        bindings = self.items.pop(assertion)
+        for keys, index in self.indexes.iteritems():
+            values = tuple([bindings[k] for k in keys])
+            bucket = index[values]
+            del bucket[assertion]
+            if not bucket:
+                del index[values]
+        return bindings
+
+
+class BetaNode(object):
+    """
+    A node in the chain of tests for one antecedent.  It remembers the
+    tokens that have passed it, and passes each new one on to its child.
+    """
+    def __init__(self, network):
+        self.network = network
+        network.nodes.append(self)
+        self.child = None
+        self.production = None # The rule, if this node ends its chain
+        self.tokens = set()
+        self.fresh = set() # Tokens added since the last drain()
+        self.by_key = None # Once ordered_tokens() is called, key -> token,
+        self.ordered = None # the keys it last returned, in order,
+        self.unordered = None # and the keys of the tokens added since
+        # If this node ends a chain that can never lose a match (see
+        # ReteNetwork), the bindings of the matches since the last
+        # drain(), which are kept instead of tokens.
+        self.matches = None
+
+    def attach(self, parent):
+        "Become the child of 'parent', and catch up on its tokens."
+        parent.child = self
+        for token in list(parent.tokens):
+            self.left_activate(token)
+
+    def emit(self, parent_token, assertion, bindings):
+        if self.matches is not None:
+            self.matches.append(bindings)
+            return
+        token = Token(parent_token, assertion, bindings, self)
+        self.tokens.add(token)
+        if self.child is None:
+            self.fresh.add(token)
+        if assertion is not None:
+            self.network.index_token(token)
+        if self.by_key is not None:
+            self.by_key[token.key] = token
+            self.unordered.append(token.key)
+        if self.child is not None:
+            self.child.left_activate(token)
+        elif (self.production is not None
+              and self.network.listener is not None):
+            self.network.listener.token_added(self.production, token)
+
+    def remove_token(self, token):
+        "Remove a token, and everything derived from it, from the network."
+        for child in list(token.children or ()):
+            child.node.remove_token(child)
+        self.tokens.discard(token)
+        self.fresh.discard(token)
+        if token.assertion is not None:
+            self.network.unindex_token(token)
+        if self.by_key is not None:
+            del self.by_key[token.key] # Its key is dropped from the lists
+                                       # by ordered_tokens()
+        if token.parent is not None and token.parent.children:
+            token.parent.children.discard(token)
+        if self.child is not None:
+            self.child.left_deactivate(token)
+        elif (self.production is not None
+              and self.network.listener is not None):
+            self.network.listener.token_removed(self.production, token)
+
+    def drain(self):
+        """
+        Return the tokens added since the last call to drain(), or their
+        bindings if this node keeps matches instead of tokens.
+        """
+        if self.matches is not None:
+            matches, self.matches = self.matches, []
+            return matches
+        fresh, self.fresh = self.fresh, set()
+        return fresh
+
+    def ordered_tokens(self):
+        """
+        Return this node's tokens, sorted by their keys (the tokens at one
+        node all have different keys).  Only the tokens added since the
+        last call are sorted, and merged into the ones sorted before.
+        """
+        if self.by_key is None:
+            self.by_key = dict([(token.key, token) for token in self.tokens])
+            self.ordered = sorted(self.by_key)
+            self.unordered = []
+        by_key = self.by_key
+        if self.unordered:
+            self.unordered.sort()
+            ordered = []
+            last = None
+            for key in heapq.merge(self.ordered, self.unordered):
+                # A token may have been removed, or removed and made again.
+                if key != last and key in by_key:
+                    ordered.append(key)
+                    last = key
+            self.ordered = ordered
+            self.unordered = []
+        elif len(self.ordered) != len(by_key):
+            self.ordered = [key for key in self.ordered if key in by_key]
+        return [by_key[key] for key in self.ordered]
+
+    def left_activate(self, token):
+        raise NotImplementedError
+
+    def left_deactivate(self, token):
+        pass
+
+
+class RootNode(BetaNode):
+    "The top of a chain; holds a single token with no bindings."
+    def __init__(self, network):
+        BetaNode.__init__(self, network)
+        self.emit(None, None, {})
+
+
+class JoinNode(BetaNode):
+    """
+    Joins each token from its parent with each assertion matching a
+    positive condition, on the variables that they have in common.
+    """
+    def __init__(self, network, parent, alpha, keys, keep_matches=False):
+        BetaNode.__init__(self, network)
+        self.alpha = alpha
+        self.keys = keys
+        self.left_index = {}
+        if keep_matches:
+            self.matches = []
+        alpha.add_index(keys)
+        # Successors deeper in a chain must be activated first, so that an
+        # assertion matching two conditions of one rule is only joined once.
+        alpha.successors.insert(0, self)
+        self.attach(parent)
+
+    def _values(self, bindings):
+        return tuple([bindings[k] for k in self.keys])
+
+    def left_activate(self, token):
+        values = self._values(token.bindings)
+        self.left_index.setdefault(values, set()).add(token)
+        for assertion, bindings in self.alpha.lookup(self.keys,
+                                                     values).items():
+            new_bindings = dict(token.bindings)
+            new_bindings.update(bindings)
+            self.emit(token, assertion, new_bindings)
+
+    def left_deactivate(self, token):
+        values = self._values(token.bindings)
+        bucket = self.left_index[values]
+        bucket.discard(token)
+        if not bucket:
+            del self.left_index[values]
+
+    def right_activate(self, assertion, bindings):
+        for token in list(self.left_index.get(self._values(bindings), ())):
+            new_bindings = dict(token.bindings)
+            new_bindings.update(bindings)
+            self.emit(token, assertion, new_bindings)
+
+    def right_deactivate(self, assertion, bindings):
+        # The tokens for this assertion were already removed by the network.
+        pass
+
+
+class NegativeNode(BetaNode):
+    """
+    Passes on each token from its parent for which no assertion matches a
+    NOT condition.
+
+    Like NOT.test_matches, the condition is filled in with the bindings so
+    far when all of its variables are bound (keys are then its variables),
+    and otherwise is blocked by any assertion matching the bare pattern
+    (keys are then empty).
+    """
+    def __init__(self, network, parent, alpha, keys):
+        BetaNode.__init__(self, network)
+        self.alpha = alpha
+        self.keys = keys
+        self.left_index = {}
+        alpha.add_index(keys)
+        alpha.successors.insert(0, self)
+        self.attach(parent)
+
+    def _values(self, bindings):
+        return tuple([bindings[k] for k in self.keys])
+
+    def left_activate(self, token):
+        values = self._values(token.bindings)
+        self.left_index.setdefault(values, set()).add(token)
+        token.blockers = len(self.alpha.lookup(self.keys, values))
+        if token.blockers == 0:
+            self.emit(token, None, token.bindings)
+
+    def left_deactivate(self, token):
+        values = self._values(token.bindings)
+        bucket = self.left_index[values]
+        bucket.discard(token)
+        if not bucket:
+            del self.left_index[values]
+
+    def right_activate(self, assertion, bindings):
+        for token in list(self.left_index.get(self._values(bindings), ())):
+            token.blockers += 1
+            if token.blockers == 1:
+                for child in list(token.children or ()):
+                    self.remove_token(child)
+
+    def right_deactivate(self, assertion, bindings):
+        for token in list(self.left_index.get(self._values(bindings), ())):
+            token.blockers -= 1
+            if token.blockers == 0:
+                self.emit(token, None, token.bindings)
+
+
+class ReteNetwork(object):
+    """
+    A Rete network for a list of rules.  Feed it assertions with add()
+    and remove(); instantiations() then returns the bindings for which a
+    rule currently matches, without re-matching it against all the data.
+
+    If a 'listener' is given, its token_added(rule, token) and
+    token_removed(rule, token) methods are called whenever a rule starts
+    or stops matching for some token.  They must not change the network.
+
+    If 'append_only' is True, assertions are only ever added, and
+    instantiations() is only asked for fresh ones.  Then a rule without
+    NOTs can never stop matching, so its matches aren't kept as tokens:
+    just their bindings, until they are returned.
+    """
+    def __init__(self, rules=(), listener=None, append_only=False):
+        self.append_only = append_only
+        self.alphas = {}
+        # Like a WorkingMemory, the alpha memories are indexed by (number
+        # of words, position, word) for one of their constant words, or by
+        # (number of words,) if they have none, so that an assertion is
+        # only matched against the patterns that could fit it.
+        self._alphas_by_word = {}
+        self._alphas_anywhere = [] # Patterns that can't be indexed
+        self.productions = {}
+        self.listener = listener
+        self.nodes = [] # Every BetaNode
+        # The tokens for each assertion, to remove it by.  Many networks
+        # never have anything removed, so this is only built by the first
+        # call to remove().
+        self._tokens_by_assertion = None
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        if rule in self.productions:
+            return
+        terminals = self.productions[rule] = self._compile(rule.antecedent())
+        for terminal in terminals or ():
+            terminal.production = rule
+            if self.listener is not None:
+                for token in list(terminal.tokens):
+                    self.listener.token_added(rule, token)
+
+    def handles(self, rule):
+        "Is this rule's antecedent compiled into the network?"
+        return self.productions.get(rule) is not None
+
+    def _alpha(self, pattern):
+        alpha = self.alphas.get(pattern)
+        if alpha is None:
+            alpha = self.alphas[pattern] = AlphaMemory(pattern)
+            compiled = alpha.pattern
+            if compiled.arity is None:
+                self._alphas_anywhere.append(alpha)
+            elif compiled.constants:
+                position, word = compiled.constants[0]
+                self._alphas_by_word.setdefault(
+                    (compiled.arity, position, word), []).append(alpha)
+            else:
+                self._alphas_by_word.setdefault((compiled.arity,),
+                                                []).append(alpha)
+        return alpha
+
+    def _alphas_for(self, assertion):
+        "Return the alpha memories whose patterns could match 'assertion'."
+        words = assertion.split(' ')
+        count = len(words)
+        by_word = self._alphas_by_word
+        result = self._alphas_anywhere + by_word.get((count,), [])
+        for i, word in enumerate(words):
+            alphas = by_word.get((count, i, word))
+            if alphas:
+                result.extend(alphas)
+        return result
+
+    def _compile(self, condition):
+        """
+        Return the list of terminal nodes whose tokens are the matches of
+        'condition' (one per branch of an OR), or None if the condition
+        can't be compiled.
+        """
+        if isinstance(condition, OR):
+            terminals = []
+            for branch in condition:
+                branch_terminals = self._compile(branch)
+                if branch_terminals is None:
+                    return None
+                terminals.extend(branch_terminals)
+            return terminals
+
+        conditions = _flatten_and(condition)
+        if conditions is None:
+            return None
+        # An alpha memory matches its bare pattern, which can't be turned
+        # into a regular expression when a variable appears in it twice.
+        for cond in conditions:
+            if isinstance(cond, NOT):
+                cond = cond[0]
+            if _repeats_variable(cond):
+                return None
+
+        keep_matches = (self.append_only and self.listener is None and
+                        not [c for c in conditions if isinstance(c, NOT)])
+        node = RootNode(self)
+        bound = set()
+        for i, cond in enumerate(conditions):
+            if isinstance(cond, NOT):
+                pattern = cond[0]
+                pattern_vars = AIStringVars(pattern)
+                if pattern_vars <= bound:
+                    keys = tuple(sorted(pattern_vars))
+                else:
+                    keys = ()
+                node = NegativeNode(self, node, self._alpha(pattern), keys)
+            else:
+                pattern_vars = AIStringVars(cond)
+                keys = tuple(sorted(pattern_vars & bound))
+                node = JoinNode(self, node, self._alpha(cond), keys,
+                                keep_matches and i == len(conditions) - 1)
+                bound |= pattern_vars
+        return [node]
+
+    def index_token(self, token):
+        if self._tokens_by_assertion is not None:
+            self._tokens_by_assertion.setdefault(token.assertion,
+                                                 set()).add(token)
+
+    def unindex_token(self, token):
+        if self._tokens_by_assertion is None:
+            return
+        tokens = self._tokens_by_assertion.get(token.assertion)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_assertion[token.assertion]
+
+    def add(self, assertion):
+        for alpha in self._alphas_for(assertion):
+            if assertion in alpha.items:
+                continue
+            bindings = alpha.pattern.match(assertion)
+            if bindings is None:
+                continue
+            alpha.add(assertion, bindings)
+            for node in alpha.successors:
+                node.right_activate(assertion, bindings)
+
+    def remove(self, assertion):
+        if self.append_only:
+            raise ValueError, "Can't remove assertions from this network"
+        if self._tokens_by_assertion is None:
+            self._tokens_by_assertion = {}
+            for node in self.nodes:
+                for token in node.tokens:
+                    if token.assertion is not None:
+                        self.index_token(token)
+        for token in list(self._tokens_by_assertion.get(assertion, ())):
+            if token in token.node.tokens:
+                token.node.remove_token(token)
+        # Take the assertion out of every alpha memory before telling any
+        # NOT node, so that unblocked tokens can't be joined with it again.
+        removed = []
+        for alpha in self._alphas_for(assertion):
+            if assertion in alpha.items:
+                removed.append((alpha, alpha.remove(assertion)))
+        for alpha, bindings in removed:
+            for node in alpha.successors:
+                node.right_deactivate(assertion, bindings)
+
+    def instantiations(self, rule, fresh_only=False):
+        """
+        Return the bindings for which 'rule' currently matches, in the order
+        that IF.apply would find them in sorted data: branch by branch, and
+        then by the matched assertions.
+
+        If 'fresh_only' is True, only return the bindings that are new since
+        the last call, in no particular order.
+        """
+        result = []
+        for terminal in self.productions[rule]:
+            if terminal.matches is not None:
+                result.extend(terminal.drain())
+                continue
+            if fresh_only:
+                tokens = terminal.drain()
+            else:
+                terminal.drain()
+                tokens = terminal.ordered_tokens()
+            result.extend([token.bindings for token in tokens])
+        return result
+
+
+def _flatten_and(condition):
+    """
+    Return the conditions of an antecedent as a flat list of strings and
+    NOTs of strings, or None if it has some other shape.
+
+    A nested AND is matched without the bindings of the conditions before
+    it, so it can only be spliced in when it comes first or when it has no
+    NOTs whose meaning would change.
+    """
+    if isinstance(condition, basestring):
+        return [condition]
+    elif isinstance(condition, NOT):
+        if len(condition) == 1 and isinstance(condition[0], basestring):
+            return [condition]
+        return None
+    elif not isinstance(condition, AND):
+        return None
+
+    conditions = []
+    for i, cond in enumerate(condition):
+        flattened = _flatten_and(cond)
+        if flattened is None:
+            return None
+        if isinstance(cond, AND) and i > 0:
+            for c in flattened:
+                if isinstance(c, NOT):
+                    return None
+        conditions.extend(flattened)
+    return conditions
+
+def _repeats_variable(pattern):
+    variables = AIRegex.findall(pattern)
+    return len(set(variables)) < len(variables)
+
+def nots_may_be_patterns(rules, data):
+    """
+    Could a NOT in these rules be filled in with a word that has regular
+    expression metacharacters?  NOT.test_matches then matches the result
+    as a pattern, which a NegativeNode doesn't do, so the rules have to be
+    matched the usual way.  The words come from the data and the THEN
+    clauses.
+    """
+    if not [rule for rule in rules if _has_not(rule.antecedent())]:
+        return False
+    for assertion in data:
+        if AIMetaRegex.search(assertion):
+            return True
+    for rule in rules:
+        for consequent in rule.consequent() or ():
+            if AIMetaRegex.search(AIRegex.sub('', consequent)):
+                return True
+    return False
+
+def _has_not(condition):
+    if isinstance(condition, NOT):
+        return True
+    elif isinstance(condition, basestring):
+        return False
+    return bool([c for c in condition if _has_not(c)])
+
+
+class ReteMatcher(Matcher):
+    """
+    A Matcher that keeps the rules in a Rete network, for
+    forward_chain(rules, data, engine='rete').
+
+    chain() tries and fires the rules exactly as usual, so the result is
+    the same, DELETE rules and apply_only_one included.  When no rule
+    deletes anything and apply_only_one is False, a rule's old bindings
+    can't add anything new, so only its fresh ones are returned, and in
+    whatever order, since they all fire anyway.
+    """
+    def __init__(self, rules, memory, apply_only_one=False, explain=False):
+        Matcher.__init__(self, rules, memory, apply_only_one, explain)
+        self.fresh_only = not apply_only_one and not [
+            rule for rule in rules if rule.delete_clause()]
+        if nots_may_be_patterns(rules, memory):
+            self.network = ReteNetwork()
+        else:
+            self.network = ReteNetwork(rules, append_only=self.fresh_only)
+        for assertion in memory:
+            self.network.add(assertion)
+
+    def bindings(self, rule):
+        if not self.network.handles(rule):
+            return Matcher.bindings(self, rule)
+        return self.network.instantiations(rule, self.fresh_only)
+
+    def update(self, added, removed):
+        for assertion in removed:
+            self.network.remove(assertion)
+        for assertion in added:
+            self.network.add(assertion)
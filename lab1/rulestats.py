@@ -0,0 +1,97 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Counting what each rule does.  You don't need this file for Lab 1; it is
+# used by
+#
+# >>> stats = ChainStats()
+# >>> forward_chain(rules, data, profile=stats)
+# >>> print stats
+#
+# For each rule, forward_chain() records how often it was tried, how many
+# bindings it matched, how often it changed the data, how many assertions
+# it added and deleted, and how long all of that took.  For rules that are
+# compiled into Python (see codegen.py), it also counts the partial
+# bindings that got past each condition, which shows which join is the
+# expensive one.  Without profile=..., none of this is done.
+
+class RuleStats(object):
+    "What one rule did during forward chaining."
+    __slots__ = ('rule', 'attempts', 'matches', 'firings', 'added',
+                 'deleted', 'seconds', 'partial')
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.attempts = 0 # Times it was matched against the data
+        self.matches = 0 # Bindings found, over all attempts
+        self.firings = 0 # Attempts that changed the data
+        self.added = 0 # Assertions added
+        self.deleted = 0 # Assertions deleted
+        self.seconds = 0.0 # Time spent matching and firing it
+        self.partial = {} # condition -> partial bindings that got past it
+
+    def __str__(self):
+        return ("%d attempts, %d matches, %d firings, %d added, %d deleted, "
+                "%.4fs" % (self.attempts, self.matches, self.firings,
+                           self.added, self.deleted, self.seconds))
+
+    __repr__ = __str__
+
+class ChainStats(object):
+    """
+    The RuleStats of every rule tried during forward chaining.
+
+    If 'callback' is given, it is also called after each rule is tried,
+    as callback(rule, matches, added, removed, seconds), where 'added' and
+    'removed' are the lists of assertions that changed.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.rules = [] # RuleStats, in the order the rules were first tried
+        self._by_rule = {} # rule -> its RuleStats
+
+    def rule(self, rule):
+        "Return the RuleStats for 'rule'."
+        stats = self._by_rule.get(rule)
+        if stats is None:
+            stats = self._by_rule[rule] = RuleStats(rule)
+            self.rules.append(stats)
+        return stats
+
+    def record(self, rule, matches, added, removed, seconds):
+        "Count one attempt at matching and firing 'rule'."
+        stats = self.rule(rule)
+        stats.attempts += 1
+        stats.matches += matches
+        if added or removed:
+            stats.firings += 1
+        stats.added += len(added)
+        stats.deleted += len(removed)
+        stats.seconds += seconds
+        if self.callback is not None:
+            self.callback(rule, matches, added, removed, seconds)
+
+    def seconds(self):
+        return sum([stats.seconds for stats in self.rules])
+
+    def slowest(self, count=None):
+        "Return the RuleStats, the ones that took the most time first."
+        result = sorted(self.rules, key=lambda stats: -stats.seconds)
+        return result[:count]
+
+    def report(self, count=None):
+        """
+        Return a summary of the 'count' slowest rules (or all of them),
+        one line each, with their partial bindings under them.
+        """
+        total = self.seconds() or 1.0
+        lines = []
+        for stats in self.slowest(count):
+            lines.append("%5.1f%% %s" % (100 * stats.seconds / total,
+                                         stats.rule))
+            lines.append("       %s" % stats)
+            for condition, passed in sorted(stats.partial.items(),
+                                            key=lambda item: -item[1]):
+                lines.append("       %8d past %r" % (passed, condition))
+        return '\n'.join(lines)
+
+    __str__ = report
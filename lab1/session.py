@@ -0,0 +1,173 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# A long-lived production system.  You don't need this file for Lab 1.
+#
+# forward_chain() takes all of the data at once.  A ProductionSession keeps
+# its rules and data alive instead, so that assertions can be added and
+# retracted one at a time while the derived assertions are kept up to date:
+#
+# >>> session = ProductionSession(family_rules, simpsons_data)
+# >>> session.assert_fact('parent bart rod')
+# >>> session.query('grandparent (?x) rod')
+# [{'x': 'homer'}, {'x': 'marge'}]
+# >>> session.retract('parent bart rod')
+#
+# The rules are matched by a Rete network (see rete.py).  Each derived
+# assertion remembers the rule instantiations that justify it (truth
+# maintenance), so retracting an assertion only un-derives the assertions
+# that depended on it.
+
+from production import RuleExpression, WorkingMemory, populate
+from rete import ReteNetwork
+from parallel import stratify
+
+class ProductionSession(object):
+    """
+    A set of rules, and a set of assertions that is kept closed under them.
+
+    Assertions made with assert_fact() are 'base' assertions.  An assertion
+    is present when it is a base assertion or some current instantiation of
+    a rule's THEN clause justifies it, unless some current instantiation of
+    a rule's DELETE clause defeats it.  So, unlike forward_chain(), a DELETE
+    only holds while the rule that made it still matches.
+
+    For rules without NOTs or DELETEs, the assertions are exactly those that
+    forward_chain() returns.  The rules must be stratified (see
+    parallel.stratify): no rule may depend, directly or through others, on
+    what it adds or deletes itself through a NOT or a DELETE, since such an
+    instantiation would take away its own reason to hold.  Otherwise a
+    ValueError is raised.
+    """
+    def __init__(self, rules, data=()):
+        self.rules = list(rules)
+        if stratify(self.rules) is None:
+            raise ValueError, ("ProductionSession can't keep rules up to "
+                               "date that depend on themselves through a "
+                               "NOT or a DELETE")
+        self._base = set()
+        self._support = {} # assertion -> tokens whose THEN clause adds it
+        self._defeat = {} # assertion -> tokens whose DELETE clause removes it
+        self._memory = WorkingMemory() # The assertions present right now
+        self._to_remove = [] # Assertions to take out of the network
+        self._to_check = [] # Assertions whose status may have changed
+
+        self._network = ReteNetwork((), self)
+        for rule in self.rules:
+            self._network.add_rule(rule)
+            if not self._network.handles(rule):
+                raise ValueError, \
+                    "ProductionSession can't compile the rule %s" % rule
+        for assertion in data:
+            self.assert_fact(assertion)
+
+    #### The public interface
+
+    def assert_fact(self, assertion):
+        "Add a base assertion, and derive its consequences."
+        self._base.add(assertion)
+        self._to_check.append(assertion)
+        self._run()
+
+    def retract(self, assertion):
+        """
+        Remove a base assertion, and un-derive whatever depended on it.
+        An assertion that is also justified by the rules stays present.
+        """
+        self._base.discard(assertion)
+        self._to_remove.append(assertion)
+        self._to_check.append(assertion)
+        self._run()
+
+    def query(self, pattern):
+        """
+        Return a list of the bindings for which 'pattern' (an assertion
+        with variables, or an AND/OR/NOT expression) matches the current
+        assertions.
+        """
+        return [dict(bindings) for bindings in
+                RuleExpression().test_term_matches(pattern, self._memory)]
+
+    def facts(self):
+        "Return all of the current assertions, sorted."
+        return tuple(sorted(self._memory))
+
+    def is_base(self, assertion):
+        return assertion in self._base
+
+    def justifications(self, assertion):
+        """
+        Return a list of (rule, bindings) pairs, one for each current
+        instantiation whose THEN clause adds 'assertion'.
+        """
+        return [(token.node.production, dict(token.bindings))
+                for token in self._support.get(assertion, ())]
+
+    def __contains__(self, assertion):
+        return assertion in self._memory
+
+    def __len__(self):
+        return len(self._memory)
+
+    #### Truth maintenance
+
+    # Whenever a justification is lost, the assertion it justified is
+    # taken out even if it has others ("delete and rederive"), since those
+    # others may depend, in a cycle, on the assertion itself.  Taking it
+    # out removes every token built on it, so the justifications that
+    # survive are well-founded, and the assertion is then put back if any
+    # of them do.
+
+    def token_added(self, rule, token):
+        for a in rule.consequent():
+            assertion = populate(a, token.bindings)
+            self._support.setdefault(assertion, set()).add(token)
+            self._to_check.append(assertion)
+        for d in rule.delete_clause():
+            assertion = populate(d, token.bindings)
+            self._defeat.setdefault(assertion, set()).add(token)
+            self._to_remove.append(assertion)
+            self._to_check.append(assertion)
+
+    def token_removed(self, rule, token):
+        for a in rule.consequent():
+            assertion = populate(a, token.bindings)
+            self._discard(self._support, assertion, token)
+            if assertion not in self._base:
+                self._to_remove.append(assertion)
+            self._to_check.append(assertion)
+        for d in rule.delete_clause():
+            assertion = populate(d, token.bindings)
+            self._discard(self._defeat, assertion, token)
+            self._to_check.append(assertion)
+
+    def _discard(self, table, assertion, token):
+        tokens = table.get(assertion)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del table[assertion]
+
+    def _is_justified(self, assertion):
+        return ((assertion in self._base or assertion in self._support)
+                and assertion not in self._defeat)
+
+    def _run(self):
+        """
+        Bring the network up to date with the queued changes, taking
+        assertions out before putting any back in.
+        """
+        while self._to_remove or self._to_check:
+            if self._to_remove:
+                assertion = self._to_remove.pop()
+                if assertion in self._memory:
+                    self._memory.remove(assertion)
+                    self._network.remove(assertion)
+                continue
+            assertion = self._to_check.pop()
+            if self._is_justified(assertion):
+                if assertion not in self._memory:
+                    self._memory.add(assertion)
+                    self._network.add(assertion)
+            elif assertion in self._memory:
+                self._to_remove.append(assertion)
+        self._memory.changes()
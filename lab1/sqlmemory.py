@@ -0,0 +1,348 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# A working memory on disk.  You don't need this file for Lab 1; it is used
+# by
+#
+# >>> memory = SQLiteMemory('family.db')
+# >>> forward_chain(rules, data, memory=memory)
+# >>> memory.close()
+#
+# The assertions are kept in a SQLite database instead of Python sets, with
+# the same index as a WorkingMemory: each assertion's words are stored in a
+# table keyed by (number of words, position, word), so a condition such as
+# 'parent (?x) (?y)' only reads the three-word assertions that start with
+# 'parent'.  Assertions that are added or deleted are collected in memory,
+# and written out in batches just before the next lookup.  The buckets that
+# were looked up most recently are kept in memory too, up to 'cache_size'
+# assertions in all, until something is added to or deleted from them.
+#
+# forward_chain() calls checkpoint() each time a rule has changed the data,
+# which commits the changes every 'commit_every' times.  If a run stops
+# part way, the database holds the data as of the last commit, and chaining
+# again in the same memory picks up from there: forward_chain() doesn't add
+# its 'data' again once a checkpoint has been committed, and always starts
+# again from the first rule anyway, so the result is the same as if it had
+# never stopped.
+#
+# Only some of the engines keep the memory use bounded this way.  With the
+# default one (and with engine='interned' or 'parallel', which use it when
+# given a memory), nothing but the caches above and the changes made by one
+# rule at a time are kept in Python.  engine='semi-naive' also keeps a list
+# of every assertion added, and 'rete' and 'relational' keep their own
+# copies of the assertions in Python, so they save no memory at all.  Either
+# way, forward_chain() returns every assertion as one tuple at the end.
+
+import sqlite3
+from collections import OrderedDict
+from utils import AIOddSpaceRegex, compile_pattern
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assertions (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE,
+    arity INTEGER NOT NULL,
+    odd INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assertions_by_arity ON assertions (arity, text);
+CREATE TABLE IF NOT EXISTS words (
+    arity INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    fact INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS words_by_word ON words (arity, position, word, fact);
+CREATE INDEX IF NOT EXISTS words_by_fact ON words (fact);
+CREATE TABLE IF NOT EXISTS progress (checkpoints INTEGER NOT NULL);
+"""
+
+class SQLiteMemory(object):
+    """
+    A set of assertions in a SQLite database at 'path' (by default, one
+    that only lives in memory), with the methods of a WorkingMemory.  If
+    the database already has assertions in it, they are kept, and
+    'assertions' are added to them.
+
+    Changes are written to the database 'batch_size' assertions at a time,
+    or sooner when it is read, and committed every 'commit_every' calls to
+    checkpoint().  Set commit_every=1 to lose nothing but the step in
+    progress if a run stops; each commit costs about as much as several
+    rules' worth of lookups.  Up to 'cache_size' assertions are kept in
+    the buckets cached by bucket().
+    """
+    def __init__(self, path=':memory:', assertions=(), batch_size=1000,
+                 commit_every=100, cache_size=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.cache_size = cache_size
+        self._db = sqlite3.connect(path)
+        self._db.text_factory = str
+        self._db.executescript(_SCHEMA)
+        self._added = set() # Assertions not written out yet
+        self._removed = set() # Assertions not deleted from the database yet
+        self._touched = {} # assertion -> was it present at the last changes()?
+        self._distinct = {} # (words, position) -> (distinct words, size then)
+        self._uncommitted = 0
+        self._cache = OrderedDict() # bucket keys -> sorted assertions, in
+                                    # the order they were last looked up
+        self._cache_index = {} # key -> the bucket keys in _cache with it
+        self._cached = 0 # How many assertions are in _cache
+
+        row = self._db.execute("SELECT COUNT(*), SUM(odd), MAX(id) "
+                               "FROM assertions").fetchone()
+        self._size = row[0]
+        self.odd_spaces = row[1] or 0 # Assertions with AIOddSpaceRegex
+        self._next_id = (row[2] or 0) + 1
+        row = self._db.execute("SELECT checkpoints FROM progress").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO progress VALUES (0)")
+            self.checkpoints = 0
+        else:
+            self.checkpoints = row[0] # How many have been committed
+
+        for assertion in assertions:
+            self.add(assertion)
+        self.changes()
+        self._commit()
+
+    #### The set of assertions
+
+    def __contains__(self, assertion):
+        if assertion in self._added:
+            return True
+        elif assertion in self._removed:
+            return False
+        return self._db.execute("SELECT 1 FROM assertions WHERE text = ?",
+                                (assertion,)).fetchone() is not None
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        "Iterate over the assertions, in sorted order."
+        self.flush()
+        for row in self._db.execute("SELECT text FROM assertions "
+                                    "ORDER BY text"):
+            yield row[0]
+
+    def add(self, assertion):
+        present = assertion in self
+        self._touched.setdefault(assertion, present)
+        if present:
+            return
+        if assertion in self._removed:
+            self._removed.remove(assertion) # It is still in the database
+        else:
+            self._added.add(assertion)
+            if len(self._added) >= self.batch_size:
+                self.flush()
+        self._size += 1
+        if AIOddSpaceRegex.search(assertion): self.odd_spaces += 1
+
+    def remove(self, assertion):
+        present = assertion in self
+        self._touched.setdefault(assertion, present)
+        if not present:
+            raise KeyError, assertion
+        if assertion in self._added:
+            self._added.remove(assertion)
+        else:
+            self._removed.add(assertion)
+            if len(self._removed) >= self.batch_size:
+                self.flush()
+        self._size -= 1
+        if AIOddSpaceRegex.search(assertion): self.odd_spaces -= 1
+
+    def discard(self, assertion):
+        if assertion in self:
+            self.remove(assertion)
+
+    def changes(self):
+        """
+        Return the lists (added, removed) of assertions that differ from
+        the last call to changes(), and start a new journal.
+        """
+        added, removed = [], []
+        for assertion, was_present in self._touched.iteritems():
+            present = assertion in self
+            if present and not was_present: added.append(assertion)
+            elif was_present and not present: removed.append(assertion)
+        self._touched = {}
+        return added, removed
+
+    #### Writing to the database
+
+    def flush(self):
+        "Write the pending changes to the database (without committing)."
+        for assertion in self._removed:
+            self._uncache(assertion)
+        for assertion in self._added:
+            self._uncache(assertion)
+        if self._removed:
+            removed = [(a,) for a in self._removed]
+            self._db.executemany("DELETE FROM words WHERE fact = "
+                                 "(SELECT id FROM assertions WHERE text = ?)",
+                                 removed)
+            self._db.executemany("DELETE FROM assertions WHERE text = ?",
+                                 removed)
+            self._removed = set()
+        if self._added:
+            facts = []
+            words = []
+            for assertion in sorted(self._added):
+                split = assertion.split(' ')
+                facts.append((self._next_id, assertion, len(split),
+                              AIOddSpaceRegex.search(assertion) is not None))
+                words.extend([(len(split), i, word, self._next_id)
+                              for i, word in enumerate(split)])
+                self._next_id += 1
+            self._db.executemany("INSERT INTO assertions VALUES (?, ?, ?, ?)",
+                                 facts)
+            self._db.executemany("INSERT INTO words VALUES (?, ?, ?, ?)",
+                                 words)
+            self._added = set()
+
+    def checkpoint(self):
+        """
+        Mark the end of one step of forward chaining: commit everything so
+        far, if this is every commit_every'th call.
+        """
+        self.checkpoints += 1
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self._commit()
+
+    def _commit(self):
+        self.flush()
+        self._db.execute("UPDATE progress SET checkpoints = ?",
+                         (self.checkpoints,))
+        self._db.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        "Commit any changes, and close the database."
+        self._commit()
+        self._db.close()
+
+    #### Looking up assertions, as a WorkingMemory does
+
+    def bucket(self, keys):
+        """
+        Return, in sorted order, the assertions in all of the buckets with
+        these keys: (words,) for the assertions with that many words, or
+        (words, position, word) for those that also have that word there.
+        """
+        self.flush()
+        keys = tuple(sorted(set(keys)))
+        words = {} # position -> word
+        for key in keys:
+            if len(key) == 3 and words.setdefault(key[1], key[2]) != key[2]:
+                return []
+        if words and len(words) == keys[0][0]:
+            # Only one assertion has all of these words; look it up.
+            assertion = ' '.join([words[i] for i in range(len(words))])
+            if assertion in self:
+                return [assertion]
+            return []
+        result = self._cache.pop(keys, None)
+        if result is None:
+            result = self._select(keys)
+            self._cached += len(result)
+            for key in keys:
+                self._cache_index.setdefault(key, set()).add(keys)
+        self._cache[keys] = result
+        while self._cached > self.cache_size:
+            self._drop(self._cache.iterkeys().next())
+        return result
+
+    def _uncache(self, assertion):
+        "Forget the cached buckets that 'assertion' belongs in."
+        words = assertion.split(' ')
+        arity = len(words)
+        own = set([(arity,)] + [(arity, i, w) for i, w in enumerate(words)])
+        for key in own:
+            for keys in list(self._cache_index.get(key, ())):
+                if own.issuperset(keys):
+                    self._drop(keys)
+
+    def _drop(self, keys):
+        self._cached -= len(self._cache.pop(keys))
+        for key in keys:
+            cached = self._cache_index[key]
+            cached.discard(keys)
+            if not cached:
+                del self._cache_index[key]
+
+    def _select(self, keys):
+        words = [key for key in keys if len(key) == 3]
+        if not words:
+            return [row[0] for row in self._db.execute(
+                "SELECT text FROM assertions WHERE arity = ? ORDER BY text",
+                (keys[0][0],))]
+        query = " INTERSECT ".join(
+            ["SELECT fact FROM words WHERE arity = ? AND position = ? "
+             "AND word = ?"] * len(words))
+        arguments = [value for key in words for value in key]
+        return [row[0] for row in self._db.execute(
+            "SELECT text FROM assertions WHERE id IN (%s) ORDER BY text"
+            % query, arguments)]
+
+    def candidates(self, condition, bindings=None):
+        """
+        Return, in sorted order, the assertions that could match
+        'condition', as WorkingMemory.candidates() does.
+        """
+        pattern = compile_pattern(condition)
+        if pattern.arity == None:
+            return list(self)
+        keys = [(pattern.arity, i, w) for i, w in pattern.constants]
+        if bindings:
+            keys.extend([(pattern.arity, i, bindings[name])
+                         for i, name in pattern.variable_words
+                         if name in bindings])
+        return self.bucket(keys or [(pattern.arity,)])
+
+    def matches_any(self, condition):
+        "Does any assertion match 'condition'?"
+        pattern = compile_pattern(condition)
+        if pattern.literal:
+            return pattern.string in self
+        for assertion in self.candidates(pattern):
+            if pattern.match(assertion) != None:
+                return True
+        return False
+
+    def estimate(self, condition, bound=()):
+        """
+        Estimate how many assertions will match 'condition' once the
+        variables named in 'bound' have values, as WorkingMemory.estimate()
+        does.  The number of distinct words in each position is counted
+        again only once the data has grown by half since it last was.
+        """
+        pattern = compile_pattern(condition)
+        if pattern.arity == None:
+            return float(len(self))
+        self.flush()
+        if pattern.constants:
+            size = min([self._db.execute(
+                "SELECT COUNT(*) FROM words WHERE arity = ? AND position = ? "
+                "AND word = ?", (pattern.arity, i, w)).fetchone()[0]
+                        for i, w in pattern.constants])
+        else:
+            size = self._db.execute(
+                "SELECT COUNT(*) FROM assertions WHERE arity = ?",
+                (pattern.arity,)).fetchone()[0]
+        size = float(size)
+        for i, name in pattern.variable_words:
+            if name in bound:
+                size /= max(1, self._distinct_words(pattern.arity, i))
+        return size
+
+    def _distinct_words(self, arity, position):
+        distinct, counted_at = self._distinct.get((arity, position), (0, -1))
+        if counted_at < 0 or self._size > counted_at * 1.5:
+            distinct = self._db.execute(
+                "SELECT COUNT(DISTINCT word) FROM words WHERE arity = ? "
+                "AND position = ?", (arity, position)).fetchone()[0]
+            self._distinct[(arity, position)] = (distinct, self._size)
+        return distinct
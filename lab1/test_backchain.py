@@ -0,0 +1,83 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for backchain.py.  You don't need this file for Lab 1.  Run them
+# with
+#
+#   python -m unittest test_backchain
+
+import unittest
+from production import IF, AND, OR, THEN, match, populate, simplify
+from backchain import tabled_backchain, backchain_query, GoalEvaluator
+from lab1 import transitive_rule, backchain_to_goal_tree
+from data import zookeeper_rules, abc_data, poker_data, zoo_data
+
+def recursive_backchain(rules, hypothesis):
+    "backchain_to_goal_tree as it was, expanding every goal every time."
+    result = OR(hypothesis)
+    for rule in rules:
+        for consequent in rule.consequent():
+            bindings = match(consequent, hypothesis)
+            if bindings is None:
+                continue
+            antecedent = rule.antecedent()
+            if isinstance(antecedent, AND):
+                result.append(AND(*[recursive_backchain(rules,
+                                                        populate(c, bindings))
+                                    for c in antecedent]))
+            elif isinstance(antecedent, str):
+                result.append(recursive_backchain(
+                    rules, populate(antecedent, bindings)))
+            else:
+                for c in antecedent:
+                    result.append(recursive_backchain(rules,
+                                                      populate(c, bindings)))
+    return simplify(result)
+
+class TabledBackchainTest(unittest.TestCase):
+    def test_same_as_recursive_on_zookeeper(self):
+        for hypothesis in ['opus is a penguin', 'tim is a zebra',
+                           '(?x) is a bird', 'alice is a albatross']:
+            self.assertEqual(tabled_backchain(zookeeper_rules, hypothesis),
+                             recursive_backchain(zookeeper_rules, hypothesis))
+
+    def test_recursive_rule(self):
+        # The antecedent's (?y) isn't bound by the THEN clause.
+        tree = tabled_backchain([transitive_rule], 'a beats c')
+        self.assertTrue(isinstance(tree, OR))
+        self.assertEqual(tree[0], 'a beats c')
+        self.assertEqual(backchain_to_goal_tree([transitive_rule],
+                                                'a beats c'), tree)
+
+    def test_deep_chain(self):
+        # Far more rules in a row than the recursion limit.
+        rules = [IF('step %d' % (i + 1), THEN('step %d' % i))
+                 for i in range(5000)]
+        self.assertEqual(list(tabled_backchain(rules, 'step 0')),
+                         ['step %d' % i for i in range(5001)])
+
+    def test_recursive_rule_answers(self):
+        self.assertEqual(list(backchain_query([transitive_rule], 'a beats c',
+                                              abc_data)), [{}])
+        self.assertEqual(list(backchain_query([transitive_rule], 'c beats a',
+                                              abc_data)), [])
+        # Goals that recur are only looked up in the data, so long chains
+        # may be missed, but every answer must follow.
+        found = [b['x'] for b in backchain_query([transitive_rule],
+                                                 '(?x) beats pair', poker_data)]
+        self.assertTrue('two-pair' in found and 'three-of-a-kind' in found)
+        self.assertTrue(set(found) <= set([a.split(' ')[0]
+                                           for a in poker_data]))
+
+    def test_query(self):
+        self.assertEqual(list(backchain_query(zookeeper_rules,
+                                              '(?x) is an albatross',
+                                              zoo_data)), [{'x': 'tim'}])
+
+    def test_evaluator_shares_answers(self):
+        tree = tabled_backchain([transitive_rule], '(?x) beats c')
+        evaluator = GoalEvaluator(abc_data)
+        self.assertTrue(evaluator.holds(tree, {'x': 'a'}))
+        self.assertFalse(evaluator.holds(tree, {'x': 'c'}))
+
+if __name__ == '__main__':
+    unittest.main()
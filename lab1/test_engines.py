@@ -0,0 +1,90 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests that every forward_chain() engine gives the same result as the
+# default one.  You don't need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_engines
+
+import unittest
+from production import (IF, AND, OR, NOT, THEN, DELETE, forward_chain, chain,
+                        Matcher)
+from sqlmemory import SQLiteMemory
+from lab1 import transitive_rule, family_rules
+from data import (zookeeper_rules, abc_data, poker_data, minecraft_data,
+                  simpsons_data, black_data, zoo_data)
+
+ENGINES = ['semi-naive', 'rete', 'interned', 'relational', 'parallel']
+
+CASES = [([transitive_rule], abc_data),
+         ([transitive_rule], poker_data),
+         ([transitive_rule], minecraft_data),
+         (family_rules, simpsons_data),
+         (family_rules, black_data),
+         (zookeeper_rules, zoo_data)]
+
+DELETE_RULES = [IF(AND('a (?x)', 'a (?y)'), THEN('b (?x) (?y)'),
+                   DELETE('a (?y)')),
+                IF(OR('b (?x) 1', 'c (?x)'), THEN('d (?x)'),
+                   DELETE('c (?x)')),
+                IF(AND('d (?x)', NOT('e (?x)')), THEN('e (?x)'))]
+DELETE_DATA = ['a 1', 'a 2', 'a 3', 'c 4']
+
+# A DELETE with a variable the antecedent doesn't bind is ignored.
+UNBOUND_DELETE_RULES = [IF('p (?x)', THEN('q b'), DELETE('q (?q)'))]
+UNBOUND_DELETE_DATA = ['p a']
+
+# A NOT that uses a variable twice is only ever filled in, never matched
+# as a bare pattern.
+REPEATED_RULES = [IF(AND('person (?x)', NOT('same (?x) (?x)')),
+                     THEN('lonely (?x)'))]
+REPEATED_DATA = ['person a', 'same b b']
+
+class EngineTest(unittest.TestCase):
+    def assertSameAsDefault(self, rules, data, apply_only_one=False,
+                            **options):
+        if apply_only_one:
+            expected = chain(rules, data, Matcher, True)
+        else:
+            expected = forward_chain(rules, data)
+        self.assertEqual(forward_chain(rules, data, apply_only_one,
+                                       **options), expected)
+
+    def test_engines(self):
+        for rules, data in CASES + [(DELETE_RULES, DELETE_DATA),
+                                    (REPEATED_RULES, REPEATED_DATA),
+                                    (UNBOUND_DELETE_RULES,
+                                     UNBOUND_DELETE_DATA)]:
+            for engine in ENGINES:
+                self.assertSameAsDefault(rules, data, engine=engine)
+
+    def test_engines_apply_only_one(self):
+        for rules, data in CASES + [(DELETE_RULES, DELETE_DATA),
+                                    (REPEATED_RULES, REPEATED_DATA),
+                                    (UNBOUND_DELETE_RULES,
+                                     UNBOUND_DELETE_DATA)]:
+            self.assertSameAsDefault(rules, data, True)
+            for engine in ENGINES:
+                self.assertSameAsDefault(rules, data, True, engine=engine)
+
+    def test_sqlite_memory(self):
+        for rules, data in CASES + [(DELETE_RULES, DELETE_DATA)]:
+            for engine in [None, 'semi-naive', 'interned']:
+                self.assertSameAsDefault(rules, data, engine=engine,
+                                         memory=SQLiteMemory())
+
+    def test_strategies_reach_the_same_closure(self):
+        # Without NOTs or DELETEs, the order the rules fire in can't
+        # change what they add.
+        for data in [abc_data, poker_data, minecraft_data]:
+            for strategy in ['order', 'recency', 'specificity']:
+                self.assertSameAsDefault([transitive_rule], data, True,
+                                         strategy=strategy)
+
+    def test_strategies_need_the_agenda(self):
+        for engine in ENGINES:
+            self.assertRaises(ValueError, forward_chain, [transitive_rule],
+                              abc_data, True, engine=engine,
+                              strategy='recency')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for interned.py.  You don't need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_interned
+
+import unittest
+from production import IF, AND, OR, NOT, THEN, DELETE, forward_chain
+from interned import SymbolTable, SymbolPattern, InternedMemory, CantIntern
+from lab1 import transitive_rule, family_rules
+from data import poker_data, simpsons_data, black_data
+
+class SymbolPatternTest(unittest.TestCase):
+    def test_render(self):
+        symbols = SymbolTable()
+        pattern = SymbolPattern('(?x) beats (?y)', symbols)
+        a, b = symbols.intern('a'), symbols.intern('b')
+        self.assertEqual(pattern.render({'x': a, 'y': b}),
+                         symbols.parse('a beats b'))
+        self.assertRaises(KeyError, pattern.render, {'x': a})
+
+    def test_repeated_variables(self):
+        symbols = SymbolTable()
+        self.assertRaises(CantIntern, SymbolPattern, 'same (?x) (?x)',
+                          symbols)
+        pattern = SymbolPattern('same (?x) (?x)', symbols, True)
+        a = symbols.intern('a')
+        self.assertEqual(symbols.render(pattern.render({'x': a})), 'same a a')
+
+    def test_empty_word_is_zero(self):
+        symbols = SymbolTable()
+        self.assertEqual(symbols.parse('a  b')[1], 0)
+        self.assertTrue(0 in symbols.unbindable)
+
+class InternedMemoryTest(unittest.TestCase):
+    def test_buckets(self):
+        symbols = SymbolTable()
+        memory = InternedMemory(symbols, [symbols.parse(a) for a in
+                                          ['b beats c', 'a beats c', 'a x']])
+        beats = symbols.intern('beats')
+        self.assertEqual([symbols.render(f)
+                          for f in memory.sorted_bucket([(3, 1, beats)])],
+                         ['a beats c', 'b beats c'])
+        self.assertTrue(memory.matches_any('(?x) beats c'))
+        self.assertFalse(memory.matches_any('(?x) beats a'))
+        memory.remove(symbols.parse('a x'))
+        self.assertEqual(len(memory), 2)
+        self.assertRaises(KeyError, memory.remove, symbols.parse('a x'))
+
+class InternedChainTest(unittest.TestCase):
+    def test_same_as_default_engine(self):
+        for rules, data in [([transitive_rule], poker_data),
+                            (family_rules, simpsons_data),
+                            (family_rules, black_data)]:
+            for apply_only_one in (False, True):
+                self.assertEqual(forward_chain(rules, data, apply_only_one,
+                                               engine='interned'),
+                                 forward_chain(rules, data, apply_only_one))
+
+    def test_deletes_in_order(self):
+        rules = [IF(AND('a (?x)', NOT('b (?x)')), THEN('b (?x)'),
+                    DELETE('a (?x)')),
+                 IF(OR('b (?x)', 'c (?x)'), THEN('d (?x)'), DELETE('c (?x)'))]
+        data = ['a 2', 'a 1', 'a 2', 'c 3']
+        for apply_only_one in (False, True):
+            self.assertEqual(forward_chain(rules, data, apply_only_one,
+                                           engine='interned'),
+                             forward_chain(rules, data, apply_only_one))
+
+    def test_falls_back(self):
+        # A nested AND, and a word that would be a regular expression.
+        for rules, data in [
+            ([IF(AND(AND('a (?x)'), 'b (?x)'), THEN('c (?x)'))],
+             ['a 1', 'b 1']),
+            ([IF(AND('a (?x)', NOT('b (?x)')), THEN('c (?x)'))],
+             ['a x.y', 'b xzy'])]:
+            self.assertEqual(forward_chain(rules, data, engine='interned'),
+                             forward_chain(rules, data))
+
+if __name__ == '__main__':
+    unittest.main()
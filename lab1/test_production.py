@@ -0,0 +1,174 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for the forward chainer and simplify() in production.py.  You don't
+# need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_production
+
+import random
+import sys
+import unittest
+from StringIO import StringIO
+from production import (IF, AND, OR, NOT, THEN, DELETE, PASS, FAIL,
+                        forward_chain, simplify, uniq, WorkingMemory,
+                        PendingChanges, semi_naive_matches, explain_plan)
+from production import _reduce_singletons, _simplify_and, _simplify_or
+from codegen import compiled_semi_naive_bindings
+from lab1 import transitive_rule, family_rules
+from data import abc_data, poker_data, simpsons_data
+
+class PendingChangesTest(unittest.TestCase):
+    def test_changes_wait_for_apply(self):
+        memory = WorkingMemory(['a', 'b'])
+        memory.changes()
+        pending = PendingChanges(memory)
+        pending.add('c')
+        pending.remove('a')
+        pending.add('a')
+        pending.remove('b')
+        self.assertRaises(KeyError, pending.remove, 'b')
+        self.assertEqual(len(pending), 2)
+        self.assertTrue('c' in pending and 'b' not in pending)
+        self.assertEqual(sorted(memory), ['a', 'b'])
+        pending.apply()
+        self.assertEqual(sorted(memory), ['a', 'c'])
+        self.assertEqual(memory.changes(), (['c'], ['b']))
+
+class StreamedBindingsTest(unittest.TestCase):
+    def test_rule_doesnt_see_its_own_changes(self):
+        # Every binding is found before 'done' is added, as in IF.apply.
+        rules = [IF(AND('p (?a)', NOT('done')), THEN('done', 'q (?a)'))]
+        data = ['p 1', 'p 2', 'p 3']
+        expected = ('done', 'p 1', 'p 2', 'p 3', 'q 1', 'q 2', 'q 3')
+        for engine in [None, 'semi-naive', 'rete', 'interned', 'relational']:
+            self.assertEqual(forward_chain(rules, data, engine=engine),
+                             expected)
+
+    def test_deletes_while_matching(self):
+        rules = [IF(AND('a (?x)', 'a (?y)'), THEN('b (?x) (?y)'),
+                    DELETE('a (?y)'))]
+        self.assertEqual(forward_chain(rules, ['a 1', 'a 2']),
+                         rules[0].apply(['a 1', 'a 2']))
+
+class JoinOrderTest(unittest.TestCase):
+    rule = IF(AND('person (?x)', 'rare (?x)', NOT('done (?x)')),
+              THEN('found (?x)'))
+    data = ['person %d' % i for i in range(5)] + ['rare 3', 'done 4']
+
+    def test_most_selective_first(self):
+        # The NOT comes as soon as its variable is bound.
+        self.assertEqual(explain_plan(self.rule.antecedent(), self.data),
+                         ['rare (?x)', NOT('done (?x)'), 'person (?x)'])
+
+    def test_unbound_not_comes_first(self):
+        # Where it was written, the NOT matched the bare pattern.
+        self.assertEqual(explain_plan(AND('a (?x)', NOT('b (?y)'), 'c (?y)'),
+                                      ['a 1', 'c 2']),
+                         [NOT('b (?y)'), 'a (?x)', 'c (?y)'])
+
+    def test_explain(self):
+        output = StringIO()
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            result = forward_chain([self.rule], self.data, explain=True)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(result, forward_chain([self.rule], self.data))
+        # The first attempt matches the data as given, in written order;
+        # the plan is printed once, though the rule is tried again.
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["Rule: %s" % self.rule,
+                          "Join order: 'rare (?x)', NOT('done (?x)'), "
+                          "'person (?x)'"])
+
+class SemiNaiveTest(unittest.TestCase):
+    def test_same_as_default_engine(self):
+        for rules, data in [([transitive_rule], poker_data),
+                            (family_rules, simpsons_data)]:
+            self.assertEqual(forward_chain(rules, data, engine='semi-naive'),
+                             forward_chain(rules, data))
+
+    def test_compiled_rounds_match_interpreted(self):
+        memory = WorkingMemory(abc_data + ['c beats d', 'd beats e'])
+        delta = WorkingMemory(['c beats d', 'd beats e'])
+        expected = semi_naive_matches(transitive_rule.antecedent(), memory,
+                                      delta)
+        found = compiled_semi_naive_bindings(transitive_rule, memory, delta)
+        self.assertEqual(sorted([sorted(b.items()) for b in found]),
+                         sorted([sorted(b.items()) for b in expected]))
+
+def recursive_simplify(node):
+    "simplify() as it was written before it was made iterative."
+    if not isinstance(node, (AND, OR)): return node
+    branches = uniq([recursive_simplify(x) for x in node])
+    if isinstance(node, AND):
+        return _reduce_singletons(_simplify_and(branches))
+    return _reduce_singletons(_simplify_or(branches))
+
+def random_tree(rng, depth, shared):
+    "A random AND/OR tree that reuses the subtrees in 'shared'."
+    choice = rng.random()
+    if depth == 0 or choice < 0.2:
+        return rng.choice(['a', 'b', 'c', NOT('d'), PASS, FAIL])
+    if shared and choice < 0.4:
+        return rng.choice(shared)
+    kind = rng.choice([AND, OR])
+    node = kind(*[random_tree(rng, depth - 1, shared)
+                  for i in range(rng.randint(1, 4))])
+    shared.append(node)
+    return node
+
+class SimplifyTest(unittest.TestCase):
+    def assertSameAsRecursive(self, tree):
+        self.assertEqual(repr(simplify(tree)), repr(recursive_simplify(tree)))
+
+    def test_nested(self):
+        self.assertSameAsRecursive(
+            AND('a', AND('b', OR('c', OR('d', 'e')), 'a'), AND('b')))
+        self.assertSameAsRecursive(OR('a', AND('b', OR(PASS, 'c')), 'a'))
+        self.assertSameAsRecursive(AND('a', OR(), 'b'))
+        self.assertSameAsRecursive(OR(AND('a', 'b'), AND('a', 'b'),
+                                      AND('b', 'a')))
+
+    def test_shared(self):
+        sub = OR('a', AND('b', 'c'))
+        self.assertSameAsRecursive(AND(sub, OR(sub, 'd'), sub))
+        self.assertSameAsRecursive(OR(AND(sub, 'e'), AND(sub, 'e')))
+
+    def test_random(self):
+        rng = random.Random(6034)
+        for i in range(500):
+            self.assertSameAsRecursive(random_tree(rng, 5, []))
+
+    def test_deep(self):
+        # Far deeper than the recursion limit.
+        depth = 20000
+        tree = 'leaf'
+        for i in range(depth):
+            if i % 2:
+                tree = AND('and %d' % i, tree, 'and %d' % i)
+            else:
+                tree = OR(tree, 'or %d' % i)
+        node = simplify(tree)
+        for i in reversed(range(depth)):
+            if i % 2:
+                self.assertTrue(isinstance(node, AND))
+                self.assertEqual(len(node), 2)
+                node = node[1]
+            else:
+                self.assertTrue(isinstance(node, OR))
+                self.assertEqual(node[1], 'or %d' % i)
+                node = node[0]
+        self.assertEqual(node, 'leaf')
+
+    def test_deep_flattens(self):
+        # Each level copies the branches it flattens, so this is shallower.
+        depth = 3000
+        tree = 'leaf'
+        for i in range(depth):
+            tree = AND(tree, 'x %d' % i)
+        self.assertEqual(list(simplify(tree)),
+                         ['leaf'] + ['x %d' % i for i in range(depth)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for rete.py.  You don't need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_rete
+
+import unittest
+from production import IF, AND, OR, NOT, THEN, RuleExpression
+from rete import ReteNetwork
+
+RULE = IF(OR(AND('parent (?x) (?y)', 'parent (?y) (?z)'),
+             AND('step (?x) (?z)', NOT('done (?x)'))),
+          THEN('ancestor (?x) (?z)'))
+DATA = ['parent b c', 'parent a b', 'step a c', 'parent c d', 'step b d',
+        'done b', 'a\tb c']
+
+def expected_bindings(rule, data):
+    return list(RuleExpression().test_term_matches(rule.antecedent(),
+                                                   sorted(data)))
+
+class ReteNetworkTest(unittest.TestCase):
+    def test_instantiations_in_order(self):
+        network = ReteNetwork([RULE])
+        data = set()
+        for assertion in DATA:
+            network.add(assertion)
+            data.add(assertion)
+            self.assertEqual(network.instantiations(RULE),
+                             expected_bindings(RULE, data))
+        for assertion in ['parent a b', 'done b', 'step a c']:
+            network.remove(assertion)
+            data.discard(assertion)
+            self.assertEqual(network.instantiations(RULE),
+                             expected_bindings(RULE, data))
+        network.add('parent a b')
+        data.add('parent a b')
+        self.assertEqual(network.instantiations(RULE),
+                         expected_bindings(RULE, data))
+
+    def test_alpha_memories_only_see_assertions_that_fit(self):
+        network = ReteNetwork([RULE])
+        for assertion in DATA:
+            network.add(assertion)
+        self.assertEqual(sorted(network.alphas['parent (?x) (?y)'].items),
+                         ['parent a b', 'parent b c', 'parent c d'])
+        self.assertEqual(sorted(network.alphas['done (?x)'].items),
+                         ['done b'])
+
+    def test_append_only(self):
+        rule = IF(AND('parent (?x) (?y)', 'parent (?y) (?z)'),
+                  THEN('grandparent (?x) (?z)'))
+        network = ReteNetwork([rule], append_only=True)
+        network.add('parent a b')
+        network.add('parent b c')
+        self.assertEqual(network.instantiations(rule, True),
+                         [{'x': 'a', 'y': 'b', 'z': 'c'}])
+        network.add('parent c d')
+        self.assertEqual(network.instantiations(rule, True),
+                         [{'x': 'b', 'y': 'c', 'z': 'd'}])
+        self.assertEqual(network.instantiations(rule, True), [])
+        self.assertRaises(ValueError, network.remove, 'parent a b')
+
+if __name__ == '__main__':
+    unittest.main()
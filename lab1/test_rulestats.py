@@ -0,0 +1,61 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for rulestats.py.  You don't need this file for Lab 1.  Run them
+# with
+#
+#   python -m unittest test_rulestats
+
+import unittest
+from production import IF, AND, THEN, DELETE, forward_chain
+from rulestats import ChainStats
+
+JOIN_RULE = IF(AND('a (?x)', 'b (?x)'), THEN('c (?x)'))
+DELETE_RULE = IF('c (?x)', THEN('d (?x)'), DELETE('a (?x)'))
+DATA = ['a 1', 'a 2', 'b 1', 'b 2', 'b 3']
+
+# The join rule fires first, adding 'c 1' and 'c 2'.  Then the delete rule
+# fires, adding 'd 1' and 'd 2' and deleting 'a 1' and 'a 2'.  A last pass
+# finds nothing more to do.
+
+class ChainStatsTest(unittest.TestCase):
+    def counts(self, stats):
+        return (stats.attempts, stats.matches, stats.firings, stats.added,
+                stats.deleted)
+
+    def test_counts(self):
+        profile = ChainStats()
+        self.assertEqual(forward_chain([JOIN_RULE, DELETE_RULE], DATA,
+                                       profile=profile),
+                         forward_chain([JOIN_RULE, DELETE_RULE], DATA))
+        self.assertEqual([stats.rule for stats in profile.rules],
+                         [JOIN_RULE, DELETE_RULE])
+        join, delete = profile.rules
+        self.assertEqual(self.counts(join), (3, 4, 1, 2, 0))
+        self.assertEqual(self.counts(delete), (2, 4, 1, 2, 2))
+        self.assertTrue(profile.seconds() >= 0)
+
+    def test_partial(self):
+        # The join rule's first attempt is matched against the data as
+        # given, which isn't counted.  Its second gets both 'a's through
+        # both conditions, and its third finds no 'a' at all.
+        profile = ChainStats()
+        forward_chain([JOIN_RULE, DELETE_RULE], DATA, profile=profile)
+        join, delete = profile.rules
+        self.assertEqual(join.partial, {'a (?x)': 2, 'b (?x)': 2})
+        self.assertEqual(delete.partial, {'c (?x)': 4})
+
+    def test_callback(self):
+        calls = []
+        def callback(rule, matches, added, removed, seconds):
+            calls.append((rule, matches, sorted(added), sorted(removed)))
+        forward_chain([JOIN_RULE, DELETE_RULE], DATA,
+                      profile=ChainStats(callback))
+        self.assertEqual(calls,
+                         [(JOIN_RULE, 2, ['c 1', 'c 2'], []),
+                          (JOIN_RULE, 2, [], []),
+                          (DELETE_RULE, 2, ['d 1', 'd 2'], ['a 1', 'a 2']),
+                          (JOIN_RULE, 0, [], []),
+                          (DELETE_RULE, 2, [], [])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for session.py.  You don't need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_session
+
+import unittest
+from production import IF, AND, NOT, THEN, DELETE, forward_chain
+from session import ProductionSession
+from lab1 import transitive_rule, family_rules
+from data import abc_data, simpsons_data
+
+class ProductionSessionTest(unittest.TestCase):
+    def test_same_as_forward_chain(self):
+        for rules, data in [([transitive_rule], abc_data),
+                            (family_rules, simpsons_data)]:
+            session = ProductionSession(rules, data)
+            self.assertEqual(session.facts(), forward_chain(rules, data))
+
+    def test_assert_and_retract(self):
+        session = ProductionSession([transitive_rule], abc_data)
+        session.assert_fact('c beats d')
+        self.assertTrue('a beats d' in session)
+        self.assertEqual(session.facts(),
+                         forward_chain([transitive_rule],
+                                       abc_data + ['c beats d']))
+        session.retract('c beats d')
+        self.assertEqual(session.facts(),
+                         forward_chain([transitive_rule], abc_data))
+
+    def test_retract_keeps_other_justifications(self):
+        session = ProductionSession([transitive_rule],
+                                    abc_data + ['a beats c'])
+        session.retract('a beats c')
+        self.assertTrue('a beats c' in session)
+        self.assertFalse(session.is_base('a beats c'))
+        self.assertEqual(len(session.justifications('a beats c')), 1)
+
+    def test_query(self):
+        session = ProductionSession(family_rules, simpsons_data)
+        session.assert_fact('parent bart rod')
+        self.assertEqual(
+            sorted([b['x'] for b in session.query('grandparent (?x) rod')]),
+            ['homer', 'marge'])
+
+    def test_delete_holds_while_its_rule_matches(self):
+        session = ProductionSession([IF('a', THEN('c'), DELETE('b')),
+                                     IF(AND('x', NOT('c')), THEN('y'))],
+                                    ['a', 'b', 'x'])
+        self.assertEqual(session.facts(), ('a', 'c', 'x'))
+        session.retract('a')
+        self.assertEqual(session.facts(), ('b', 'x', 'y'))
+
+    def test_rule_that_deletes_its_own_condition(self):
+        self.assertRaises(ValueError, ProductionSession,
+                          [IF('q', THEN('p'), DELETE('q'))], ['q'])
+
+    def test_rule_that_adds_what_it_negates(self):
+        self.assertRaises(ValueError, ProductionSession,
+                          [IF(AND('q', NOT('p')), THEN('p'))], ['q'])
+
+    def test_rule_the_network_cant_compile(self):
+        self.assertRaises(ValueError, ProductionSession,
+                          [IF(AND('person (?x)', NOT('same (?x) (?x)')),
+                              THEN('lonely (?x)'))],
+                          ['person a', 'same b b'])
+
+if __name__ == '__main__':
+    unittest.main()
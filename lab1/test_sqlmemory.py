@@ -0,0 +1,54 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for sqlmemory.py.  You don't need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_sqlmemory
+
+import os
+import shutil
+import tempfile
+import unittest
+from production import IF, AND, NOT, THEN, DELETE, forward_chain
+from sqlmemory import SQLiteMemory
+
+RULES = [IF(AND('p (?x) d', 's (?y) (?z)', NOT('q (?x) (?z)')),
+            THEN('q (?x) (?y)', 'p (?z)'), DELETE('s (?z) (?y)')),
+         IF('p (?z)', THEN('q (?z)'))]
+DATA = ['p a d', 'p b d', 's c d', 's d c', 's e f']
+
+class Crash(Exception):
+    pass
+
+class CrashingMemory(SQLiteMemory):
+    "A SQLiteMemory that stops the run at its first checkpoint."
+    def checkpoint(self):
+        SQLiteMemory.checkpoint(self)
+        raise Crash
+
+class SQLiteMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'memory.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_as_working_memory(self):
+        memory = SQLiteMemory(self.path)
+        self.assertEqual(forward_chain(RULES, DATA, memory=memory),
+                         forward_chain(RULES, DATA))
+        memory.close()
+
+    def test_resume_after_crash(self):
+        memory = CrashingMemory(self.path, commit_every=1)
+        self.assertRaises(Crash, forward_chain, RULES, DATA, memory=memory)
+        memory.close()
+
+        memory = SQLiteMemory(self.path, commit_every=1)
+        self.assertEqual(memory.checkpoints, 1)
+        self.assertEqual(forward_chain(RULES, DATA, memory=memory),
+                         forward_chain(RULES, DATA))
+        memory.close()
+
+if __name__ == '__main__':
+    unittest.main()
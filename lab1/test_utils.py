@@ -0,0 +1,64 @@
+# MIT 6.034 Lab 1: Rule-Based Systems
+
+# Tests for the compiled patterns and bindings in utils.py.  You don't
+# need this file for Lab 1.  Run them with
+#
+#   python -m unittest test_utils
+
+import unittest
+import utils
+from utils import compile_pattern, Bindings, EMPTY_BINDINGS
+
+class CompilePatternTest(unittest.TestCase):
+    def test_match(self):
+        pattern = compile_pattern('parent (?x) (?y)')
+        self.assertEqual(pattern.match('parent marge bart'),
+                         {'x': 'marge', 'y': 'bart'})
+        self.assertEqual(pattern.match('parent marge'), None)
+        self.assertEqual(compile_pattern('a b').match('a b'), {})
+
+    def test_hot_patterns_stay_cached(self):
+        hot = compile_pattern('hot (?x)')
+        for i in range(3 * utils._PATTERN_CACHE_SIZE):
+            compile_pattern('one-off %d' % i)
+            self.assertTrue(compile_pattern('hot (?x)') is hot)
+        self.assertTrue(len(utils._pattern_cache) +
+                        len(utils._old_patterns)
+                        <= 2 * utils._PATTERN_CACHE_SIZE)
+
+class BindingsTest(unittest.TestCase):
+    def test_lookup(self):
+        bindings = Bindings.of({'x': 'a', 'y': 'b'})
+        self.assertEqual(bindings['x'], 'a')
+        self.assertEqual(bindings.get('y'), 'b')
+        self.assertEqual(bindings.get('z', 'none'), 'none')
+        self.assertRaises(KeyError, lambda: bindings['z'])
+        self.assertTrue('x' in bindings and 'z' not in bindings)
+        self.assertEqual(len(bindings), 2)
+        self.assertEqual(sorted(bindings.items()), [('x', 'a'), ('y', 'b')])
+        self.assertEqual(len(EMPTY_BINDINGS), 0)
+        self.assertTrue(Bindings.of(bindings) is bindings)
+
+    def test_extend(self):
+        old = Bindings.of({'x': 'a'})
+        new = old.extend({'x': 'a', 'y': 'b'})
+        self.assertEqual(new, {'x': 'a', 'y': 'b'})
+        self.assertEqual(len(new), 2)
+        # The old bindings are left as they were.
+        self.assertEqual(old, {'x': 'a'})
+        self.assertEqual(old.extend({'x': 'c'}), None)
+        self.assertTrue(old.bind('x', 'a') is old)
+        self.assertEqual(old.bind('x', 'c'), None)
+        self.assertEqual(old.bind('z', 'c'), {'x': 'a', 'z': 'c'})
+
+    def test_equality(self):
+        a = Bindings.of({'x': 'a'}).extend({'y': 'b'})
+        b = Bindings.of({'y': 'b'}).extend({'x': 'a'})
+        self.assertTrue(a == b and not a != b)
+        self.assertEqual(a, {'x': 'a', 'y': 'b'})
+        self.assertNotEqual(a, {'x': 'a'})
+        self.assertNotEqual(a, Bindings.of({'x': 'a', 'y': 'c'}))
+        self.assertFalse(a == 'x')
+
+if __name__ == '__main__':
+    unittest.main()
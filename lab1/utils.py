@@ -43,6 +43,158 @@ class NoClobberDict(DictMixin):
     def keys(self):
         return self._dict.keys()
 
+_Unbound = object()
+
+class Bindings(object):
+    """
+    An immutable set of variable bindings, kept as a chain of frames that
+    each bind one variable.  Extending it adds frames in front of the old
+    ones instead of copying them, and a conflict is found by comparing
+    values, not by catching a ClobberedDictKey.  Otherwise it can be read
+    like a dictionary.
+
+    Build one with Bindings.of(some_dict); Bindings() is empty.
+    """
+    __slots__ = ('_name', '_value', '_parent', '_size')
+
+    def __init__(self, name=None, value=None, parent=None):
+        self._name = name
+        self._value = value
+        self._parent = parent
+        if parent is None:
+            self._size = 0
+        else:
+            self._size = parent._size + 1
+
+    def of(cls, bindings):
+        "Return 'bindings' (any dictionary) as a Bindings."
+        if isinstance(bindings, Bindings):
+            return bindings
+        return EMPTY_BINDINGS.extend(bindings)
+    of = classmethod(of)
+
+    def get(self, name, default=None):
+        frame = self
+        while frame._parent is not None:
+            if frame._name == name:
+                return frame._value
+            frame = frame._parent
+        return default
+
+    def bind(self, name, value):
+        """
+        Return these bindings with 'name' bound to 'value', or None if
+        'name' is already bound to something else.
+        """
+        old = self.get(name, _Unbound)
+        if old is _Unbound:
+            return Bindings(name, value, self)
+        elif old == value:
+            return self
+        return None
+
+    def extend(self, bindings):
+        """
+        Return these bindings together with 'bindings' (a dictionary or
+        Bindings), or None if they disagree about some variable.
+        """
+        result = self
+        for name, value in bindings.iteritems():
+            # This is result.bind(name, value), inlined for speed.
+            frame = result
+            while frame._parent is not None:
+                if frame._name == name:
+                    break
+                frame = frame._parent
+            if frame._parent is None:
+                result = Bindings(name, value, result)
+            elif frame._value != value:
+                return None
+        return result
+
+    def iteritems(self):
+        frame = self
+        while frame._parent is not None:
+            yield frame._name, frame._value
+            frame = frame._parent
+
+    def __getitem__(self, name):
+        value = self.get(name, _Unbound)
+        if value is _Unbound:
+            raise KeyError, name
+        return value
+
+    def __contains__(self, name):
+        return self.get(name, _Unbound) is not _Unbound
+
+    has_key = __contains__
+
+    def __iter__(self):
+        for name, value in self.iteritems():
+            yield name
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [value for name, value in self.iteritems()]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __len__(self):
+        return self._size
+
+    def __eq__(self, other):
+        if isinstance(other, (Bindings, dict, DictMixin)):
+            return dict(self.iteritems()) == dict(other.iteritems())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+EMPTY_BINDINGS = Bindings()
+
+class JournaledSet(set):
+    """
+    A set that remembers which items were added or removed since the
+    last call to changes(). Adding and then removing the same item
+    cancels out.
+    """
+    def __init__(self, items = ()):
+        set.__init__(self, items)
+        self._touched = {}
+
+    def add(self, item):
+        self._touched.setdefault(item, item in self)
+        set.add(self, item)
+
+    def remove(self, item):
+        self._touched.setdefault(item, item in self)
+        set.remove(self, item)
+
+    def discard(self, item):
+        self._touched.setdefault(item, item in self)
+        set.discard(self, item)
+
+    def changes(self):
+        """
+        Return the lists (added, removed) of items that differ from
+        the last call to changes(), and start a new journal.
+        """
+        added, removed = [], []
+        for item, was_present in self._touched.iteritems():
+            if item in self and not was_present: added.append(item)
+            elif was_present and item not in self: removed.append(item)
+        self._touched = {}
+        return added, removed
+
 # A regular expression for finding variables.
 AIRegex = re.compile(r'\(\?(\S+)\)')
 
@@ -57,3 +209,108 @@ def AIStringVars(AIStr):
     # it is probably the most explicit and robust
     return set([ AIRegex.sub(r'\1', x) for x in AIRegex.findall(AIStr) ])
 
+
+# Whitespace other than spaces.  A variable never matches it, so an
+# assertion containing it doesn't match the way its space-separated words
+# would suggest.
+AIOddSpaceRegex = re.compile(r'[^\S ]')
+
+# Regular-expression metacharacters.  An AI string without any of these (or
+# any variables) matches only itself, so it can be matched by comparison.
+AIMetaRegex = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+class AIPattern(object):
+    """
+    A compiled AI string such as 'parent (?x) (?y)': its regular
+    expression, its variables in order, and the Python template that
+    fills them in.  Get one from compile_pattern(), which caches them.
+    """
+    __slots__ = ('string', 'variables', 'template', 'literal', 'arity',
+                 'constants', 'variable_words', '_regex')
+
+    def __init__(self, AIStr):
+        self.string = AIStr
+        self.variables = tuple(AIRegex.findall(AIStr))
+        self.template = AIStringToPyTemplate(AIStr)
+        self.literal = not self.variables and not AIMetaRegex.search(AIStr)
+        self._regex = None
+
+        # Each variable matches exactly one space-separated word, so unless
+        # the constant text has metacharacters, a match has as many words
+        # as the pattern ('arity'), and the same constant words in the same
+        # places ('constants', a tuple of (position, word)).  Words that are
+        # just a variable are listed in 'variable_words', as (position, name).
+        self.constants = ()
+        self.variable_words = ()
+        if AIMetaRegex.search(AIRegex.sub('', AIStr)):
+            self.arity = None
+        else:
+            words = AIStr.split(' ')
+            self.arity = len(words)
+            self.constants = tuple([(i, w) for i, w in enumerate(words)
+                                    if not AIRegex.search(w)])
+            self.variable_words = tuple([(i, AIRegex.match(w).group(1))
+                                         for i, w in enumerate(words)
+                                         if AIRegex.match(w)
+                                         and AIRegex.match(w).end() == len(w)])
+
+    def regex(self):
+        if self._regex is None:
+            self._regex = re.compile(AIStringToRegex(self.string))
+        return self._regex
+
+    def is_variable(self):
+        return (len(self.variables) == 1
+                and self.string == '(?%s)' % self.variables[0])
+
+    def match(self, AIStr):
+        """
+        Return the bindings that make this pattern equal to 'AIStr',
+        or None if there are none.
+        """
+        if self.literal:
+            if AIStr == self.string: return {}
+            return None
+        result = self.regex().match(AIStr)
+        if result is None: return None
+        return result.groupdict()
+
+    def render(self, values_dict):
+        "Fill in this pattern's variables from values_dict."
+        return self.template % values_dict
+
+    def __getstate__(self):
+        return self.string
+
+    def __setstate__(self, AIStr):
+        self.__init__(AIStr)
+
+    def __str__(self):
+        return 'AIPattern(%r)' % self.string
+
+    __repr__ = __str__
+
+# The patterns compiled lately, and the ones compiled before the cache was
+# last full.  A pattern found in the older generation moves back to the
+# newer one, so the patterns in use (a rule's conditions, say) stay cached
+# however many one-off patterns, such as filled-in NOTs, come through.
+_pattern_cache = {}
+_old_patterns = {}
+_PATTERN_CACHE_SIZE = 10000
+
+def compile_pattern(AIStr):
+    "Return the (cached) AIPattern for an AI string."
+    global _pattern_cache, _old_patterns
+    if isinstance(AIStr, AIPattern):
+        return AIStr
+    try:
+        return _pattern_cache[AIStr]
+    except KeyError:
+        pattern = _old_patterns.pop(AIStr, None)
+        if pattern is None:
+            pattern = AIPattern(AIStr)
+        if len(_pattern_cache) >= _PATTERN_CACHE_SIZE:
+            _old_patterns = _pattern_cache
+            _pattern_cache = {}
+        _pattern_cache[AIStr] = pattern
+        return pattern
@@ -1,7 +1,9 @@
 # MIT 6.034 Lab 2: Search
 # Written by Dylan Holmes (dxh), Jessica Noss (jmn), and 6.034 staff
 
-from search import Edge, UndirectedGraph, do_nothing_fn, make_generic_search
+from search import Edge, UndirectedGraph, do_nothing_fn, make_generic_search, \
+     admissibility_violations, consistency_violations, bidirectional_bfs, \
+     bidirectional_dijkstra
 import read_graphs
 
 all_graphs = read_graphs.get_graphs()
@@ -20,21 +22,18 @@ def path_length(graph, path):
     (That is, the list of nodes defines a path through the graph.)
     A path with fewer than 2 nodes should have length of 0.
     You can assume that all edges along the path have a valid numeric weight."""
-    newpath = path[:]
-    if len(newpath) < 2:
-        return 0
-    return  graph.get_edge(newpath.pop(), newpath[-1]).length+ path_length(graph, newpath)
+    # Add the edges up from the start, as length(last edge) + length(rest)
+    # would, without recursing or copying the path.
+    total = 0
+    for (a, b) in zip(path, path[1:]):
+        total = graph.get_edge(b, a).length + total
+    return total
 
 
 def has_loops(path):
     """Returns True if this path has a loop in it, i.e. if it
     visits a node more than once. Returns False otherwise."""
-    newpath = path[:]
-    while len(newpath):
-        node = newpath.pop()
-        if node in newpath:
-            return True
-    return False
+    return len(set(path)) != len(path)
 
 
 def extensions(graph, path):
@@ -80,14 +79,38 @@ generic_search = make_generic_search(extensions, has_loops)  # DO NOT CHANGE
 #     # YOUR CODE HERE
 #     return sorted_paths
 
+# The keys that the sorting functions below sort paths by.  A search that
+# sorts its whole agenda by one of these can keep the agenda in a priority
+# queue instead (see agenda_key_fn in make_generic_search).
+
+def key_hc(graph, goalNode, path):
+    return (graph.get_heuristic_value(path[-1], goalNode), path[-1])
+
+def key_bab(graph, goalNode, path):
+    return (path_length(graph, path), path[-1])
+
+def key_babwh(graph, goalNode, path):
+    return (path_length(graph, path) + graph.get_heuristic_value(path[-1], goalNode), path[-1])
+
+# The same keys, for searches whose paths are SearchNodes.
+
+def node_key_hc(graph, goalNode, node):
+    return (graph.get_heuristic_value(node.node, goalNode), node.node)
+
+def node_key_bab(graph, goalNode, node):
+    return (node.cost, node.node)
+
+def node_key_babwh(graph, goalNode, node):
+    return (node.cost + graph.get_heuristic_value(node.node, goalNode), node.node)
+
 def sort_new_paths_hc(graph, goalNode, paths):
-    return sorted(paths, key=lambda path: (graph.get_heuristic_value(path[-1], goalNode), path[-1]))
+    return sorted(paths, key=lambda path: key_hc(graph, goalNode, path))
 
 def sort_agenda_bab(graph, goalNode, paths):
-    return sorted(paths, key=lambda path: (path_length(graph, path), path[-1]))
+    return sorted(paths, key=lambda path: key_bab(graph, goalNode, path))
 
 def sort_agenda_babwh(graph, goalNode, paths):
-    return sorted(paths, key=lambda path: (path_length(graph, path) + graph.get_heuristic_value(path[-1], goalNode), path[-1]))
+    return sorted(paths, key=lambda path: key_babwh(graph, goalNode, path))
 
 generic_dfs = [do_nothing_fn, True, do_nothing_fn, False]
 
@@ -140,18 +163,22 @@ generic_beam = [do_nothing_fn, False, sort_agenda_beam, False]
 # welcome to code them without using generic_search if you would prefer to
 # implement the algorithms by yourself.
 
+# These search with SearchNodes, which share the beginnings of their paths
+# instead of copying them.
+
 def dfs(graph, startNode, goalNode):
-    return generic_search(*generic_dfs)(graph, startNode, goalNode)
+    return generic_search(*generic_dfs, use_search_nodes=True)(graph, startNode, goalNode)
 
 def bfs(graph, startNode, goalNode):
-    return generic_search(*generic_bfs)(graph, startNode, goalNode)
+    return generic_search(*generic_bfs, use_search_nodes=True)(graph, startNode, goalNode)
 
 
 def hill_climbing(graph, startNode, goalNode):
     return generic_search(*generic_hill_climbing)(graph, startNode, goalNode)
 
 def best_first(graph, startNode, goalNode):
-    return generic_search(*generic_best_first)(graph, startNode, goalNode)
+    return generic_search(*generic_best_first, agenda_key_fn=node_key_hc,
+                          use_search_nodes=True)(graph, startNode, goalNode)
 
 def popleft(path):
     result = path[0]
@@ -196,16 +223,27 @@ def beam(graph, startNode, goalNode, beam_width):
     return None
 
 def branch_and_bound(graph, startNode, goalNode):
-    return generic_search(*generic_branch_and_bound)(graph, startNode, goalNode)
+    return generic_search(*generic_branch_and_bound, agenda_key_fn=node_key_bab,
+                          use_search_nodes=True)(graph, startNode, goalNode)
 
 def branch_and_bound_with_heuristic(graph, startNode, goalNode):
-    return generic_search(*generic_branch_and_bound_with_heuristic)(graph, startNode, goalNode)
+    return generic_search(*generic_branch_and_bound_with_heuristic, agenda_key_fn=node_key_babwh,
+                          use_search_nodes=True)(graph, startNode, goalNode)
 
 def branch_and_bound_with_extended_set(graph, startNode, goalNode):
-    return generic_search(*generic_branch_and_bound_with_extended_set)(graph, startNode, goalNode)
+    return generic_search(*generic_branch_and_bound_with_extended_set, agenda_key_fn=node_key_bab,
+                          use_search_nodes=True)(graph, startNode, goalNode)
 
 def a_star(graph, startNode, goalNode):
-    return generic_search(*generic_a_star)(graph, startNode, goalNode)
+    return generic_search(*generic_a_star, agenda_key_fn=node_key_babwh,
+                          use_search_nodes=True)(graph, startNode, goalNode)
+
+# On an UndirectedGraph, the searches can also start from both ends at once:
+# bidirectional_bfs(graph, startNode, goalNode) returns the same path as bfs,
+# and bidirectional_dijkstra(graph, startNode, goalNode) the same as
+# branch_and_bound_with_extended_set, after reaching far fewer nodes on big
+# graphs.  (See search.py.)
+
 
 
 #### PART 4: Heuristics ########################################################
@@ -214,10 +252,9 @@ def is_admissible(graph, goalNode):
     """Returns True if this graph's heuristic is admissible; else False.
     A heuristic is admissible if it is either always exactly correct or overly
     optimistic; it never over-estimates the cost to the goal."""
-    for node in graph.nodes:
-        if graph.get_heuristic_value(node, goalNode) > path_length(graph, branch_and_bound_with_extended_set(graph, node, goalNode)):
-            return False
-    return True
+    # One search out from the goal finds the distances of all the nodes
+    # to it; see admissibility_violations for the nodes that fail.
+    return not admissibility_violations(graph, goalNode)
 
 
 def is_consistent(graph, goalNode):
@@ -229,11 +266,8 @@ def is_consistent(graph, goalNode):
     In other words, moving from one node to a neighboring node never unfairly
     decreases the heuristic.
     This is equivalent to the heuristic satisfying the triangle inequality."""
-    for node in graph.nodes:
-        for neighbor in graph.get_neighbors(node):
-            if abs(graph.get_heuristic_value(node, goalNode) - graph.get_heuristic_value(neighbor, goalNode)) > graph.get_edge(node, neighbor).length:
-                return False
-    return True
+    # See consistency_violations for the edges that fail.
+    return not consistency_violations(graph, goalNode)
 
 
 
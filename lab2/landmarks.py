@@ -0,0 +1,123 @@
+# MIT 6.034 Lab 2: Search
+
+# Heuristics from landmarks.  You don't need this file for Lab 2; it is used
+# by
+#
+# >>> landmarks = Landmarks(graph, 8)
+# >>> graph.set_heuristic(landmarks)
+# >>> a_star(graph, startNode, goalNode)
+#
+# for graphs that don't come with a heuristic of their own.  A Landmarks
+# picks a few nodes spread out over the graph, and finds the length of the
+# shortest path from each of them to every node (one Dijkstra search each).
+# By the triangle inequality, a node can't be nearer the goal than the
+# difference of their distances from any landmark, so the largest of those
+# differences is a heuristic for any goal that is both admissible and
+# consistent.  (Like path_length, it only counts the first edge joining two
+# nodes.)
+#
+# Finding the distances takes a while on big graphs, so they can be saved:
+#
+# >>> landmarks.save('landmarks.json')
+# >>> landmarks = load_landmarks('landmarks.json')
+
+import json
+from search import shortest_distances
+
+class Landmarks:
+    """ The distances from some landmark nodes to the nodes of a graph:
+    'count' landmarks chosen to be far apart, or the nodes in 'landmarks' if
+    given.  Called as a function f(node, goalNode), it returns the
+    heuristic value of node for goalNode. """
+    def __init__(self, graph=None, count=8, landmarks=None):
+        self.landmarks = [] # The landmark nodes, in the order they were chosen
+        self.distances = {} # landmark -> {node: distance from the landmark}
+        if graph is None:
+            return
+        if landmarks is None:
+            self.choose(graph, count)
+        else:
+            for landmark in landmarks:
+                self.add(graph, landmark)
+
+    def add(self, graph, landmark):
+        "Adds a landmark, and finds the distances from it."
+        if landmark not in self.distances:
+            self.landmarks.append(landmark)
+            self.distances[landmark] = shortest_distances(graph, landmark)
+        return self
+
+    def choose(self, graph, count):
+        """ Adds up to 'count' landmarks that are far apart: first the node
+        farthest from the first node of the graph, and then each time the
+        node whose nearest landmark so far is farthest away.  Nodes that
+        can't be reached at all come first, so that each part of a graph
+        that isn't connected gets one. """
+        if not graph.nodes:
+            return self
+        # node -> distance to the nearest landmark that reaches it
+        nearest = {}
+        for distances in self.distances.itervalues():
+            _update_nearest(nearest, distances)
+        if not nearest:
+            nearest = shortest_distances(graph, graph.nodes[0])
+        for i in range(count):
+            unreached = [node for node in graph.nodes if node not in nearest]
+            candidates = [(-distance, node) for node, distance
+                          in nearest.iteritems() if node not in self.distances]
+            if unreached:
+                landmark = min(unreached)
+            elif candidates:
+                landmark = min(candidates)[1]
+            else:
+                break
+            if not self.distances:
+                nearest = {}
+            self.add(graph, landmark)
+            _update_nearest(nearest, self.distances[landmark])
+        return self
+
+    def heuristic_value(self, node, goalNode):
+        """ The least that the distance from node to goalNode can be, going
+        by the landmarks that can reach them both (or 0 if none can). """
+        value = 0
+        for distances in self.distances.itervalues():
+            if node in distances and goalNode in distances:
+                value = max(value, abs(distances[node] - distances[goalNode]))
+        return value
+
+    __call__ = heuristic_value
+
+    def heuristic_dict(self, graph, goalNodes=None):
+        """ Returns the heuristic values of every node of the graph for each
+        of goalNodes (by default, all of them), as a dictionary that
+        graph.set_heuristic accepts. """
+        if goalNodes is None:
+            goalNodes = graph.nodes
+        return dict([(goal, dict([(node, self.heuristic_value(node, goal))
+                                  for node in graph.nodes]))
+                     for goal in goalNodes])
+
+    def save(self, file_name):
+        "Writes the landmarks and their distances to a file."
+        with open(file_name, 'w') as f:
+            json.dump({'landmarks': self.landmarks,
+                       'distances': self.distances}, f)
+
+def load_landmarks(file_name):
+    "Reads Landmarks that were written by Landmarks.save."
+    with open(file_name, 'r') as f:
+        data = json.load(f)
+    result = Landmarks()
+    for landmark in data['landmarks']:
+        landmark = str(landmark)
+        result.landmarks.append(landmark)
+        result.distances[landmark] = dict(
+            [(str(node), distance)
+             for node, distance in data['distances'][landmark].iteritems()])
+    return result
+
+def _update_nearest(nearest, distances):
+    for node, distance in distances.iteritems():
+        if distance < nearest.get(node, distance + 1):
+            nearest[node] = distance
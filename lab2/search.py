@@ -1,5 +1,7 @@
 # MIT 6.034 Lab 2: Search
 
+import heapq
+
 def distinct(seq):
     seen = set()
     seen_add = seen.add
@@ -33,25 +35,68 @@ class UndirectedGraph:
         self.nodes = nodes[:]
         self.edges = edges[:]
         self.heuristic_dict = heuristic_dict.copy()
+        self.heuristic_fn = None # If set, used instead of heuristic_dict
+        # An index of the edges by node, kept up to date by join(), and
+        # rebuilt if self.edges is replaced or changes length otherwise.
+        self._indexed_edges = None # The list that is indexed, and its length
+        self._indexed_count = 0
+        self._incident = {} # node -> edges that touch it, in order
+        self._between = {} # (node, node) -> the first edge joining them
+        self._indexed_nodes = None # Likewise for the set of nodes
+        self._node_count = 0
+        self._node_set = set()
+
+    def _adjacency(self):
+        if (self._indexed_edges is not self.edges
+            or self._indexed_count != len(self.edges)):
+            self._incident = {}
+            self._between = {}
+            for e in self.edges:
+                self._index_edge(e)
+            self._indexed_edges = self.edges
+            self._indexed_count = len(self.edges)
+        return self._incident
+
+    def _index_edge(self, e):
+        self._incident.setdefault(e.startNode, []).append(e)
+        if e.endNode != e.startNode:
+            self._incident.setdefault(e.endNode, []).append(e)
+        self._between.setdefault((e.startNode, e.endNode), e)
+        self._between.setdefault((e.endNode, e.startNode), e)
+
+    def _nodes(self):
+        if (self._indexed_nodes is not self.nodes
+            or self._node_count != len(self.nodes)):
+            self._node_set = set(self.nodes)
+            self._indexed_nodes = self.nodes
+            self._node_count = len(self.nodes)
+        return self._node_set
 
     def is_valid_path(self, path) :
         # all nodes are nodes in the path, and consecutive nodes are neighbors
-        return all([x in self.nodes for x in path]) and all([self.get_edge(a,b) for (a,b) in zip(path, path[1:])])
+        nodes = self._nodes()
+        return all([x in nodes for x in path]) and all([self.get_edge(a,b) for (a,b) in zip(path, path[1:])])
 
     def get_edges(self, startNode=None, endNode=None):
         """ Return a list of all the edges in the graph.  If start or end are
         provided, restricts to edges that start/end at particular nodes. """
 
+        if startNode is None and endNode is None:
+            return self.edges[:]
+
         pred1 =  lambda node: (startNode is None) or (node == startNode)
         pred2 =  lambda node: (endNode is None)   or (node == endNode)
 
-        return filter(
-            lambda e: e is not None,
-            [e if pred1(e.startNode) and pred2(e.endNode) else
-             e.reverse() if pred2(e.startNode) and pred1(e.endNode)
-             else None
-             for e in self.edges
-        ])
+        # Only the edges that touch one of the nodes can qualify.
+        if startNode is None:
+            incident = self._adjacency().get(endNode, [])
+        else:
+            incident = self._adjacency().get(startNode, [])
+        return [e if pred1(e.startNode) and pred2(e.endNode) else
+                e.reverse()
+                for e in incident
+                if (pred1(e.startNode) and pred2(e.endNode))
+                or (pred2(e.startNode) and pred1(e.endNode))]
 
     def get_neighbors(self, node):
         "Returns an alphabetical list of neighboring nodes. Each node appears at most once."
@@ -64,15 +109,24 @@ class UndirectedGraph:
     def get_edge(self, startNode, endNode):
         """ Returns the edge that directly connects startNode to endNode
         (or None if there is no such edge) """
-        edges = self.get_edges(startNode, endNode)
-        if len(edges) == 0:
+        if startNode is None or endNode is None:
+            edges = self.get_edges(startNode, endNode)
+            return edges and edges[0] or None
+        self._adjacency()
+        e = self._between.get((startNode, endNode))
+        if e is None:
             return None
+        elif e.startNode == startNode and e.endNode == endNode:
+            return e
         else:
-            return edges[0]
+            return e.reverse()
 
     def is_neighbor(self, startNode, endNode):
         "Returns True if there is an edge connecting startNode to endNode, else False"
-        return any([endNode == e.endNode for e in self.get_edges(startNode)])
+        if startNode is None or endNode is None:
+            return any([endNode == e.endNode for e in self.get_edges(startNode)])
+        self._adjacency()
+        return (startNode, endNode) in self._between
 
     # CREATE AND MODIFY THE GRAPH
 
@@ -81,24 +135,40 @@ class UndirectedGraph:
         if self.is_neighbor(startNode, endNode):
             print "UndirectedGraph.join: Error adding edge to graph"
             return self
-        self.edges.append(Edge(startNode, endNode, edgeLength))
+        edge = Edge(startNode, endNode, edgeLength)
+        self.edges.append(edge)
+        self._index_edge(edge)
+        self._indexed_count += 1
+        nodes = self._nodes()
         for node in [startNode, endNode]:
-            if node not in self.nodes:
+            if node not in nodes:
                 print "UndirectedGraph.join: Adding", node, "to list of nodes"
                 self.nodes.append(startNode)
+                nodes.add(startNode)
+                self._node_count += 1
         return self
 
     # HEURISTIC
     def get_heuristic_value(self, startNode, goalNode) :
+       if self.heuristic_fn is not None:
+           return self.heuristic_fn(startNode, goalNode)
        return self.heuristic_dict.get(goalNode, {}).get(startNode, 0)
     def set_heuristic(self, heuristicDict) :
-        self.heuristic_dict = heuristicDict
+        # Either a dictionary {goalNode: {node: value}}, or a function
+        # f(node, goalNode) (such as a landmarks.Landmarks) for any goal.
+        if callable(heuristicDict):
+            self.heuristic_fn = heuristicDict
+        else:
+            self.heuristic_fn = None
+            self.heuristic_dict = heuristicDict
         return self
 
     def copy(self):
-        return UndirectedGraph(self.nodes[:],
-                               [e.copy() for e in self.edges],
-                               self.heuristic_dict.copy())
+        result = UndirectedGraph(self.nodes[:],
+                                 [e.copy() for e in self.edges],
+                                 self.heuristic_dict.copy())
+        result.heuristic_fn = self.heuristic_fn
+        return result
 
     def __str__(self):
         return "\n\t".join(["Graph<",
@@ -115,6 +185,251 @@ if False:
     print g.get_neighboring_edges("B")
 
 
+class SearchNode(object):
+    """ A path in a search, kept as its last node and a pointer to the
+    SearchNode for the rest of the path, so that extending a path doesn't
+    copy it.  'cost' is the path's length (None if some edge has no
+    length), and 'depth' its number of edges. """
+    __slots__ = ('node', 'parent', 'cost', 'depth')
+
+    def __init__(self, node, parent=None, cost=0):
+        self.node = node
+        self.parent = parent
+        self.cost = cost
+        if parent is None:
+            self.depth = 0
+        else:
+            self.depth = parent.depth + 1
+
+    def nodes(self):
+        "Yields the nodes of the path, from the last back to the first."
+        search_node = self
+        while search_node is not None:
+            yield search_node.node
+            search_node = search_node.parent
+
+    def path(self):
+        "Returns the path as a list of nodes."
+        path = list(self.nodes())
+        path.reverse()
+        return path
+
+    def extensions(self, graph):
+        """ Returns a SearchNode for each neighbor of the last node that
+        isn't on the path already, in alphabetical order.
+
+        The loop check walks the path once, so each expansion costs time in
+        proportion to the path's length.  Keeping a set of the path's nodes
+        in each SearchNode would make the check O(1), but building it would
+        copy the parent's set just the same, and every node on the agenda
+        would then hold a copy of its whole path, which parent pointers
+        are meant to avoid. """
+        visited = set(self.nodes())
+        result = []
+        for neighbor in graph.get_neighbors(self.node):
+            if neighbor in visited:
+                continue
+            length = graph.get_edge(self.node, neighbor).length
+            if self.cost is None or length is None:
+                cost = None
+            else:
+                cost = length + self.cost
+            result.append(SearchNode(neighbor, self, cost))
+        return result
+
+    def __str__(self):
+        return "SearchNode<" + ",".join(map(str, self.path())) + ">"
+
+    __repr__ = __str__
+
+def shortest_distances(graph, source):
+    """ Returns a dictionary of the length of the shortest path from source
+    to each node that can be reached from it (by Dijkstra's algorithm).
+    Like path_length, this only counts the first edge joining two nodes.
+    The graph is undirected, so these are also the distances from each
+    node to source. """
+    incident = graph._adjacency()
+    distances = {}
+    agenda = [(0, source)]
+    while agenda:
+        distance, node = heapq.heappop(agenda)
+        if node in distances:
+            continue
+        distances[node] = distance
+        for e in incident.get(node, []):
+            if e.startNode == node:
+                neighbor = e.endNode
+            else:
+                neighbor = e.startNode
+            if (neighbor not in distances
+                and graph._between[(node, neighbor)] is e):
+                heapq.heappush(agenda, (e.length + distance, neighbor))
+    return distances
+
+def bidirectional_bfs(graph, startNode, goalNode):
+    """ Returns the path that breadth-first search would: the alphabetically
+    first of the paths from startNode to goalNode with the fewest edges (or
+    None if there is none).  It searches out from both ends a whole layer
+    at a time, always growing the smaller frontier, until they meet. """
+    if startNode == goalNode:
+        return [startNode]
+    forward = {startNode: 0} # node -> number of edges from startNode
+    backward = {goalNode: 0} # node -> number of edges to goalNode
+    forward_layers = [[startNode]]
+    backward_layers = [[goalNode]]
+    while forward_layers[-1] and backward_layers[-1]:
+        if len(forward_layers[-1]) <= len(backward_layers[-1]):
+            layer = _next_layer(graph, forward_layers, forward)
+            other = backward
+        else:
+            layer = _next_layer(graph, backward_layers, backward)
+            other = forward
+        meeting = [forward[node] + backward[node] for node in layer
+                   if node in other]
+        if meeting:
+            break
+    else:
+        return None
+    length = min(meeting)
+
+    # A node in the last complete forward layer (or at 'length') is on a
+    # shortest path if its distance to the goal is right; a node in an
+    # earlier layer is if it leads to such a node in the next layer.
+    depth = min(len(forward_layers) - 1, length)
+    on_path = set([node for node in forward_layers[depth]
+                   if backward.get(node) == length - depth])
+    for layer in reversed(forward_layers[:depth]):
+        following = on_path
+        on_path = set()
+        for node in layer:
+            for neighbor in graph.get_neighbors(node):
+                if (neighbor in following
+                    and forward[neighbor] == forward[node] + 1):
+                    on_path.add(node)
+                    break
+        on_path |= following
+
+    # Then take the alphabetically first step that stays on one, each time.
+    path = [startNode]
+    for step in range(1, length + 1):
+        for neighbor in graph.get_neighbors(path[-1]):
+            if step <= depth:
+                if neighbor in on_path and forward[neighbor] == step:
+                    break
+            elif backward.get(neighbor) == length - step:
+                break
+        path.append(neighbor)
+    return path
+
+def _next_layer(graph, layers, distances):
+    "Adds the next breadth-first layer to 'layers', and returns it."
+    layer = []
+    for node in layers[-1]:
+        for neighbor in graph.get_neighbors(node):
+            if neighbor not in distances:
+                distances[neighbor] = len(layers)
+                layer.append(neighbor)
+    layers.append(layer)
+    return layer
+
+def bidirectional_dijkstra(graph, startNode, goalNode):
+    """ Returns the path that branch and bound with an extended set would
+    (or None if there is none), by Dijkstra's algorithm run from both ends
+    at once, taking the nearer of the two frontiers each time.  It stops
+    once the two frontiers together are farther apart than the shortest
+    path found, so every node on a shortest path has been reached from one
+    end or the other.  The search from the start then carries on through
+    just the nodes reached from the goal, to break ties between shortest
+    paths the same way the one-way search does. """
+    if startNode == goalNode:
+        return [startNode]
+    settled = ({}, {}) # Shortest distances from the start, and to the goal
+    reached = ({startNode: 0}, {goalNode: 0}) # The best distances so far
+    parents = ({startNode: None}, {goalNode: None})
+    agendas = ([(0, startNode)], [(0, goalNode)])
+    best = None # The length of the shortest path found so far
+
+    def expand(side, node, distance, within=None):
+        settled[side][node] = distance
+        for neighbor in graph.get_neighbors(node):
+            if neighbor in settled[side]:
+                continue
+            if within is not None and neighbor not in within:
+                continue
+            total = graph.get_edge(node, neighbor).length + distance
+            if total < reached[side].get(neighbor, total + 1):
+                reached[side][neighbor] = total
+                parents[side][neighbor] = node
+                heapq.heappush(agendas[side], (total, neighbor))
+            if neighbor in reached[1 - side]:
+                yield total + reached[1 - side][neighbor]
+
+    while True:
+        for agenda, done in zip(agendas, settled):
+            while agenda and agenda[0][1] in done:
+                heapq.heappop(agenda)
+        if not agendas[0] or not agendas[1]:
+            break
+        if best is not None and agendas[0][0][0] + agendas[1][0][0] > best:
+            break
+        side = agendas[0][0][0] > agendas[1][0][0] and 1 or 0
+        distance, node = heapq.heappop(agendas[side])
+        for length in expand(side, node, distance):
+            if best is None or length < best:
+                best = length
+    if best is None:
+        return None
+
+    # Carry on from the start, through the nodes reached from the goal,
+    # until the goal comes off the agenda.
+    agenda = agendas[0]
+    while goalNode not in settled[0]:
+        distance, node = heapq.heappop(agenda)
+        if node in settled[0] or node not in settled[1]:
+            continue
+        if node == goalNode:
+            break
+        for length in expand(0, node, distance, settled[1]):
+            pass
+
+    path = [goalNode]
+    while parents[0][path[-1]] is not None:
+        path.append(parents[0][path[-1]])
+    path.reverse()
+    return path
+
+def admissibility_violations(graph, goalNode):
+    """ Returns a list of (node, heuristic value, shortest distance to
+    goalNode) for each node whose heuristic value is more than its
+    distance to the goal, using one search out from the goal.  Nodes that
+    can't reach the goal are left out. """
+    distances = shortest_distances(graph, goalNode)
+    result = []
+    for node in graph.nodes:
+        if node in distances:
+            value = graph.get_heuristic_value(node, goalNode)
+            if value > distances[node]:
+                result.append((node, value, distances[node]))
+    return result
+
+def consistency_violations(graph, goalNode):
+    """ Returns a list of the edges along which the heuristic value changes
+    by more than the edge's length, in one pass over the edges.  As with
+    get_edge, only the first edge joining two nodes counts, and only edges
+    that touch one of the graph's nodes are checked. """
+    nodes = graph._nodes()
+    graph._adjacency()
+    result = []
+    for e in graph.edges:
+        if graph._between[(e.startNode, e.endNode)] is not e:
+            continue
+        if e.startNode not in nodes and e.endNode not in nodes:
+            continue
+        if abs(graph.get_heuristic_value(e.startNode, goalNode)
+               - graph.get_heuristic_value(e.endNode, goalNode)) > e.length:
+            result.append(e)
+    return result
+
 def do_nothing_fn(graph, goalNode, paths):
     return paths
 
@@ -123,7 +438,21 @@ def make_generic_search(extensions_fn, has_loops_fn): #hack to avoid circular im
     def generic_search(sort_new_paths_fn = do_nothing_fn,
                        add_paths_to_front_of_agenda = True,
                        sort_agenda_fn = do_nothing_fn,
-                       use_extended_set = False):
+                       use_extended_set = False,
+                       agenda_key_fn = None,
+                       use_search_nodes = False):
+        """ Returns a search function.  If agenda_key_fn is given, it is
+        called as agenda_key_fn(graph, goalNode, path), and the agenda is
+        kept as a priority queue ordered by it, instead of being re-sorted
+        by sort_agenda_fn after every extension.  Paths with equal keys
+        come off in the order sort_agenda_fn would put them, so if
+        sort_agenda_fn sorts by the same key, the search is the same.
+
+        If use_search_nodes is True, the paths on the agenda are
+        SearchNodes instead of lists, extended with SearchNode.extensions
+        (which finds the same paths as the extensions function), and the
+        functions above are given SearchNodes.  Only the path that reaches
+        the goal is turned into a list. """
 
         # To prevent tester from throwing unexpected errors
         args = [sort_new_paths_fn, add_paths_to_front_of_agenda,
@@ -133,23 +462,44 @@ def make_generic_search(extensions_fn, has_loops_fn): #hack to avoid circular im
         elif None in args:
             raise TypeError("'None' is not a valid argument for generic_search")
 
+        def last_node(path):
+            if use_search_nodes:
+                return path.node
+            return path[-1]
+
+        def extend(graph, path):
+            if use_search_nodes:
+                return path.extensions(graph)
+            return [path for path in extensions_fn(graph, path)
+                    if not has_loops_fn(path)]
+
+        def finish(path):
+            if use_search_nodes:
+                return path.path()
+            return path
+
         # Make search algorithm with arguments specified above
         def search_algorithm(graph, start, goal, beam_width=None):
-            agenda = [[start]]
+            if use_search_nodes:
+                first = SearchNode(start)
+            else:
+                first = [start]
+            if agenda_key_fn is not None:
+                return priority_search(graph, first, goal, beam_width)
+            agenda = [first]
             extended_set = set()
 
             while(agenda):
                 path = agenda.pop(0)
-                lastNode = path[-1]
+                lastNode = last_node(path)
 
                 if(lastNode == goal):
-                    return path
+                    return finish(path)
                 elif use_extended_set and lastNode in extended_set:
                     continue
                 else:
                     extended_set.add(lastNode)
-                    new_paths_unsorted = [path for path in extensions_fn(graph, path)
-                                          if not has_loops_fn(path)]
+                    new_paths_unsorted = extend(graph, path)
                     new_paths = sort_new_paths_fn(graph, goal, new_paths_unsorted)
                     if add_paths_to_front_of_agenda:
                         agenda = new_paths + agenda
@@ -164,6 +514,43 @@ def make_generic_search(extensions_fn, has_loops_fn): #hack to avoid circular im
             # no path found
             return None
 
+        def priority_search(graph, first, goal, beam_width=None):
+            # The agenda is a heap of (key, order, path).  A stable sort of
+            # the agenda with the new paths added to its front (or back)
+            # would put paths with equal keys newest (or oldest) batch
+            # first, and in order within a batch, and so does 'order'.
+            agenda = [(agenda_key_fn(graph, goal, first), (0, 0), first)]
+            extended_set = set()
+            batch = 0
+
+            while(agenda):
+                path = heapq.heappop(agenda)[2]
+                lastNode = last_node(path)
+
+                if(lastNode == goal):
+                    return finish(path)
+                elif use_extended_set and lastNode in extended_set:
+                    continue
+                else:
+                    extended_set.add(lastNode)
+                    new_paths_unsorted = extend(graph, path)
+                    new_paths = sort_new_paths_fn(graph, goal, new_paths_unsorted)
+                    batch += 1
+                    if add_paths_to_front_of_agenda:
+                        order = -batch
+                    else:
+                        order = batch
+                    for i, new_path in enumerate(new_paths):
+                        heapq.heappush(agenda, (agenda_key_fn(graph, goal, new_path),
+                                                (order, i), new_path))
+
+                    if beam_width != None:
+                        # A sorted list is a heap too.
+                        agenda = heapq.nsmallest(beam_width, agenda)
+
+            # no path found
+            return None
+
         return search_algorithm
 
     return generic_search
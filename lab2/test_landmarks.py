@@ -0,0 +1,46 @@
+# MIT 6.034 Lab 2: Search
+
+# Tests for landmarks.py.  You don't need this file for Lab 2.  Run them with
+#
+#   python -m unittest test_landmarks
+
+import os
+import shutil
+import tempfile
+import unittest
+from lab2 import is_admissible, is_consistent
+from landmarks import Landmarks, load_landmarks
+from read_graphs import get_graphs
+
+# GRAPH_0's edges have no lengths.
+weighted_graphs = dict([(name, graph) for name, graph in get_graphs().items()
+                        if None not in [e.length for e in graph.edges]])
+
+class LandmarksTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_and_load(self):
+        for name, graph in sorted(weighted_graphs.items()):
+            landmarks = Landmarks(graph, 3)
+            file_name = os.path.join(self.directory, name + '.json')
+            landmarks.save(file_name)
+            loaded = load_landmarks(file_name)
+            self.assertEqual(loaded.landmarks, landmarks.landmarks)
+            self.assertEqual(loaded.distances, landmarks.distances)
+            self.assertEqual(loaded.heuristic_dict(graph),
+                             landmarks.heuristic_dict(graph))
+
+    def test_admissible_and_consistent(self):
+        for name, graph in sorted(weighted_graphs.items()):
+            graph = graph.copy()
+            graph.set_heuristic(Landmarks(graph, 3))
+            for goal in graph.nodes:
+                self.assertTrue(is_admissible(graph, goal), (name, goal))
+                self.assertTrue(is_consistent(graph, goal), (name, goal))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+# MIT 6.034 Lab 2: Search
+
+# Tests for the graph index and the searches in search.py.  You don't need this
+# file for Lab 2.  Run them with
+#
+#   python -m unittest test_search
+
+import sys
+import unittest
+from StringIO import StringIO
+from lab2 import bfs, branch_and_bound_with_extended_set, generic_search, \
+     key_hc, key_bab, key_babwh, sort_new_paths_hc, sort_agenda_bab, \
+     sort_agenda_babwh
+from lab2 import path_length
+from search import Edge, UndirectedGraph, do_nothing_fn, \
+     admissibility_violations, consistency_violations, bidirectional_bfs, \
+     bidirectional_dijkstra
+from read_graphs import get_graphs
+
+all_graphs = get_graphs()
+# GRAPH_0's edges have no lengths, so it only works for bfs.
+weighted_graphs = dict([(name, graph) for name, graph in all_graphs.items()
+                        if None not in [e.length for e in graph.edges]])
+
+def scan_edges(graph, startNode=None, endNode=None):
+    "get_edges as it was, scanning every edge."
+    result = []
+    for e in graph.edges:
+        if ((startNode is None or e.startNode == startNode)
+            and (endNode is None or e.endNode == endNode)):
+            result.append(e)
+        elif ((startNode is None or e.endNode == startNode)
+              and (endNode is None or e.startNode == endNode)):
+            result.append(e.reverse())
+    return result
+
+class GraphIndexTest(unittest.TestCase):
+    def assertSameAsScan(self, graph):
+        nodes = graph.nodes + ['nowhere']
+        for a in nodes:
+            self.assertEqual(graph.get_edges(a), scan_edges(graph, a))
+            self.assertEqual(graph.get_edges(None, a),
+                             scan_edges(graph, None, a))
+            self.assertEqual(graph.get_neighbors(a),
+                             sorted(set([e.endNode
+                                         for e in scan_edges(graph, a)])))
+            for b in nodes:
+                edges = scan_edges(graph, a, b)
+                self.assertEqual(graph.get_edges(a, b), edges)
+                self.assertEqual(graph.get_edge(a, b),
+                                 edges and edges[0] or None)
+                self.assertEqual(graph.is_neighbor(a, b), bool(edges))
+
+    def test_graphs(self):
+        for name, graph in sorted(all_graphs.items()):
+            self.assertSameAsScan(graph)
+
+    def test_join(self):
+        graph = UndirectedGraph(['a', 'b', 'c'], [Edge('a', 'b', 1)])
+        self.assertSameAsScan(graph)
+        graph.join('b', 'c', 2)
+        graph.join('c', 'a', 3)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            graph.join('a', 'c', 4) # Already joined, so not added
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(len(graph.edges), 3)
+        self.assertSameAsScan(graph)
+
+    def test_edges_changed_directly(self):
+        graph = UndirectedGraph(['a', 'b', 'c'], [Edge('a', 'b', 1)])
+        self.assertSameAsScan(graph)
+        graph.edges.append(Edge('b', 'c', 2))
+        self.assertSameAsScan(graph)
+        # The first edge joining two nodes is the one get_edge finds.
+        graph.edges.append(Edge('b', 'a', 5))
+        self.assertSameAsScan(graph)
+        graph.edges = [Edge('c', 'a', 3)]
+        self.assertSameAsScan(graph)
+
+# A grid whose edges all have the same length and whose heuristic is the
+# same everywhere, so most paths tie.
+grid = [(i, j) for i in range(3) for j in range(3)]
+tie_graph = UndirectedGraph(
+    ['%d%d' % (i, j) for (i, j) in grid],
+    [Edge('%d%d' % (i, j), '%d%d' % (i + di, j + dj), 1)
+     for (i, j) in grid for (di, dj) in [(1, 0), (0, 1)]
+     if (i + di, j + dj) in grid])
+
+class PriorityAgendaTest(unittest.TestCase):
+    def assertSameSearch(self, graphs, args, key_fn):
+        sorting = generic_search(*args)
+        queueing = generic_search(*args, agenda_key_fn=key_fn)
+        for name, graph in graphs:
+            for start in graph.nodes:
+                for goal in graph.nodes:
+                    self.assertEqual(queueing(graph, start, goal),
+                                     sorting(graph, start, goal),
+                                     (name, args, start, goal))
+
+    def test_same_paths_as_sorted_agenda(self):
+        graphs = sorted(weighted_graphs.items()) + [('tie', tie_graph)]
+        for sort_fn, key_fn in [(sort_agenda_bab, key_bab),
+                                (sort_agenda_babwh, key_babwh)]:
+            for front in [False, True]:
+                for extended in [False, True]:
+                    self.assertSameSearch(graphs, [do_nothing_fn, front,
+                                                   sort_fn, extended],
+                                          key_fn)
+        # Best-first sorts the new paths, too.
+        for front in [False, True]:
+            self.assertSameSearch(graphs, [sort_new_paths_hc, front,
+                                           sort_new_paths_hc, False],
+                                  key_hc)
+
+class HeuristicViolationsTest(unittest.TestCase):
+    def setUp(self):
+        # 'd' can't reach the goal; the second a-b edge is never used.
+        self.graph = UndirectedGraph(
+            ['a', 'b', 'c', 'd'],
+            [Edge('a', 'b', 1), Edge('b', 'c', 1), Edge('a', 'c', 5),
+             Edge('b', 'a', 10)],
+            {'c': {'a': 3, 'b': 0.5, 'c': 0, 'd': 100}})
+
+    def test_admissibility_violations(self):
+        self.assertEqual(admissibility_violations(self.graph, 'c'),
+                         [('a', 3, 2)])
+        self.graph.heuristic_dict['c']['a'] = 2
+        self.assertEqual(admissibility_violations(self.graph, 'c'), [])
+
+    def test_consistency_violations(self):
+        self.assertEqual(consistency_violations(self.graph, 'c'),
+                         [Edge('a', 'b', 1)])
+        self.graph.heuristic_dict['c']['a'] = 1.5
+        self.assertEqual(consistency_violations(self.graph, 'c'), [])
+
+    def test_same_as_search(self):
+        for name, graph in sorted(weighted_graphs.items()):
+            for goal in graph.nodes:
+                # Compare with searching from each node in turn, and
+                # checking each pair of neighbors.
+                expected = []
+                for node in graph.nodes:
+                    path = branch_and_bound_with_extended_set(graph, node,
+                                                              goal)
+                    value = graph.get_heuristic_value(node, goal)
+                    if path and value > path_length(graph, path):
+                        expected.append((node, value,
+                                         path_length(graph, path)))
+                self.assertEqual(admissibility_violations(graph, goal),
+                                 expected, (name, goal))
+                consistent = True
+                for node in graph.nodes:
+                    for neighbor in graph.get_neighbors(node):
+                        if (graph.get_heuristic_value(node, goal)
+                            > graph.get_heuristic_value(neighbor, goal)
+                            + graph.get_edge(node, neighbor).length):
+                            consistent = False
+                self.assertEqual(not consistency_violations(graph, goal),
+                                 consistent, (name, goal))
+
+class BidirectionalSearchTest(unittest.TestCase):
+    def test_same_paths_as_one_way_search(self):
+        for name, graph in sorted(all_graphs.items()):
+            for start in graph.nodes:
+                for goal in graph.nodes:
+                    self.assertEqual(bidirectional_bfs(graph, start, goal),
+                                     bfs(graph, start, goal),
+                                     (name, start, goal))
+                    if name not in weighted_graphs:
+                        continue
+                    self.assertEqual(
+                        bidirectional_dijkstra(graph, start, goal),
+                        branch_and_bound_with_extended_set(graph, start,
+                                                           goal),
+                        (name, start, goal))
+
+if __name__ == '__main__':
+    unittest.main()